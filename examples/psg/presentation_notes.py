@@ -265,6 +265,7 @@ def main(argv, doc):
         for line in lines:
             if line.startswith("%%EndPageComments"):
                 break
+        lines.sync()
 
         if input_page.subfile.tell() == input_page.subfile.length:
             # This means there is no %%EndPageComments line.
@@ -272,6 +273,7 @@ def main(argv, doc):
             input_page.subfile.seek(0)
             lines = line_iterator(input_page.subfile)
             lines.next() # Skip %%Page line.
+            lines.sync()
 
         if verbose: print >> sys.stderr, "Copying page", counter + 1
         copy_linewise(input_page.subfile, thumb_box, ignore_comments=True)
@@ -76,13 +76,132 @@ from t4 import stupid_dict
 import t4.orm.datasource
 
 from t4.orm.datatypes import common_serial
-import datatypes
+import datatypes, fulltext
 
 _typeoid = {}
 
+_explain_rows_re = re.compile(r"rows=(\d+)")
+
+class pipeline_cursor:
+    """
+    Stand-in for a datasource's modify cursor while a L{pipeline} is
+    active. Statements passed to execute() are rendered to SQL and
+    queued. The queue is sent to the backend as a single multi-statement
+    query once it reaches batch_size, when results are needed (any
+    attribute access other than execute() like fetchone() or rowcount),
+    and when the pipeline ends.
+    """
+    def __init__(self, ds, cursor, batch_size):
+        self._ds = ds
+        self._cursor = cursor
+        self._queue = []
+        self.batch_size = batch_size
+
+    def execute(self, command, params=None):
+        if isinstance(command, sql.statement):
+            runner = sql.sql(self._ds)
+            command = runner(command)
+            params = runner.params
+
+        if type(command) == UnicodeType:
+            command = command.encode(self._ds.backend_encoding())
+
+        if params is not None:
+            # This is what the DBAPI module would do on execute().
+            command = self._cursor.mogrify(command, tuple(params))
+
+        self._queue.append(command)
+        
+        if len(self._queue) >= self.batch_size:
+            self.sync()
+
+    def sync(self):
+        """
+        Send the queued statements to the backend.
+        """
+        if len(self._queue) > 0:
+            batch = join(self._queue, ";\n")
+            self._queue = []
+            
+            try:
+                self._cursor.execute(batch)
+            except dbapi.Error, err:
+                self._ds._raise_backend_error(err)
+
+    def discard(self):
+        self._queue = []
+
+    def __getattr__(self, name):
+        # Whatever is requested here depends on the queued statements
+        # having been executed. Except for the closed flag, which
+        # __modify_cursor__() checks all the time.
+        if name != "closed": self.sync()
+        return getattr(self._cursor, name)
+
+class pipeline:
+    """
+    Context manager that queues the statements executed on a pgsql
+    datasource's modify cursor (all INSERTs, UPDATEs and DELETEs,
+    including those issued by flush_updates() and by the containers)
+    and sends them in batches, each in a single round trip::
+
+       with ds.pipeline():
+           for dbobj in dbobjs:
+               ds.insert(dbobj, dont_select=True)
+       
+    Statements whose results are needed (a SELECT after an INSERT, for
+    instance) force the queue to be sent, as does any statement run on
+    another cursor (i.e. any regular SELECT), so results are always
+    consistent with the statements executed before.
+
+    psycopg2 does not implement libpq's pipeline mode, so the statements
+    are sent as one multi-statement query. If one of them fails, the
+    error is raised when the batch is sent, which may be after the
+    statement had been queued (for instance outside a savepoint block
+    that queued it), and the statements following it are not executed.
+    flush_updates() sends the queue before it considers the pending
+    changes written, but dbobjs passed to insert() directly count as
+    inserted as soon as their INSERT has been queued. Pipelines may be
+    nested. Only the outermost one has an effect.
+    """
+    def __init__(self, ds, batch_size=100):
+        self.ds = ds
+        self.batch_size = batch_size
+        self.cursor = None
+
+    def __enter__(self):
+        if not isinstance(self.ds._modify_cursor, pipeline_cursor):
+            self.cursor = pipeline_cursor(self.ds, self.ds.__modify_cursor__(),
+                                          self.batch_size)
+            self.ds._modify_cursor = self.cursor
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.cursor is not None:
+            self.ds._modify_cursor = self.cursor._cursor
+
+            try:
+                self.cursor.sync()
+            except:
+                if type is not None:
+                    # The sync()'s exception replaces the one raised in
+                    # the with block, which may well be a consequence of
+                    # the failed statement.
+                    print >> debug, "Pipeline block raised:", repr(value)
+                raise
+                    
+        return False
+
+    
 class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
     _dbfailures = 0
     _ERRORS_BEFORE_RECONNECT = 50
+
+    # See load_catalog()
+    catalog = None
+
+    # See register_raw_json()
+    raw_json = False
     
     # Map PostgreSQL to Python encoding names. (From the PostgreSQL
     # documentation)
@@ -236,12 +355,18 @@ class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
             type_name = datatype_class.__name__
             
         if not _typeoid.has_key(type_name):
-            # Run a query on the database that will return
-            # the SQL type's oid. We only need the cursor's
-            # description, really
-            query = "SELECT %s FROM %s WHERE 0=1" % (column, relation)
-            cursor = self.execute(query)
-            type_oid = cursor.description[0][1]
+            if self.catalog is not None:
+                type_oid = self.catalog.type_oid(relation, column)
+            else:
+                type_oid = None
+
+            if type_oid is None:
+                # Run a query on the database that will return
+                # the SQL type's oid. We only need the cursor's
+                # description, really
+                query = "SELECT %s FROM %s WHERE 0=1" % (column, relation)
+                cursor = self.execute(query)
+                type_oid = cursor.description[0][1]
 
             # register the string class with psycopg so it always 
             # returns a SQL literal as a Python string
@@ -252,6 +377,42 @@ class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
             # store the Oid in our dict 
             _typeoid[type_name] = type_oid            
     
+    def load_catalog(self, cache_path=None, schemas=("public",), check=True):
+        """
+        Read the system catalog for schemas into self.catalog, using a
+        cache file if cache_path is given. See
+        L{t4.orm.adapters.pgsql.reflection} for details.
+        """
+        import reflection
+        
+        if cache_path is None:
+            self.catalog = reflection.read_catalog(self, schemas)
+        else:
+            self.catalog = reflection.load_catalog(self, cache_path,
+                                                   schemas, check)
+        return self.catalog
+    
+    def register_raw_json(self):
+        """
+        Make psycopg2 return json and jsonb values as text on this
+        datasource's connection, so the json datatypes can decode them
+        on first access rather than for every row retrieved. Note that
+        this affects all queries run on the connection. The setting
+        is restored whenever the datasource re-connects.
+        """
+        self.raw_json = True
+        self._register_raw_json()
+
+    def _register_raw_json(self):
+        from psycopg2.extras import register_default_json, \
+             register_default_jsonb
+
+        def raw(data):
+            return data
+        
+        register_default_json(self._conn, loads=raw)
+        register_default_jsonb(self._conn, loads=raw)
+        
     def dsn(self):
         """
         Return the DSN this datasource has been initialized with.
@@ -265,6 +426,44 @@ class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
             
         return self._modify_cursor
 
+    def pipeline(self, batch_size=100):
+        """
+        Return a L{pipeline} context manager for this datasource.
+        """
+        return pipeline(self, batch_size)
+
+    def sync_pipeline(self):
+        """
+        Send the statements queued by an active pipeline to the backend.
+        """
+        if isinstance(self._modify_cursor, pipeline_cursor):
+            self._modify_cursor.sync()
+
+    def cursor(self):
+        # Statements on other cursors must see the effects of those
+        # queued before.
+        self.sync_pipeline()
+        return t4.orm.datasource.datasource_base.cursor(self)
+
+    def flush_updates(self, select_after_update=True):
+        """
+        Write all pending changes to the database, using a pipeline.
+        """
+        with self.pipeline():
+            t4.orm.datasource.datasource_base.flush_updates(
+                self, select_after_update)
+    __flush_updates__ = flush_updates
+
+    def commit(self, *dbobjs, **kw):
+        self.flush_updates()
+        self.sync_pipeline()
+        t4.orm.datasource.datasource_base.commit(self, *dbobjs, **kw)
+
+    def __transaction_ended__(self):
+        if isinstance(self._modify_cursor, pipeline_cursor):
+            self._modify_cursor.discard()
+        t4.orm.datasource.datasource_base.__transaction_ended__(self)
+
     def execute(self, query, cursor=None):
         """
         Run a query on the database connection.
@@ -279,16 +478,7 @@ class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
                                                                query, cursor)
             
         except dbapi.ProgrammingError, err:
-            # In any case rollback the current transaction.
-            # For one thing to get rid of that stupid "current transaction is
-            # aborted, commands ignored until end of transaction block"
-            self.rollback()
-            
-            error_message = str(err)
-            if "duplicate key" in error_message:
-                raise DuplicateKey(error_message, err)
-            else:
-                raise BackendError(error_message, err)
+            self._raise_backend_error(err)
             
         except dbapi.Error, err:
             self._dbfailures += 1
@@ -307,10 +497,26 @@ class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
             
         return cursor 
     
+    def _raise_backend_error(self, err):
+        # Rollback the current transaction, unless there is a
+        # savepoint that will take care of it. For one thing to get
+        # rid of that stupid "current transaction is aborted, commands
+        # ignored until end of transaction block"
+        if not self.in_savepoint(): self.rollback()
+
+        error_message = str(err)
+        if "duplicate key" in error_message:
+            raise DuplicateKey(error_message, err)
+        else:
+            raise BackendError(error_message, err)
+        
     def connect(self):
         if self._dsn is not None:
             self._conn = dbapi.connect(self._dsn)
 
+            # Typecasters are registered per connection.
+            if self.raw_json: self._register_raw_json()
+
 
     def backend_version(self):
         # determine the backend's version
@@ -354,6 +560,77 @@ class datasource(t4.orm.datasource.datasource_base, sql.pgsql_backend):
 
         return self._encoding
 
+    def estimate_count(self, relations, clauses):
+        """
+        For a single table without clauses the estimate is based on
+        the statistics in pg_class, scaled to the table's current size
+        the way the planner does it. Otherwise it is the planner's row
+        estimate from EXPLAIN.
+        """
+        runner = sql.sql(self)
+        
+        if len(clauses) == 0 and isinstance(relations, sql.relation) and \
+               not isinstance(relations, sql.subquery_as_relation):
+            query = sql.select(sql.expression(
+                    "reltuples, relpages, relkind, "
+                    "pg_relation_size(oid) / "
+                    "current_setting('block_size')::integer"),
+                               sql.relation("pg_class"),
+                               sql.where("oid = ",
+                                         sql.string_literal(runner(relations)),
+                                         "::regclass"))
+            reltuples, relpages, relkind, pages = self.query_one(query)
+
+            # Views have no statistics of their own, tables that have
+            # never been ANALYZEd have reltuples = -1 (before
+            # PostgreSQL 14, 0).
+            if relkind in ( "r", "m", ) and reltuples >= 0 and \
+                   ( relpages > 0 or pages == 0 ):
+                if relpages > 0:
+                    return int(reltuples / relpages * pages)
+                else:
+                    return 0
+
+        query = "EXPLAIN " + runner(sql.select(sql.expression("1"),
+                                               relations, *clauses))
+        cursor = self.execute(query, runner.params)
+        plan, = cursor.fetchone()
+        
+        match = _explain_rows_re.search(plan)
+        if match is None:
+            return None
+        else:
+            return int(match.group(1))
+    
+    def fulltext_expressions(self, dbclass, query, vector=None,
+                             configuration=None, parser="plain",
+                             normalization=0, cover_density=False):
+        """
+        Full-text search for datasource_base.search() using
+        L{t4.orm.adapters.pgsql.fulltext}. The vector defaults to the
+        dbclass' tsvector attribute. String queries are converted
+        using L{fulltext.tsquery} with configuration and parser. The
+        rank is ts_rank() (ts_rank_cd() with cover_density set) using
+        normalization.
+        """
+        if vector is None:
+            for dbprop in dbclass.__dbproperties__():
+                if isinstance(dbprop, datatypes.tsvector):
+                    vector = dbprop.column
+                    break
+            else:
+                raise ValueError("%s has no tsvector attribute, please "
+                                 "specify the vector to search." % \
+                                     dbclass.__name__)
+        elif type(vector) == StringType:
+            vector = dbclass.__dbproperty__(vector).column
+
+        if type(query) in ( StringType, UnicodeType, ):
+            query = fulltext.tsquery(query, configuration, parser)
+
+        return ( fulltext.matches(vector, query),
+                 fulltext.rank(vector, query, normalization, cover_density), )
+    
     def select_after_insert_where(self, dbobj):
         if dbobj.__primary_key__ is None: raise PrimaryKeyNotKnown()
         
@@ -435,6 +712,7 @@ class zpsycopg_db_conn(datasource):
                 self._conn = zope_conn.db
                 
             self._conn.rollback()
+            if self.raw_json: self._register_raw_json()
             
         return self._conn
         
@@ -444,16 +722,7 @@ class zpsycopg_db_conn(datasource):
                 self, query, cursor)
 
         except psycopg.ProgrammingError, err:
-            # In any case rollback the current transaction.
-            # For one thing to get rid of that stupid "current transaction is
-            # aborted, commands ignored until end of transaction block"
-            self.rollback()
-            
-            error_message = str(err)
-            if "duplicate key" in error_message:
-                raise DuplicateKey(error_message, err)
-            else:
-                raise BackendError(error_message, err)
+            self._raise_backend_error(err)
             
         except psycopg.Error, err:
             self._dbfailures += 1
@@ -477,6 +746,7 @@ class zpsycopg_db_conn(datasource):
         Undo the changes you made to the database since the last commit()
         """
         self._updates = stupid_dict()
+        self.__transaction_ended__()
         db = getattr(self._conn, "db", None)
         if db is not None:
             db.rollback()
@@ -493,6 +763,7 @@ try:
                 self._pool = pool
                 self._conn = pool.getconn()
                 self._encoding = backend_encoding
+                if self.raw_json: self._register_raw_json()
 
             def __enter__(self):
                 return self
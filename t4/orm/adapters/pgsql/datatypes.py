@@ -37,6 +37,7 @@ from uuid import UUID
 
 # orm
 from t4 import sql
+from t4 import uuid as t4_uuid
 from t4.orm.datatypes import *
 from t4.orm.exceptions import ORMException, ObjectAlreadyInserted
 from t4.validators import ip_address_validator
@@ -131,8 +132,7 @@ class money(datatype):
         return value
 
     def __set_from_result__(self, ds, dbobj, value):
-        setattr(dbobj, self.data_attribute_name(),
-                self.__convert__(value))    
+        self.set_data(dbobj, self.__convert__(value))    
 
     def select_expression(self, dbclass, full_column_names):
         identifyer = "%s-money-expression" % self.column.name()
@@ -193,11 +193,20 @@ class point(datatype):
         else:
             return _pair_of_floats(value)
 
+def _to_UUID(value):
+    """
+    Convert value, a string or a t4.uuid.UUID, to Python's uuid.UUID.
+    """
+    if isinstance(value, UUID):
+        return value
+    elif isinstance(value, t4_uuid.UUID):
+        return UUID(int=value.int)
+    else:
+        return UUID(value)
+
 class uuid_literal(sql.literal):
     def __init__(self, u):
-        if not isinstance(u, UUID):
-            u = UUID(u)
-        self._content = u
+        self._content = _to_UUID(u)
 
     def __sql__(self, runner):
         return "'" + str(self._content) + "'"
@@ -207,17 +216,61 @@ class uuid(datatype):
     """
     An interface to PostgreSQL's UUID type based on Python's
     uuid.UUID.
+
+    If the generate parameter is set, new dbobjs get their UUIDs on the
+    client side, right before they are INSERTed. This is meant for
+    primary keys: the datasource does not have to SELECT the key after
+    the INSERT and the unit of work can combine new dbobjs into
+    multi-row INSERTs. The keys for all the dbobjs of a flush() are
+    generated in one go.
     """
     sql_literal_class = uuid_literal
 
+    generators = { "uuid4": t4_uuid.uuid4_batch,
+                   "uuid7": t4_uuid.uuid7_batch, }
+
+    def __init__(self, column=None, title=None, validators=(),
+                 has_default=False, generate=None):
+        """
+        @param generate: None (the default) to leave the key to the
+           backend or application, 'uuid4' for random UUIDs, 'uuid7' for
+           time-ordered UUIDs (which are easier on the primary key
+           index) or a callable that takes a number n and returns a list
+           of n UUIDs.
+        """
+        datatype.__init__(self, column, title, validators, has_default)
+
+        if generate is None or callable(generate):
+            self.generate = generate
+        elif self.generators.has_key(generate):
+            self.generate = self.generators[generate]
+        else:
+            raise ValueError("Unknown UUID generator: %s" % repr(generate))
+
     def __convert__(self, value):
         if value is None:
             return None
         else:
-            if not isinstance(value, UUID):
-                return UUID(value)
-            else:
-                return value
+            return _to_UUID(value)
+
+    def __preallocate__(self, dbobjs):
+        if self.generate is None:
+            return
+
+        dbobjs = [ dbobj for dbobj in dbobjs if not self.isset(dbobj) ]
+        if len(dbobjs) > 0:
+            for dbobj, value in zip(dbobjs, self.generate(len(dbobjs))):
+                self.set_data(dbobj, _to_UUID(value))
+
+    def preallocate(self, dbobjs):
+        """
+        Assign UUIDs to all of dbobjs that don't have one, yet, before
+        they are inserted, for instance to refer to them from other
+        dbobjs.
+        """
+        if self.generate is None:
+            raise ValueError("%s has no UUID generator." % repr(self))
+        self.__preallocate__(dbobjs)
 
 class tsvector_data:
     def __hash__(self):
@@ -270,10 +323,10 @@ class tsvector(datatype):
                                  "tsvector_data instance.")
         
             self.check_dbobj(dbobj)
-            setattr(dbobj, self.data_attribute_name(), value)
+            self.set_data(dbobj, value)
                          
     def sql_literal(self, dbobj):
-        data = getattr(dbobj, self.data_attribute_name(), None)
+        data = self.get_data(dbobj, None)
         return to_tsvector_expression(data.configuration_name,
                                       data.texts)
 
@@ -283,11 +336,31 @@ class tsvector(datatype):
     def __select_after_insert__(self, dbobj):
         return False
 
-class json(datatype):
+# The functions used to decode and encode JSON, see set_json_codec().
+json_loads = py_json.loads
+json_dumps = py_json.dumps
+
+def set_json_codec(loads, dumps):
+    """
+    Use the loads and dumps functions of a (faster) JSON module instead
+    of the standard library's for the json and jsonb datatypes::
+
+       import ujson
+       set_json_codec(ujson.loads, ujson.dumps)
+    """
+    global json_loads, json_dumps
+    json_loads = loads
+    json_dumps = dumps
+
+class json(lazy_decoding, datatype):
     """
     Represent a regular JSON column (rather than JSONB column, see
-    below); psocopg2 converts the retrieved JSON object to Python for
-    us.
+    below).
+
+    If the datasource's raw_json attribute is set, the JSON is retrieved
+    as text and only decoded on first access (see
+    L{t4.orm.datatypes.lazy_decoding}). Otherwise psycopg2 converts the
+    retrieved JSON object to Python for us.
     """
     sql_literal_class = sql.json_literal
     
@@ -308,13 +381,19 @@ class json(datatype):
                                        ) % repr(psycopg2))
         
     def __set_from_result__(self, ds, dbobj, value):
-        """
-        This method evaulates the value into a Python datastructure.
-        """
-        if value is None and self.empty_object_on_null: value = "{}"
-        if type(value) == types.StringType:
-            raise ValueError("STRING " + self.attribute_name)
-        setattr(dbobj, self.data_attribute_name(), value)
+        if getattr(ds, "raw_json", False):
+            if value is None and self.empty_object_on_null: value = "{}"
+            lazy_decoding.__set_from_result__(self, ds, dbobj, value)
+        else:
+            if value is None and self.empty_object_on_null: value = {}
+            self.remove_expression(dbobj)
+            self.set_data(dbobj, value)
+
+    def decode(self, data):
+        return json_loads(data)
+
+    def encode(self, value):
+        return json_dumps(value)
 
     def __convert__(self, value):
         """
@@ -328,36 +407,13 @@ class json(datatype):
         datatype.__set__ to detect a modification may not work on the
         complex datastructure the JSON contains.
         """
-        datatype.__set__(self, dbobj, value)
+        lazy_decoding.__set__(self, dbobj, value)
         dbobj.__register_change__(self)
     
 class jsonb(json):
     """
-    This datatype will use json.dumps and json.loads to convert input
-    values to JSON on their way to and from the database. For the
-    regular JSON type, psycopg2 does this for us.
+    Represent a JSONB column. Like json above.
     """
     sql_literal_class = sql.json_literal
-    
-    def __set_from_result__(self, ds, dbobj, value):
-        """
-        This method evaulates the value into a Python datastructure.
-        """
-        if value is None and self.empty_object_on_null: value = "{}"
-
-        #if value is not None:
-        #    print "value =", repr(value)
-        #    value = py_json.loads(value)
-
-        if type(value) == types.StringType:
-            raise ValueError("STRING " + self.attribute_name)
-        
-        setattr(dbobj, self.data_attribute_name(), value)
-
-    def __convert__(self, value):
-        """
-        Since we store the Python object 'as is', convert does nothing.
-        """
-        return value
 
     
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+__docformat__ = "epytext en"
+
+"""
+Query-side support for PostgreSQL's full-text search, complementing
+the L{t4.orm.adapters.pgsql.datatypes.tsvector} datatype::
+
+   class article(dbobject):
+       id = serial()
+       title = Unicode()
+       body = Unicode()
+       search_vector = tsvector()
+
+   query = tsquery(u"postgres index", "english")
+   query = query & ~tsquery(u"mysql", "english")
+
+   for a in ds.search(article, query, limit=20):
+       ...
+
+   ds.execute(gin_index(article.__relation__, "search_vector"))
+
+For relations without a tsvector column, an expression index on
+to_tsvector() may be searched instead. The configuration must be
+the same in the index and the query for the index to be used::
+
+   vector = to_tsvector("english", "title", "body")
+   ds.execute(gin_index(article.__relation__, vector,
+                        "article_fulltext_idx"))
+   ds.search(article, u"postgres", vector=vector)
+"""
+
+# Python
+from types import *
+
+# t4
+from t4 import sql
+
+parsers = { "plain": "plainto_tsquery",
+            "phrase": "phraseto_tsquery",
+            "websearch": "websearch_to_tsquery",
+            "raw": "to_tsquery", }
+
+def _configuration_args(configuration):
+    if configuration is None:
+        return ()
+    else:
+        return ( sql.string_literal(configuration), ", ", )
+
+class tsquery(sql.expression):
+    """
+    A tsquery constructed from user input. Queries may be combined
+    using &, | and ~, which correspond to PostgreSQL's &&, || and !!
+    operators.
+    """
+    def __init__(self, text, configuration=None, parser="plain"):
+        """
+        @param text: The query text, a string or unicode object.
+        @param configuration: The name of the text search configuration
+           to use, defaults to the backend's default_text_search_config.
+        @param parser: One of 'plain' (plainto_tsquery(), all words
+           must match), 'phrase' (phraseto_tsquery(), the words must
+           appear in order), 'websearch' (websearch_to_tsquery(),
+           understands quotes, 'or' and '-', requires PostgreSQL 11) or
+           'raw' (to_tsquery(), text must be in tsquery syntax).
+        """
+        sql.expression.__init__(self)
+        
+        if not parsers.has_key(parser):
+            raise ValueError("Unknown tsquery parser: %s" % repr(parser))
+        
+        if type(text) == UnicodeType:
+            text = sql.unicode_literal(text)
+        else:
+            text = sql.string_literal(text)
+
+        self._append( ( parsers[parser], "(",
+                        _configuration_args(configuration), text, ")", ) )
+
+    def __and__(self, other):
+        return tsquery_operation("&&", self, other)
+
+    def __or__(self, other):
+        return tsquery_operation("||", self, other)
+
+    def __invert__(self):
+        return tsquery_operation("!!", None, self)
+    
+class tsquery_operation(tsquery):
+    def __init__(self, operator, left, right):
+        sql.expression.__init__(self)
+        if left is not None:
+            self._append( ( "(", left, ")", ) )
+        self._append( ( operator, "(", right, ")", ) )
+
+class to_tsvector(sql.expression):
+    """
+    A to_tsvector() call on one or more text columns, for relations
+    that don't have a tsvector column. NULL columns are treated as
+    empty strings.
+    """
+    def __init__(self, configuration, *columns):
+        sql.expression.__init__(self)
+
+        parts = []
+        for column in columns:
+            parts.append( ( "coalesce(", column, ", '')", ) )
+            parts.append(" || ' ' || ")
+        parts.pop()
+
+        self._append( ( "to_tsvector(", _configuration_args(configuration),
+                        parts, ")", ) )
+
+class matches(sql.expression):
+    """
+    The vector @@ query condition, to be used in a WHERE clause.
+    """
+    def __init__(self, vector, query):
+        # @@ has the same precedence as the && and || operators
+        # of a combined query.
+        sql.expression.__init__(self, vector, " @@ (", query, ")")
+
+class rank(sql.expression):
+    """
+    The ts_rank() (or ts_rank_cd() for cover_density=True) of a
+    vector with respect to a query.
+    """
+    def __init__(self, vector, query, normalization=0, cover_density=False):
+        sql.expression.__init__(self)
+
+        if cover_density:
+            function = "ts_rank_cd("
+        else:
+            function = "ts_rank("
+            
+        self._append( ( function, vector, ", ", query, ", ",
+                        sql.integer_literal(normalization), ")", ) )
+
+class headline(sql.expression):
+    """
+    A ts_headline() call, the excerpt of a document with the words
+    matching query highlighted. Options is a string like
+    'MaxWords=35, MinWords=15, StartSel=<b>, StopSel=</b>'.
+
+    Note that ts_headline() works on the document itself, not on a
+    tsvector, and it is expensive. Use it only on the rows actually
+    displayed.
+    """
+    def __init__(self, document, query, configuration=None, options=None):
+        sql.expression.__init__(self)
+
+        self._append( ( "ts_headline(", _configuration_args(configuration),
+                        document, ", ", query, ) )
+        if options is not None:
+            self._append( ( ", ", sql.string_literal(options), ) )
+        self._append(")")
+
+class gin_index(sql.statement):
+    """
+    A CREATE INDEX statement for a GIN index on a tsvector column or
+    expression (like L{to_tsvector}).
+    """
+    def __init__(self, relation, vector, name=None, concurrently=False):
+        """
+        @param relation: sql.relation the index is created on
+        @param vector: Column name, sql.column or sql.expression
+        @param name: Name of the index, defaults to
+           <relation>_<column>_gin for columns. Must be provided for
+           expressions.
+        @param concurrently: Don't lock the relation while building
+           the index. This can't be done inside a transaction, the
+           datasource's connection must be in autocommit mode.
+        """
+        if type(vector) == StringType:
+            vector = sql.column(vector)
+
+        if name is None:
+            if not isinstance(vector, sql.column):
+                raise ValueError("An index on an expression needs a name.")
+            name = "%s_%s_gin" % ( relation.name(underscore=True),
+                                   vector.name(), )
+
+        self._relation = relation
+        self._vector = vector
+        self._name = sql.identifyer(name)
+        self._concurrently = concurrently
+
+    def __sql__(self, runner):
+        if self._concurrently:
+            concurrently = "CONCURRENTLY "
+        else:
+            concurrently = ""
+            
+        if isinstance(self._vector, sql.column):
+            vector = runner(self._vector)
+        else:
+            vector = "(%s)" % runner(self._vector)
+
+        return "CREATE INDEX %sIF NOT EXISTS %s ON %s USING GIN (%s)" % (
+            concurrently, runner(self._name), runner(self._relation),
+            vector, )
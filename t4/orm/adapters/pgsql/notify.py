@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+__docformat__ = "epytext en"
+
+"""
+Cache invalidation through PostgreSQL's LISTEN/NOTIFY.
+
+A L{listener} keeps a connection of its own that LISTENs on a number
+of channels and dispatches the notifications it receives to callbacks.
+L{install_triggers()} creates triggers on a dbclass' __relation__ that
+NOTIFY the dbclass' channel of every INSERT, UPDATE, DELETE and
+TRUNCATE, so several processes can keep their local caches coherent
+without polling the database::
+
+   install_triggers(ds, person)
+   ds.commit()
+
+   cache = {}
+   def evict(dbclass, operation, key):
+       if key is None:
+           cache.clear()
+       else:
+           cache.pop(key, None)
+
+   l = listener(ds)
+   l.listen_dbclass(person, evict)
+   l.start()
+
+The listener waits for notifications in select(), which doesn’t cost
+any queries. Notifications are only delivered once the notifying
+transaction commits; PostgreSQL folds identical notifications within a
+transaction into one.
+
+Callbacks registered with L{listener.listen_dbclass()} are called as
+callback(dbclass, operation, key): operation is one of 'INSERT',
+'UPDATE', 'DELETE', 'TRUNCATE' and key the primary key value of the
+affected row (a tuple for multi column keys). For TRUNCATE key is None.
+If the listener had to re-connect, notifications may have been lost,
+so all callbacks are called with operation 'RESET' and key None.
+"""
+
+# Python
+import select, threading, json
+
+# t4
+from t4 import sql
+from t4.debug import log, debug
+from t4.orm import keys
+from t4.orm.exceptions import NoPrimaryKey
+from datasource import dbapi, psycopg2_version
+
+# The name of the PL/pgSQL function used by the triggers created by
+# install_triggers().
+trigger_function_name = "t4_notify_row_change"
+
+trigger_function = """\
+CREATE OR REPLACE FUNCTION %s() RETURNS trigger AS $$
+DECLARE
+    data json;
+    key json;
+BEGIN
+    -- TG_ARGV[0] is the channel, the other arguments are the
+    -- primary key's column names.
+    IF TG_LEVEL = 'STATEMENT' THEN
+        PERFORM pg_notify(TG_ARGV[0], TG_OP);
+        RETURN NULL;
+    END IF;
+    
+    IF TG_OP = 'INSERT' THEN
+        data := row_to_json(NEW);
+    ELSE
+        data := row_to_json(OLD);
+    END IF;
+
+    SELECT json_agg(data -> k.name ORDER BY k.i) INTO key
+      FROM unnest(TG_ARGV[1:TG_NARGS-1]) WITH ORDINALITY AS k(name, i);
+
+    PERFORM pg_notify(TG_ARGV[0], TG_OP || ' ' || coalesce(key::text, 'null'));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql""" % trigger_function_name
+
+def channel_name(dbclass):
+    """
+    Return the name of the NOTIFY channel used for dbclass, derived
+    from its __relation__.
+    """
+    return "t4_" + dbclass.__relation__.name(underscore=True)
+
+def _quote_identifyer(name):
+    return '"%s"' % name.replace('"', '""')
+
+def _quote_literal(s):
+    return "'%s'" % s.replace("'", "''")
+
+def _trigger_names(dbclass):
+    name = channel_name(dbclass)
+    return _quote_identifyer(name + "_row"), \
+           _quote_identifyer(name + "_truncate")
+
+def install_triggers(ds, dbclass):
+    """
+    Create the triggers that NOTIFY dbclass' channel of row changes in
+    its __relation__ (replacing them, if they exist). The change
+    becomes effective when you commit ds' transaction.
+    """
+    if dbclass.__primary_key__ is None:
+        raise NoPrimaryKey("Can't create change notification triggers for "
+                           "%s, it has no primary key." % dbclass.__name__)
+    
+    relation = sql.sql(ds)(dbclass.__relation__)
+    columns = [ str(column)
+                for column in keys.primary_key(dbclass).columns() ]
+    arguments = ", ".join(map(_quote_literal,
+                              [ channel_name(dbclass), ] + columns))
+    row_trigger, truncate_trigger = _trigger_names(dbclass)
+
+    ds.execute(trigger_function)
+    remove_triggers(ds, dbclass)
+    ds.execute("CREATE TRIGGER %s AFTER INSERT OR UPDATE OR DELETE ON %s "
+               "FOR EACH ROW EXECUTE PROCEDURE %s(%s)" % (
+                   row_trigger, relation, trigger_function_name, arguments, ))
+    ds.execute("CREATE TRIGGER %s AFTER TRUNCATE ON %s "
+               "FOR EACH STATEMENT EXECUTE PROCEDURE %s(%s)" % (
+                   truncate_trigger, relation, trigger_function_name,
+                   arguments, ))
+
+def remove_triggers(ds, dbclass):
+    """
+    Drop the triggers created by L{install_triggers()}.
+    """
+    relation = sql.sql(ds)(dbclass.__relation__)
+    for trigger in _trigger_names(dbclass):
+        ds.execute("DROP TRIGGER IF EXISTS %s ON %s" % ( trigger, relation, ))
+
+def parse_payload(payload):
+    """
+    Parse the payload sent by the triggers created by
+    L{install_triggers()} into a pair as ( operation, key, ).
+    """
+    parts = payload.split(" ", 1)
+    operation = parts[0]
+    
+    if len(parts) == 1:
+        return operation, None
+    
+    key = json.loads(parts[1])
+    if key is None:
+        return operation, None
+    elif len(key) == 1:
+        return operation, key[0]
+    else:
+        return operation, tuple(key)
+
+
+class listener:
+    """
+    Wait for notifications on a dedicated connection and dispatch them
+    to callbacks. Use L{poll()} from your own event loop (the listener
+    may be used with select() through L{fileno()}) or L{start()} a
+    background thread that does it for you. In the latter case the
+    callbacks are called in that thread!
+
+    @cvar retry_delay: Seconds the background thread waits before it
+       tries again to re-connect after a failed attempt. The delay is
+       doubled with each further failure up to max_retry_delay.
+    @ivar last_error: The last connection error the background thread
+       ran into or None, if it has been connected since.
+    """
+    retry_delay = 1.0
+    max_retry_delay = 60.0
+    
+    def __init__(self, ds, timeout=5.0, on_error=None):
+        """
+        @param ds: A pgsql datasource whose DSN is used to open the
+           listener's connection.
+        @param timeout: Seconds the background thread waits in select()
+           before it checks whether it has been stopped.
+        @param on_error: Function called by the background thread as
+           on_error(listener, exception) whenever it fails to re-connect.
+        """
+        if psycopg2_version is None:
+            raise ImportError("The listener requires psycopg2.")
+
+        if ds.dsn() is None:
+            raise ValueError("The listener needs a datasource with a DSN "
+                             "to open its own connection.")
+        
+        self._dsn = ds.dsn()
+        self.timeout = timeout
+        
+        # Map channel names to lists of callback functions
+        self._callbacks = {}
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+        self._stopped = threading.Event()
+        self.on_error = on_error
+        self.last_error = None
+        
+        self.connect()
+
+    def connect(self):
+        self._conn = dbapi.connect(self._dsn)
+        
+        # LISTEN takes effect on commit and notifications are only
+        # delivered between transactions, so the listener’s connection
+        # runs in autocommit mode.
+        self._conn.set_isolation_level(0)
+
+        try:
+            for channel in self._callbacks.keys():
+                self._execute("LISTEN " + _quote_identifyer(channel))
+        except dbapi.Error:
+            # Don't leave an open connection behind that doesn't LISTEN
+            # on all channels, the next poll() would not notice.
+            self._conn.close()
+            raise
+
+    def _execute(self, command):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(command)
+        finally:
+            cursor.close()
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def listen(self, channel, callback):
+        """
+        Call callback(channel, payload) for every notification on
+        channel. After a re-connect payload is None, see L{reconnect()}.
+        """
+        self._lock.acquire()
+        try:
+            if not self._callbacks.has_key(channel):
+                self._callbacks[channel] = []
+                self._execute("LISTEN " + _quote_identifyer(channel))
+
+            self._callbacks[channel].append(callback)
+        finally:
+            self._lock.release()
+
+    def unlisten(self, channel, callback=None):
+        """
+        Remove callback from channel, or all callbacks if it is None,
+        and stop LISTENing if no callback is left.
+        """
+        self._lock.acquire()
+        try:
+            callbacks = self._callbacks.get(channel, [])
+            if callback is None:
+                del callbacks[:]
+            elif callback in callbacks:
+                callbacks.remove(callback)
+
+            if len(callbacks) == 0 and self._callbacks.has_key(channel):
+                del self._callbacks[channel]
+                self._execute("UNLISTEN " + _quote_identifyer(channel))
+        finally:
+            self._lock.release()
+
+    def listen_dbclass(self, dbclass, callback):
+        """
+        Call callback(dbclass, operation, key) for every row change
+        notification sent by the triggers created by
+        L{install_triggers()} for dbclass. See the module's docstring.
+        """
+        def dispatch(channel, payload):
+            if payload is None:
+                callback(dbclass, "RESET", None)
+            else:
+                operation, key = parse_payload(payload)
+                callback(dbclass, operation, key)
+
+        # So unlisten_dbclass() can find it.
+        dispatch.callback = callback
+        
+        self.listen(channel_name(dbclass), dispatch)
+
+    def unlisten_dbclass(self, dbclass, callback=None):
+        channel = channel_name(dbclass)
+        for dispatch in self._callbacks.get(channel, [])[:]:
+            if callback is None or dispatch.callback is callback:
+                self.unlisten(channel, dispatch)
+
+    def poll(self, timeout=0):
+        """
+        Wait up to timeout seconds for notifications and dispatch those
+        that have arrived. Return the number of notifications
+        dispatched. If the connection was lost, it is re-opened (see
+        L{reconnect()}); if that fails, the dbapi's exception is raised
+        and the next call will try again.
+        """
+        try:
+            if timeout is not None and timeout > 0:
+                readable, w, x = select.select([ self, ], [], [], timeout)
+                if not readable:
+                    return 0
+
+            self._conn.poll()
+        except ( dbapi.OperationalError, dbapi.InterfaceError, ), err:
+            print >> debug, "Listener connection lost:", err
+            self.reconnect()
+            return 0
+        
+        notifications = self._conn.notifies[:]
+        del self._conn.notifies[:]
+        
+        for notification in notifications:
+            # psycopg2 < 2.3 delivered ( pid, channel, ) tuples.
+            if type(notification) == type(()):
+                channel, payload = notification[1], ""
+            else:
+                channel, payload = notification.channel, notification.payload
+                
+            self.dispatch(channel, payload)
+
+        return len(notifications)
+
+    def dispatch(self, channel, payload):
+        self._lock.acquire()
+        try:
+            callbacks = self._callbacks.get(channel, [])[:]
+        finally:
+            self._lock.release()
+            
+        for callback in callbacks:
+            try:
+                callback(channel, payload)
+            except Exception, e:
+                # One failing callback must not keep the others from
+                # learning about the change.
+                print >> debug, "Notification callback failed:", repr(e)
+
+    def reconnect(self):
+        """
+        Re-open the connection and tell all callbacks that notifications
+        may have been lost by calling them with a payload of None.
+        """
+        try:
+            self._conn.close()
+        except dbapi.Error:
+            pass
+        
+        self.connect()
+        
+        for channel in self._callbacks.keys():
+            self.dispatch(channel, None)
+
+    def start(self):
+        """
+        Start a daemon thread that dispatches notifications as they
+        arrive.
+        """
+        if self._thread is not None:
+            return
+        
+        self._running = True
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="t4 notification listener")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _run(self):
+        delay = self.retry_delay
+        while self._running:
+            try:
+                self.poll(self.timeout)
+            except ( dbapi.Error, select.error, ), err:
+                # poll() failed to re-connect. Keep trying, the next
+                # poll() will find the connection closed and re-connect
+                # again, but back off while the server is unreachable.
+                self.last_error = err
+                print >> log, "Listener failed to re-connect (retrying " \
+                      "in %.1fs): %s" % ( delay, str(err).strip(), )
+                
+                if self.on_error is not None:
+                    try:
+                        self.on_error(self, err)
+                    except Exception, e:
+                        print >> debug, "Listener error callback failed:", \
+                              repr(e)
+
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+            else:
+                self.last_error = None
+                delay = self.retry_delay
+
+    def stop(self):
+        """
+        Stop the background thread. This may take up to self.timeout
+        seconds.
+        """
+        if self._thread is not None:
+            self._running = False
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self._conn.close()
@@ -0,0 +1,642 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+__docformat__ = "epytext en"
+
+"""
+Reflection of the PostgreSQL system catalog.
+
+The L{catalog} class holds a snapshot of the tables and views in one or
+more schemas: their columns and column types, primary and foreign
+keys. It is read with a handful of queries by L{read_catalog()} and
+may be kept in a cache file across process starts using
+L{load_catalog()}, which only re-reads the system catalog if the
+cached copy is outdated.
+
+A catalog can generate dbclasses from what it knows, either at
+runtime (L{catalog.dbclasses()}) or as Python source code
+(L{catalog.source()}) that serves as a starting point for
+hand-written models, and it can check existing dbclasses against the
+database (L{catalog.validate()})::
+
+   ds.load_catalog("/var/cache/myapp/catalog.pickle")
+   for problem in ds.catalog.validate(person):
+       print >> debug, problem
+"""
+
+# Python
+import os, re, cPickle
+from types import *
+
+# t4
+from t4 import sql
+from t4.orm.dbobject import dbobject
+from t4.orm.relationships import relationship, many2one
+import datatypes
+
+# Incremented whenever the layout of the classes below changes so
+# cache files written by older versions are discarded.
+FORMAT_VERSION = 1
+
+# Map PostgreSQL type names (pg_type.typname) to the names of
+# datatype classes in t4.orm.adapters.pgsql.datatypes. Types not listed
+# here (including arrays) are mapped to string.
+type_map = { "int2": "integer",
+             "int4": "integer",
+             "oid": "integer",
+             "int8": "Long",
+             "float4": "Float",
+             "float8": "Float",
+             "numeric": "number",
+             "text": "Unicode",
+             "varchar": "Unicode",
+             "bpchar": "Unicode",
+             "name": "Unicode",
+             "citext": "Unicode",
+             "bool": "boolean",
+             "timestamp": "datetime",
+             "timestamptz": "datetime",
+             "date": "date",
+             "time": "time",
+             "timetz": "time",
+             "bytea": "bytea",
+             "money": "money",
+             "inet": "inet",
+             "point": "point",
+             "uuid": "uuid",
+             "json": "json",
+             "jsonb": "jsonb",
+             "tsvector": "tsvector", }
+
+# Python classes that may be used for the same SQL type interchangeably.
+_python_class_family = { long: int, unicode: str, }
+
+_nextval_re = re.compile(r"nextval\('([^']+)'(?:::regclass)?\)")
+_identifyer_re = re.compile(r"[^A-Za-z0-9_]")
+
+columns_query = """\
+SELECT n.nspname, c.relname, c.relkind, a.attname, t.typname, a.atttypid,
+       pg_catalog.format_type(a.atttypid, a.atttypmod),
+       a.attnotnull, pg_catalog.pg_get_expr(d.adbin, d.adrelid)
+  FROM pg_catalog.pg_attribute a
+  JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+  JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+  JOIN pg_catalog.pg_type t ON t.oid = a.atttypid
+  LEFT JOIN pg_catalog.pg_attrdef d
+         ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+ WHERE a.attnum > 0 AND NOT a.attisdropped
+   AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+   AND n.nspname = ANY(%s)
+ ORDER BY n.nspname, c.relname, a.attnum"""
+
+constraints_query = """\
+SELECT n.nspname, c.relname, con.contype,
+       ARRAY(SELECT a.attname::text
+               FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, i)
+               JOIN pg_catalog.pg_attribute a
+                 ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+              ORDER BY k.i),
+       fn.nspname, fc.relname,
+       ARRAY(SELECT a.attname::text
+               FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, i)
+               JOIN pg_catalog.pg_attribute a
+                 ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+              ORDER BY k.i)
+  FROM pg_catalog.pg_constraint con
+  JOIN pg_catalog.pg_class c ON c.oid = con.conrelid
+  JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+  LEFT JOIN pg_catalog.pg_class fc ON fc.oid = con.confrelid
+  LEFT JOIN pg_catalog.pg_namespace fn ON fn.oid = fc.relnamespace
+ WHERE con.contype IN ('p', 'f')
+   AND n.nspname = ANY(%s)
+ ORDER BY n.nspname, c.relname, con.conname"""
+
+# Every DDL statement that affects the catalog as read above changes
+# at least one of these rows and with it its xmin.
+fingerprint_query = """\
+SELECT pg_catalog.current_setting('server_version_num') || ':' ||
+       pg_catalog.md5(pg_catalog.string_agg(x, ',' ORDER BY x))
+  FROM (SELECT 'c' || c.oid || ':' || c.xmin AS x
+          FROM pg_catalog.pg_class c
+          JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = ANY(%s)
+        UNION ALL
+        SELECT 'a' || a.attrelid || '.' || a.attnum || ':' || a.xmin
+          FROM pg_catalog.pg_attribute a
+          JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+          JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = ANY(%s) AND a.attnum > 0
+        UNION ALL
+        SELECT 'k' || con.oid || ':' || con.xmin
+          FROM pg_catalog.pg_constraint con
+          JOIN pg_catalog.pg_namespace n ON n.oid = con.connamespace
+         WHERE n.nspname = ANY(%s)) AS rows"""
+
+
+class column_info:
+    """
+    A column as found in the system catalog.
+    """
+    def __init__(self, name, type_name, type_oid, sql_type,
+                 not_null, default):
+        self.name = name
+        self.type_name = type_name
+        self.type_oid = type_oid
+        self.sql_type = sql_type
+        self.not_null = not_null
+        self.default = default
+
+    def sequence_name(self):
+        """
+        Return the name of the sequence this column's default draws
+        from or None if it doesn't.
+        """
+        if self.default is None:
+            return None
+        
+        match = _nextval_re.match(self.default)
+        if match is None:
+            return None
+        else:
+            return match.group(1)
+
+    def datatype_spec(self, primary_key=False):
+        """
+        Return a pair as ( class_name, kw, ) that describes the datatype
+        for this column.
+        """
+        kw = {}
+        
+        if primary_key and self.type_name in ( "int2", "int4", ) and \
+               self.sequence_name() is not None:
+            class_name = "serial"
+            kw["sequence_name"] = self.sequence_name()
+        else:
+            class_name = type_map.get(self.type_name, "string")
+            if self.default is not None:
+                kw["has_default"] = True
+
+        return class_name, kw
+
+    def datatype_class(self):
+        return getattr(datatypes, type_map.get(self.type_name, "string"))
+
+    def __repr__(self):
+        return "<column %s %s>" % ( self.name, self.sql_type, )
+
+class foreign_key_info:
+    def __init__(self, columns, schema, relation, other_columns):
+        self.columns = tuple(columns)
+        self.schema = schema
+        self.relation = relation
+        self.other_columns = tuple(other_columns)
+
+    def __repr__(self):
+        return "<foreign key (%s) -> %s.%s(%s)>" % (
+            ", ".join(self.columns), self.schema, self.relation,
+            ", ".join(self.other_columns), )
+        
+class table_info:
+    """
+    A table (or view) as found in the system catalog.
+
+    @ivar columns: List of L{column_info} instances in the table's order.
+    @ivar primary_key: Tuple of column names, empty if there is none.
+    @ivar foreign_keys: List of L{foreign_key_info} instances.
+    """
+    def __init__(self, schema, name, kind):
+        self.schema = schema
+        self.name = name
+        self.kind = kind
+        self.columns = []
+        self.primary_key = ()
+        self.foreign_keys = []
+
+    def is_view(self):
+        return self.kind in ( "v", "m", )
+
+    def column(self, name):
+        for column in self.columns:
+            if column.name == name:
+                return column
+        return None
+
+    def __repr__(self):
+        return "<table %s.%s>" % ( self.schema, self.name, )
+
+
+class catalog:
+    """
+    A snapshot of the system catalog. See the module's docstring.
+
+    @ivar tables: Dict mapping ( schema, name, ) pairs to L{table_info}
+       instances.
+    @ivar fingerprint: See L{fingerprint()}.
+    """
+    def __init__(self, schemas, fingerprint):
+        self.format_version = FORMAT_VERSION
+        self.schemas = tuple(schemas)
+        self.fingerprint = fingerprint
+        self.tables = {}
+
+    def table(self, relation, schema=None):
+        """
+        Return the L{table_info} for relation, which may be a string or
+        an sql.relation instance. The schema defaults to the relation's
+        or the first of the catalog's schemas. Return None if there is no
+        such table.
+        """
+        if isinstance(relation, sql.relation):
+            if relation.schema() is not None:
+                schema = str(relation.schema())
+            relation = str(relation._name)
+        elif "." in relation and schema is None:
+            schema, relation = relation.split(".", 1)
+            
+        if schema is None:
+            schema = self.schemas[0]
+            
+        return self.tables.get( (schema, relation,), None)
+
+    def type_oid(self, relation, column):
+        """
+        Return the OID of column's SQL type or None if it is unknown.
+        """
+        table = self.table(relation)
+        if table is None:
+            return None
+
+        column = table.column(str(column))
+        if column is None:
+            return None
+        else:
+            return column.type_oid
+
+    def _class_names(self, tables):
+        ret = {}
+        for table in tables:
+            name = _identifyer(table.name)
+            if name in ret.values():
+                name = _identifyer(table.schema + "_" + table.name)
+            ret[table] = name
+        return ret
+
+    def _many2ones(self, table, class_names):
+        """
+        Yield triples as ( attribute_name, foreign_key_info,
+        other_table, ) for those foreign keys of table that can be
+        represented as a many2one relationship to one of the tables in
+        class_names.
+        """
+        column_names = [ _identifyer(column.name)
+                         for column in table.columns ]
+        used = []
+        for fk in table.foreign_keys:
+            if len(fk.columns) != 1:
+                continue
+            
+            other = self.tables.get( (fk.schema, fk.relation,), None)
+            if other is None or not class_names.has_key(other) or \
+                   other.primary_key != fk.other_columns:
+                continue
+
+            column = fk.columns[0]
+            if column.endswith("_id"):
+                name = _identifyer(column[:-3])
+            else:
+                name = _identifyer(class_names[other])
+
+            if name in column_names or name in used:
+                continue
+
+            used.append(name)
+            yield name, fk, other
+
+    def _tables(self, schema, names):
+        if schema is None: schema = self.schemas[0]
+        ret = [ table for table in self.tables.values()
+                if table.schema == schema and \
+                       (names is None or table.name in names) ]
+        ret.sort(lambda a, b: cmp(a.name, b.name))
+        return ret
+
+    def _primary_key(self, table):
+        names = tuple(map(_identifyer, table.primary_key))
+        if len(names) == 0:
+            return None
+        elif len(names) == 1:
+            return names[0]
+        else:
+            return names
+
+    def _attributes(self, table, many2ones):
+        """
+        Yield ( attribute_name, column_info, ( class_name, kw, ), )
+        triples for those columns of table that are not managed by a
+        many2one relationship.
+        """
+        fk_columns = [ fk.columns[0] for name, fk, other in many2ones ]
+        single_pk = len(table.primary_key) == 1
+        
+        for column in table.columns:
+            if column.name in fk_columns:
+                continue
+            
+            spec = column.datatype_spec(
+                single_pk and column.name in table.primary_key)
+            
+            attribute_name = _identifyer(column.name)
+            if attribute_name != column.name:
+                spec[1]["column"] = column.name
+
+            yield attribute_name, column, spec
+            
+    def dbclasses(self, schema=None, names=None, base=dbobject):
+        """
+        Create dbclasses for the tables in schema (which defaults to the
+        catalog's first schema). Single column foreign keys that
+        reference the primary key of another one of the tables are
+        represented by many2one relationships.
+
+        @param names: Optional sequence of table names to restrict
+           the result to.
+        @param base: The base class of the new dbclasses.
+        @return: A dict mapping table names to dbclasses.
+        """
+        tables = self._tables(schema, names)
+        class_names = self._class_names(tables)
+        many2ones = dict([ ( table, list(self._many2ones(table,
+                                                          class_names)), )
+                           for table in tables ])
+        
+        classes = {}
+        for table in tables:
+            attrs = { "__module__": __name__,
+                      "__relation__": sql.relation(table.name, table.schema),
+                      "__primary_key__": self._primary_key(table), }
+            
+            for name, column, ( class_name, kw, ) in self._attributes(
+                table, many2ones[table]):
+                attrs[name] = getattr(datatypes, class_name)(**kw)
+
+            classes[table] = type(class_names[table], ( base, ), attrs)
+
+        # The relationships are added once all the classes exist, so
+        # they may reference each other in any order.
+        for table in tables:
+            dbclass = classes[table]
+            for name, fk, other in many2ones[table]:
+                relationship = many2one(classes[other], column=fk.columns[0])
+                setattr(dbclass, name, relationship)
+                relationship.__init_dbclass__(dbclass, name)
+
+        return dict([ ( table.name, dbclass, )
+                      for table, dbclass in classes.items() ])
+
+    def source(self, schema=None, names=None):
+        """
+        Return the source code of a Python module that defines the
+        same dbclasses as L{dbclasses()} would create.
+        """
+        tables = self._tables(schema, names)
+        class_names = self._class_names(tables)
+        
+        ret = [ "# Generated from the PostgreSQL catalog %s" % \
+                                                        self.fingerprint,
+                "",
+                "from t4.orm.dbobject import dbobject",
+                "from t4.orm.relationships import many2one",
+                "from t4.orm.adapters.pgsql.datatypes import *",
+                "", ]
+
+        relationships = []
+        for table in tables:
+            many2ones = list(self._many2ones(table, class_names))
+            
+            ret.append("class %s(dbobject):" % class_names[table])
+            ret.append("    __relation__ = %s" % repr(table.name))
+            if table.schema != "public":
+                ret.append("    __schema__ = %s" % repr(table.schema))
+            ret.append("    __primary_key__ = %s" % \
+                                   repr(self._primary_key(table)))
+            ret.append("")
+
+            for name, column, ( class_name, kw, ) in self._attributes(
+                table, many2ones):
+                kw = kw.items()
+                kw.sort()
+                kw = [ "%s=%s" % ( key, repr(value), ) for key, value in kw ]
+                ret.append("    %s = %s(%s)" % ( name, class_name,
+                                                 ", ".join(kw), ))
+            ret.append("")
+            ret.append("")
+
+            for name, fk, other in many2ones:
+                relationships.append("%s.%s = many2one(%s, column=%s)" % (
+                    class_names[table], name, class_names[other],
+                    repr(fk.columns[0]), ))
+
+        ret.extend(relationships)
+        ret.append("")
+        
+        return "\n".join(ret)
+
+    def validate(self, dbclass):
+        """
+        Check dbclass against the catalog and return a list of strings
+        describing the problems found. An empty list means that the
+        dbclass matches the database.
+        """
+        table = self.table(dbclass.__relation__,
+                           getattr(dbclass, "__schema__", None))
+        if table is None:
+            return [ "%s: relation %s does not exist" % (
+                dbclass.__name__, str(dbclass.__relation__), ) ]
+
+        ret = []
+        def problem(msg):
+            ret.append("%s: %s" % ( dbclass.__name__, msg, ))
+
+        columns = {}
+        for name, dbprop in dbclass.__dict__.items():
+            if not isinstance(dbprop, datatypes.datatype):
+                continue
+            
+            if isinstance(dbprop, relationship) and \
+                   not isinstance(dbprop, many2one):
+                continue
+
+            # Look at the datatype that actually handles the column.
+            while hasattr(dbprop, "inside_datatype"):
+                dbprop = dbprop.inside_datatype
+
+            if dbprop.column is None:
+                if isinstance(dbprop, many2one): continue
+                column_name = name
+            else:
+                column_name = str(dbprop.column)
+            columns[column_name] = name
+                
+            column = table.column(column_name)
+            if column is None:
+                problem("column %s (attribute %s) does not exist" % (
+                    column_name, name, ))
+            elif column.type_name in type_map and \
+                     dbprop.python_class is not None:
+                expected = column.datatype_class().python_class
+                if expected is not None and \
+                       _family(expected) != _family(dbprop.python_class):
+                    problem("attribute %s is a %s, but column %s is %s" % (
+                        name, dbprop.__class__.__name__, column_name,
+                        column.sql_type, ))
+
+        for column in table.columns:
+            if column.not_null and column.default is None and \
+                   not columns.has_key(column.name) and not table.is_view():
+                problem("NOT NULL column %s without default is not "
+                        "covered by an attribute" % column.name)
+
+        primary_key = dbclass.__primary_key__
+        if isinstance(primary_key, StringType):
+            primary_key = ( primary_key, )
+        elif primary_key is not None and not isinstance(primary_key,
+                                                        TupleType):
+            primary_key = tuple(primary_key.key_attributes)
+
+        if primary_key:
+            try:
+                pk_columns = tuple([ str(dbclass.__dict__[a].column)
+                                     for a in primary_key ])
+            except (KeyError, AttributeError,):
+                pk_columns = primary_key
+
+            if table.primary_key and pk_columns != table.primary_key:
+                problem("primary key is (%s), but the table's is (%s)" % (
+                    ", ".join(pk_columns), ", ".join(table.primary_key), ))
+
+        return ret
+    
+
+def _identifyer(name):
+    """
+    Turn name into a Python identifyer.
+    """
+    ret = _identifyer_re.sub("_", name)
+    if ret[:1].isdigit():
+        ret = "_" + ret
+    return ret
+
+def _family(python_class):
+    return _python_class_family.get(python_class, python_class)
+
+def fingerprint(ds, schemas=("public",)):
+    """
+    Return a string that changes whenever the part of the system
+    catalog that is relevant to a L{catalog} of schemas changes. It is
+    cheap to query compared to reading the catalog itself.
+    """
+    schemas = list(schemas)
+    cursor = ds.cursor()
+    cursor.execute(fingerprint_query, ( schemas, schemas, schemas, ))
+    return cursor.fetchone()[0]
+
+def read_catalog(ds, schemas=("public",)):
+    """
+    Read the system catalog for the tables and views in schemas.
+    """
+    schemas = list(schemas)
+    ret = catalog(schemas, fingerprint(ds, schemas))
+    cursor = ds.cursor()
+
+    cursor.execute(columns_query, ( schemas, ))
+    for ( schema, relname, kind, name, type_name, type_oid, sql_type,
+          not_null, default, ) in cursor.fetchall():
+        table = ret.tables.get( (schema, relname,), None)
+        if table is None:
+            table = table_info(schema, relname, kind)
+            ret.tables[ (schema, relname,) ] = table
+            
+        table.columns.append(column_info(name, type_name, type_oid, sql_type,
+                                         not_null, default))
+
+    cursor.execute(constraints_query, ( schemas, ))
+    for ( schema, relname, kind, columns, other_schema, other_relname,
+          other_columns, ) in cursor.fetchall():
+        table = ret.tables.get( (schema, relname,), None)
+        if table is None:
+            continue
+        
+        if kind == "p":
+            table.primary_key = tuple(columns)
+        else:
+            table.foreign_keys.append(foreign_key_info(
+                columns, other_schema, other_relname, other_columns))
+
+    return ret
+
+def load_catalog(ds, cache_path, schemas=("public",), check=True):
+    """
+    Return the L{catalog} for schemas from the cache file at cache_path,
+    if it is still up to date. Otherwise read the system catalog and
+    (re-)write the cache file.
+
+    @param check: If False, a cached catalog is used without checking
+       its fingerprint against the database. This saves the one query
+       needed for it, but you'll have to remove the cache file yourself
+       when the schema changes.
+    """
+    cached = None
+    if os.path.exists(cache_path):
+        try:
+            fp = open(cache_path, "rb")
+            try:
+                cached = cPickle.load(fp)
+            finally:
+                fp.close()
+        except (IOError, EOFError, cPickle.UnpicklingError,
+                AttributeError, ImportError,):
+            cached = None
+
+    if cached is not None and \
+           getattr(cached, "format_version", None) == FORMAT_VERSION and \
+           cached.schemas == tuple(schemas):
+        if not check or cached.fingerprint == fingerprint(ds, schemas):
+            return cached
+    
+    ret = read_catalog(ds, schemas)
+
+    # Write to a temporary file first so concurrent processes never
+    # read a partial cache file.
+    tmp_path = "%s.%i" % ( cache_path, os.getpid(), )
+    fp = open(tmp_path, "wb")
+    try:
+        cPickle.dump(ret, fp, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        fp.close()
+    os.rename(tmp_path, cache_path)
+
+    return ret
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+__docformat__ = "epytext en"
+
+"""
+orm's U{SQLite <http://www.sqlite.org/>} adapter. It uses the sqlite3
+module from Python's standard library, so it works without a database
+server, which makes it handy for tests and benchmarks.
+"""
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+__docformat__ = "epytext en"
+
+"""
+This datasource module provides a datasource class for SQLite
+databases using the sqlite3 module from Python's standard library.
+
+Everything runs in-process, so this is mostly useful for tests and
+benchmarks (see t4/orm/benchmark.py). The connection is opened
+in autocommit mode and the datasource sends BEGIN itself before the
+first statement that is not a SELECT, so savepoints work as on
+the other backends and a transaction lasts until commit() or
+rollback().
+
+t4.sql produces SQL in the format paramstyle (%s placeholders, literal
+'%' escaped as '%%'). The cursors used by this adapter translate it to
+sqlite3's qmark style.
+"""
+
+# Python
+import re
+import sqlite3
+
+# t4
+from t4 import sql
+from t4.orm.datasource import datasource_base, cursor_wrapper
+from t4.orm.datatypes import common_serial
+from t4.orm.exceptions import *
+import datatypes
+
+_format_placeholder_re = re.compile(r"%[s%]")
+
+def _qmark(match):
+    if match.group() == "%s":
+        return "?"
+    else:
+        return "%"
+
+def format_to_qmark(command):
+    """
+    Translate an SQL command from the format to the qmark paramstyle.
+    """
+    return _format_placeholder_re.sub(_qmark, command)
+
+class sqlite_cursor:
+    """
+    Wrapper for a sqlite3 cursor that translates the paramstyle,
+    BEGINs transactions, counts the statements executed and turns
+    sqlite3's exceptions into those of t4.orm.
+    """
+    def __init__(self, ds, cursor):
+        self._ds = ds
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, command, params=()):
+        if not self._ds._in_transaction and \
+               command[:6].upper() not in ( "SELECT", "PRAGMA", ):
+            self._cursor.execute("BEGIN")
+            self._ds._in_transaction = True
+            self._ds.statement_count += 1
+
+        self._ds.statement_count += 1
+
+        try:
+            self._cursor.execute(format_to_qmark(command), params or ())
+        except sqlite3.IntegrityError, err:
+            error_message = str(err)
+            if error_message.startswith("UNIQUE constraint failed"):
+                raise DuplicateKey(error_message, err)
+            else:
+                raise BackendError(error_message, err)
+        except sqlite3.DatabaseError, err:
+            raise BackendError(str(err), err)
+
+class datasource(datasource_base, sql.sqlite_backend):
+    """
+    An orm database adapter for SQLite.
+    """
+
+    # sqlite3 cursors report a rowcount of -1 for SELECTs, the
+    # dbobject.result class needs to know the number of rows.
+    no_fetchone = True
+
+    supports_returning = (sqlite3.sqlite_version_info >= (3, 35, 0))
+    
+    def __init__(self, filename=":memory:", encoding="utf-8"):
+        """
+        @param filename: The name of the SQLite database file. The
+           default will create a new in-memory database.
+        @param encoding: The encoding used for text stored in the
+           database. 
+        """
+        datasource_base.__init__(self)
+
+        self.filename = filename
+        self.encoding = encoding
+
+        # The number of SQL statements executed, including the BEGINs
+        # sent by this adapter.
+        self.statement_count = 0
+        self._in_transaction = False
+        
+        # The datasource may be used by threads other than the one that
+        # created it, one at a time (see t4.orm.sharding).
+        self._conn = sqlite3.connect(filename, isolation_level=None,
+                                     check_same_thread=False)
+        
+        # Retrieve strings as they are stored, the datatypes know
+        # how to decode them.
+        self._conn.text_factory = str
+
+    def _from_params(params):
+        """
+        Construct a sqlite datasource object from an orm connection
+        string. The database file is given by the filename= or db=
+        keyword, it defaults to an in-memory database.
+        """
+        filename = params.get("filename", params.get("db", ":memory:"))
+        encoding = params.get("encoding", "utf-8")
+
+        return datasource(filename, encoding)
+    from_params = staticmethod(_from_params)
+
+    def backend_encoding(self):
+        return self.encoding
+    
+    def cursor(self):
+        """
+        Return a newly created dbi cursor.
+        """
+        if self.closed():
+            raise DatasourceClosed()
+        return cursor_wrapper(self, sqlite_cursor(self, self._conn.cursor()))
+
+    def __transaction_ended__(self):
+        datasource_base.__transaction_ended__(self)
+        self._in_transaction = False
+    
+    def select_after_insert_where(self, dbobj):
+        if dbobj.__primary_key__ is None: raise PrimaryKeyNotKnown()
+        
+        primary_key_attributes = tuple(dbobj.__primary_key__.attributes())
+
+        if len(primary_key_attributes) == 1:
+            primary_key_attribute = primary_key_attributes[0]
+        else:
+            primary_key_attribute = None
+
+        if isinstance(primary_key_attribute, ( datatypes.integer_primary_key,
+                                               common_serial, )) and \
+               not primary_key_attribute.isset(dbobj):
+            where = sql.where(primary_key_attribute.column,
+                              " = last_insert_rowid()")
+            
+        elif dbobj.__primary_key__.isset():
+            # If we know the primary key value, we use it to identify
+            # the new row.
+            where = dbobj.__primary_key__.where()
+
+        else:
+            raise PrimaryKeyNotKnown()
+        
+        return where
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+__docformat__ = "epytext en"
+
+"""
+Benchmark suite for t4.orm. It runs on the sqlite adapter, so no
+database server is needed::
+
+   python -m t4.orm.benchmark --size=1000
+   python -m t4.orm.benchmark --only=select --repeat=10
+
+Each benchmark works on a synthetic dataset of authors, their books,
+tags linked to the books, and the authors' aliases (sqltuple), info
+entries (sqldict) and bio (delayed). For each of them the best of
+the repeated runs is reported as operations per second, along with
+the number of SQL statements and the number of objects allocated per
+operation. The latter is the growth of the garbage collector's
+generation 0 count, i.e. container objects created and not yet freed
+while the benchmark ran with the garbage collector disabled. 
+
+Write benchmarks are rolled back after each run, so all runs see the
+same data.
+"""
+
+import sys, gc, time, optparse, random
+
+from t4.debug import sqllog
+from t4 import sql
+from t4.orm.dbobject import dbobject
+from t4.orm.datatypes import integer, Unicode, delayed
+from t4.orm.relationships import one2many, many2many
+from t4.orm.containers import sqltuple, sqldict
+from t4.orm.adapters.sqlite.datasource import datasource
+from t4.orm.adapters.sqlite.datatypes import integer_primary_key
+
+schema = ( """CREATE TABLE tag (
+                 id INTEGER PRIMARY KEY,
+                 name TEXT NOT NULL
+              )""",
+           """CREATE TABLE book (
+                 id INTEGER PRIMARY KEY,
+                 author_id INTEGER NOT NULL REFERENCES author(id),
+                 title TEXT NOT NULL,
+                 year INTEGER
+              )""",
+           """CREATE TABLE book_tag (
+                 book_id INTEGER NOT NULL REFERENCES book(id),
+                 tag_id INTEGER NOT NULL REFERENCES tag(id)
+              )""",
+           """CREATE TABLE author (
+                 id INTEGER PRIMARY KEY,
+                 name TEXT NOT NULL,
+                 bio TEXT
+              )""",
+           """CREATE TABLE author_alias (
+                 author_id INTEGER NOT NULL REFERENCES author(id),
+                 alias TEXT NOT NULL
+              )""",
+           """CREATE TABLE author_info (
+                 author_id INTEGER NOT NULL REFERENCES author(id),
+                 key TEXT NOT NULL,
+                 value TEXT,
+                 PRIMARY KEY(author_id, key)
+              )""",
+           "CREATE INDEX book_author_id ON book(author_id)",
+           "CREATE INDEX book_tag_book_id ON book_tag(book_id)",
+           "CREATE INDEX author_alias_author_id ON author_alias(author_id)", )
+
+class tag(dbobject):
+    id = integer_primary_key()
+    name = Unicode()
+
+class book(dbobject):
+    id = integer_primary_key()
+    author_id = integer()
+    title = Unicode()
+    year = integer()
+    tags = many2many(tag, "book_tag")
+
+class author(dbobject):
+    id = integer_primary_key()
+    name = Unicode()
+    bio = delayed(Unicode())
+    books = one2many(book)
+    aliases = sqltuple("author_alias", Unicode(column="alias"),
+                       child_key="author_id")
+    info = sqldict("author_info", Unicode(column="key"),
+                   Unicode(column="value"), child_key="author_id")
+
+tag_count = 20
+tags_per_book = 2
+aliases_per_author = 3
+info_keys = ( "country", "born", "publisher", )
+
+def populate(ds, size, books_per_author):
+    """
+    Fill an empty datasource with the synthetic dataset. This uses
+    the sqlite3 connection directly, it is not what we measure.
+    """
+    conn = ds._conn
+    for command in schema:
+        conn.execute(command)
+
+    rnd = random.Random(4711)
+    
+    conn.executemany("INSERT INTO tag VALUES (?, ?)",
+                     [ ( i, "tag %i" % i, ) for i in range(1, tag_count+1) ])
+    conn.executemany("INSERT INTO author VALUES (?, ?, ?)",
+                     [ ( i, "Author %i" % i, "Biography %i " % i * 40, )
+                       for i in range(1, size+1) ])
+    conn.executemany("INSERT INTO author_alias VALUES (?, ?)",
+                     [ ( i, "Alias %i/%i" % ( i, a, ), )
+                       for i in range(1, size+1)
+                       for a in range(aliases_per_author) ])
+    conn.executemany("INSERT INTO author_info VALUES (?, ?, ?)",
+                     [ ( i, key, "%s of %i" % ( key, i, ), )
+                       for i in range(1, size+1)
+                       for key in info_keys ])
+
+    books = [ ( i * books_per_author + b + 1, i + 1, "Book %i/%i" % ( i, b, ),
+                rnd.randint(1900, 2011), )
+              for i in range(size) for b in range(books_per_author) ]
+    conn.executemany("INSERT INTO book VALUES (?, ?, ?, ?)", books)
+    conn.executemany("INSERT INTO book_tag VALUES (?, ?)",
+                     [ ( book_id, rnd.randint(1, tag_count), )
+                       for book_id, a, t, y in books
+                       for i in range(tags_per_book) ])
+    conn.commit()
+
+def all_authors(ds):
+    return [ a for a in ds.select(author) ]
+
+def all_books(ds):
+    return [ b for b in ds.select(book) ]
+
+def bench_select(ds, state):
+    return len([ a for a in ds.select(author, sql.orderby("id")) ])
+
+def bench_select_by_primary_key(ds, ids):
+    for id in ids:
+        ds.select_by_primary_key(author, id)
+    return len(ids)
+
+def bench_insert(ds, size):
+    for i in range(size):
+        ds.insert(author(name=u"New author %i" % i))
+    return size
+
+def bench_register_new(ds, size):
+    for i in range(size):
+        ds.register_new(book(author_id=1, title=u"New book %i" % i,
+                             year=2011))
+    ds.flush_updates()
+    return size
+
+def bench_flush_updates(ds, books):
+    for b in books:
+        b.title = u"Changed"
+    ds.flush_updates()
+    return len(books)
+
+def bench_one2many(ds, authors):
+    count = 0
+    for a in authors:
+        for b in a.books:
+            count += 1
+    return count
+
+def bench_many2many(ds, books):
+    count = 0
+    for b in books:
+        for t in b.tags:
+            count += 1
+    return count
+
+def bench_sqltuple(ds, authors):
+    for a in authors:
+        a.aliases
+    return len(authors)
+
+def bench_sqldict(ds, authors):
+    for a in authors:
+        a.info["country"]
+    return len(authors)
+
+def bench_delayed(ds, authors):
+    for a in authors:
+        a.bio
+    return len(authors)
+
+def no_setup(ds, options):
+    return None
+
+# name, setup, run. The setup function is called before each run,
+# its return value is passed to run(), which returns the number of
+# operations performed. 
+benchmarks = (
+    ( "select", no_setup, bench_select, ),
+    ( "select_by_primary_key",
+      lambda ds, options: range(1, options.size+1),
+      bench_select_by_primary_key, ),
+    ( "insert", lambda ds, options: options.size, bench_insert, ),
+    ( "register_new+flush", lambda ds, options: options.size,
+      bench_register_new, ),
+    ( "flush_updates", lambda ds, options: all_books(ds),
+      bench_flush_updates, ),
+    ( "one2many", lambda ds, options: all_authors(ds), bench_one2many, ),
+    ( "many2many", lambda ds, options: all_books(ds), bench_many2many, ),
+    ( "sqltuple", lambda ds, options: all_authors(ds), bench_sqltuple, ),
+    ( "sqldict", lambda ds, options: all_authors(ds), bench_sqldict, ),
+    ( "delayed", lambda ds, options: all_authors(ds), bench_delayed, ), )
+
+class measurement:
+    def __init__(self, name):
+        self.name = name
+        self.ops = 0
+        self.seconds = None
+        self.statements = 0
+        self.allocations = 0
+
+    def add_run(self, ops, seconds, statements, allocations):
+        # We keep the fastest run, the others have been disturbed by
+        # something.
+        if self.seconds is None or seconds < self.seconds:
+            self.ops = ops
+            self.seconds = seconds
+            self.statements = statements
+            self.allocations = allocations
+
+    def per_op(self, value):
+        return float(value) / max(self.ops, 1)
+
+    def ops_per_second(self):
+        return self.ops / max(self.seconds, 1e-9)
+
+def run(ds, options, name, setup, function):
+    ret = measurement(name)
+    for i in range(options.repeat):
+        state = setup(ds, options)
+
+        gc.collect()
+        gc.disable()
+        try:
+            statements = ds.statement_count
+            allocations = gc.get_count()[0]
+            start = time.time()
+
+            ops = function(ds, state)
+
+            seconds = time.time() - start
+            allocations = gc.get_count()[0] - allocations
+            statements = ds.statement_count - statements
+        finally:
+            gc.enable()
+            
+        ret.add_run(ops, seconds, statements, allocations)
+
+        # Undo the changes of write benchmarks.
+        ds.rollback()
+        
+    return ret
+
+def report(measurements, fp=sys.stdout):
+    print >> fp, "%-24s %8s %12s %10s %10s" % ( "benchmark", "ops",
+                                               "ops/s", "stmts/op",
+                                               "objs/op", )
+    for m in measurements:
+        print >> fp, "%-24s %8i %12.1f %10.2f %10.1f" % (
+            m.name, m.ops, m.ops_per_second(),
+            m.per_op(m.statements), m.per_op(m.allocations), )
+
+def main():
+    op = optparse.OptionParser(usage="usage: %prog [options]")
+    op.add_option("-n", "--size", dest="size", type="int", default=200,
+                  help="Number of authors in the dataset (default 200)")
+    op.add_option("-b", "--books", dest="books", type="int", default=5,
+                  help="Number of books per author (default 5)")
+    op.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                  help="Number of runs per benchmark, the best one is "
+                       "reported (default 3)")
+    op.add_option("-o", "--only", dest="only", default=None,
+                  help="Only run the benchmarks whoes name contains ONLY")
+    op.add_option("-f", "--file", dest="filename", default=":memory:",
+                  help="SQLite database file to use. It must not exist "
+                       "(default: in-memory database)")
+    sqllog.add_option(op)
+    
+    options, args = op.parse_args()
+
+    ds = datasource(options.filename)
+    populate(ds, options.size, options.books)
+
+    measurements = []
+    for name, setup, function in benchmarks:
+        if options.only is None or options.only in name:
+            measurements.append(run(ds, options, name, setup, function))
+
+    report(measurements)
+    ds.close()
+
+if __name__ == "__main__":
+    main()
@@ -174,7 +174,7 @@ class sqltuple(_container):
         self.check_dbobj(dbobj)
 
         if self.isset(dbobj):
-            return getattr(dbobj, self.data_attribute_name())
+            return self.get_data(dbobj)
         else:
             # Consturct the SQL query
             query = sql.select( self.child_column.column,
@@ -185,7 +185,7 @@ class sqltuple(_container):
             ret = map(lambda tpl: self.child_column.__convert__(tpl[0]),
                       cursor.fetchall())
             ret = tuple(ret)
-            setattr(dbobj, self.data_attribute_name(), ret)
+            self.set_data(dbobj, ret)
             return ret
 
     def __set__(self, dbobj, new_values):
@@ -211,7 +211,7 @@ class sqltuple(_container):
         
         if self.isset(dbobj):
            dont_delete = True
-           old = getattr(dbobj, self.data_attribute_name())
+           old = self.get_data(dbobj)
            
            if len(old) <= len(new):
               for o, n in zip(old, new):
@@ -243,7 +243,7 @@ class sqltuple(_container):
                            ( dbobj.__primary_key__.sql_literal(),
                              literal, ) ))
             
-        setattr(dbobj, self.data_attribute_name(), tuple(new))
+        self.set_data(dbobj, tuple(new))
             
 
 class sqldict(_container):
@@ -310,7 +310,7 @@ class sqldict(_container):
         self.check_dbobj(dbobj)
 
         if self.isset(dbobj):
-            return getattr(dbobj, self.data_attribute_name())
+            return self.get_data(dbobj)
         else:
             # Consturct the SQL query
             query = sql.select( ( self.child_key_column.column,
@@ -323,7 +323,7 @@ class sqldict(_container):
                            self.child_value_column.__convert__(tpl[1]), ),
                       cursor.fetchall())
             ret = self.sqldict_dict(self, dbobj, dict(ret))
-            setattr(dbobj, self.data_attribute_name(), ret)
+            self.set_data(dbobj, ret)
             return ret
 
 
@@ -336,7 +336,7 @@ class sqldict(_container):
        if self.isset(dbobj):
            # We have a new version of the dict in memory and can compare
            # values against it.
-           old_dict = getattr(dbobj, self.data_attribute_name())
+           old_dict = self.get_data(dbobj)
            old_dict.update(new_dict)
 
            new_keys = set(new_dict.keys())
@@ -388,8 +388,7 @@ class sqldict(_container):
                                     key_literal, value_literal, ) )
               dbobj.__ds__().execute(query)
 
-              setattr(dbobj, self.data_attribute_name(),
-                      self.sqldict_dict(self, dbobj, new))
+              self.set_data(dbobj, self.sqldict_dict(self, dbobj, new))
             
 
    class sqldict_dict(dict):
@@ -44,6 +44,7 @@ import keys
 from t4.debug import sqllog
 
 from exceptions import *
+from unit_of_work import unit_of_work
 
 def datasource(connection_string="", **kwargs):
     """
@@ -131,6 +132,8 @@ def datasource(connection_string="", **kwargs):
             from t4.orm.adapters.mysql.datasource import datasource        
         elif adapter == "firebird":
             from t4.orm.adapters.firebird.datasource import datasource
+        elif adapter == "sqlite":
+            from t4.orm.adapters.sqlite.datasource import datasource
         else:
             raise IllegalConnectionString("Unknown adapter: %s" % adapter)
 
@@ -174,6 +177,85 @@ class cursor_wrapper:
             print >> sqllog, self._cursor, command, " || ", repr(params)
             self._cursor.execute(command, tuple(params))
 
+class savepoint:
+    """
+    A nested transaction backed by an SQL SAVEPOINT, to be used as a
+    context manager::
+
+       for row in rows:
+           try:
+               with ds.savepoint():
+                   process(row)
+           except BackendError:
+               log_failure(row)
+
+       ds.commit()
+
+    If the with block raises an exception, the changes it made to the
+    database are rolled back (ROLLBACK TO SAVEPOINT) and the exception
+    is propagated. Otherwise the savepoint is released. Savepoints may
+    be nested. Note that the Python-side state of dbobjects modified
+    within the block is not reverted; changes that have been registered
+    but not yet flushed are discarded, though.
+
+    Savepoints are created lazily: the SAVEPOINT command is only sent
+    to the backend when the block actually modifies the database. A
+    block that only reads (or doesn’t do anything at all) costs no
+    extra round trip. The downside: if a read-only statement fails
+    within such a block, there is no savepoint to return to. Pass
+    lazy=False if that’s a concern.
+    """
+    _counter = 0
+    
+    def __init__(self, ds, lazy=True):
+        savepoint._counter += 1
+        self.name = "t4_savepoint_%i" % savepoint._counter
+        self.ds = ds
+        self.lazy = lazy
+        self.created = False
+
+    def create(self):
+        if not self.created:
+            self.ds.__modify_cursor__().execute("SAVEPOINT " + self.name)
+            self.created = True
+
+    def __enter__(self):
+        # Changes registered before the block are not part of it.
+        self.ds.flush_updates()
+        
+        self.ds._savepoints.append(self)
+        if not self.lazy: self.create()
+        
+        return self
+
+    def __exit__(self, type, value, traceback):
+        try:
+            if type is None:
+                try:
+                    self.ds.flush_updates()
+                except:
+                    self.rollback()
+                    raise
+                
+                if self.created:
+                    self.ds.__modify_cursor__().execute(
+                        "RELEASE SAVEPOINT " + self.name)
+            else:
+                self.rollback()
+        finally:
+            self.ds._savepoints.remove(self)
+            
+        return False
+
+    def rollback(self):
+        self.ds._unit_of_work.clear()
+        if self.created:
+            cursor = self.ds.__modify_cursor__()
+            cursor.execute("ROLLBACK TO SAVEPOINT " + self.name)
+            cursor.execute("RELEASE SAVEPOINT " + self.name)
+            self.created = False
+
+        
 class datasource_base:
     """
     The DataSource encapsulates the functionality we need to talk to the
@@ -184,19 +266,52 @@ class datasource_base:
 
     It inherits from sql.datasource to provide default implmentations of
     the methods the sql module depends upon.
+
+    Changes to dbobjects are collected by a L{unit_of_work} and written
+    to the database by flush_updates(), which is called by commit() and,
+    if autoflush is set, before every statement that modifies the
+    database.
+
+    @cvar autoflush: If set to False, pending changes will only be
+       written on commit() or an explicit call to flush_updates().
+    @cvar approximate_count_threshold: Approximate counts below this
+       are replaced by an exact COUNT(*), see count().
     """
     _format_funcs = {}
+    autoflush = True
+    approximate_count_threshold = 10000
     
     def __init__(self):
         self._conn = None
         self._debug = 0
         self._modify_cursor = None
-        self._changed_dbobjs = set()
+        self._unit_of_work = unit_of_work(self)
+        self._savepoints = []
 
     def __register_change_of__(self, dbobj):
         if self.closed():
             raise DatasourceClosed()
-        self._changed_dbobjs.add(dbobj)
+        self._unit_of_work.register_dirty(dbobj)
+
+    def register_new(self, dbobj):
+        """
+        Schedule dbobj to be INSERTed on the next flush. As opposed to
+        insert() this does not touch the database right away, so
+        several new dbobjects can be written in dependency order and
+        with multi-row INSERTs. Note that values provided by the backend
+        (like serial primary keys) are not available before the flush.
+        """
+        if self.closed():
+            raise DatasourceClosed()
+        self._unit_of_work.register_new(dbobj)
+
+    def register_deleted(self, dbobj):
+        """
+        Schedule dbobj to be DELETEd on the next flush. 
+        """
+        if self.closed():
+            raise DatasourceClosed()
+        self._unit_of_work.register_deleted(dbobj)
         
     def _dbconn(self):
         """
@@ -254,7 +369,8 @@ class datasource_base:
 
         if modify:
             cursor = self.__modify_cursor__()
-            self.flush_updates()
+            self.__begin_savepoints__()
+            if self.autoflush: self.flush_updates()
         else:
             cursor = self.cursor()
 
@@ -268,11 +384,53 @@ class datasource_base:
         return self._modify_cursor
 
     def flush_updates(self, select_after_update=True):
-        cursor = self.__modify_cursor__()
-        for dbobj in self._changed_dbobjs:
-            dbobj.__perform_updates__(cursor, select_after_update)
-        self._changed_dbobjs = set()
+        """
+        Write all pending INSERTs, UPDATEs and DELETEs to the database.
+        See L{t4.orm.unit_of_work} for details.
+        """
+        if len(self._unit_of_work) > 0: self.__begin_savepoints__()
+        self._unit_of_work.flush(self.__modify_cursor__(), select_after_update)
     __flush_updates__ = flush_updates
+
+    def sync_pipeline(self):
+        """
+        Make sure the statements executed on the modify cursor have been
+        sent to the backend, so their errors are raised now. Adapters
+        that queue statements (see the pgsql adapter's pipeline)
+        overload this, for all others it is a no-op.
+        """
+        pass
+
+    def savepoint(self, lazy=True):
+        """
+        Return a L{savepoint} context manager for a nested transaction.
+        """
+        return savepoint(self, lazy)
+
+    def in_savepoint(self):
+        """
+        Return True, if the innermost active savepoint has been created
+        in the backend, i.e. a failed statement can be rolled back to it.
+        """
+        return len(self._savepoints) > 0 and self._savepoints[-1].created
+
+    def __begin_savepoints__(self):
+        """
+        Send the SAVEPOINT commands for the active savepoints that have
+        not been created, yet. Called before anything modifies the
+        database.
+        """
+        for sp in self._savepoints:
+            if not sp.created: sp.create()
+
+    def __transaction_ended__(self):
+        """
+        Called on commit and rollback. Forget pending changes and
+        savepoints, they ended with the transaction.
+        """
+        self._unit_of_work.clear()
+        for sp in self._savepoints:
+            sp.created = False
         
     def commit(self, *dbobjs, **kw):
         """
@@ -290,6 +448,7 @@ class datasource_base:
         #return cursor
         self.flush_updates()
         self._dbconn().commit()
+        self.__transaction_ended__()
     
     def perform_updates(self, *dbobjs, **kw):
         pass
@@ -298,6 +457,7 @@ class datasource_base:
         """
         Undo the changes you made to the database since the last commit()
         """
+        self.__transaction_ended__()
         self._dbconn().rollback()        
         
     def cursor(self):
@@ -389,13 +549,18 @@ class datasource_base:
         except StopIteration:
             return None
         
-    def count(self, dbclass, *clauses):
+    def count(self, dbclass, *clauses, **kw):
         """
         All clauses except the WHERE clause will be ignored
         (including OFFSET and LIMIT!)
         
         @param dbclass: See select() above.
         @param clauses: See select() above.
+        @param approximate: (keyword parameter) If set, return the
+                 backend's estimate rather than running a COUNT(*),
+                 unless the estimate is below the threshold (keyword
+                 parameter, defaults to approximate_count_threshold). See
+                 approximate_count().
         
         @return: An integer value indicating the number of objects
                  of dbclass select() would return if run with these clauses.
@@ -403,10 +568,90 @@ class datasource_base:
         clauses = filter(lambda clause: (isinstance(clause, sql.where) or
                                          isinstance(clause, sql.left_join)),
                          clauses)
+
+        if kw.get("approximate", False):
+            count = self.approximate_count(dbclass.__view__, clauses,
+                                           kw.get("threshold", None))
+            if count is not None:
+                return count
             
         query = sql.select("COUNT(*)", dbclass.__view__, *clauses)
         return self.query_one(query)[0]
 
+    def approximate_count(self, relations, clauses, threshold=None):
+        """
+        Return the backend's estimate of the number of rows in relations
+        matching clauses (WHERE and LEFT JOIN clauses only), if it is
+        at least threshold (defaults to approximate_count_threshold).
+        Otherwise return None, the caller is supposed to count exactly
+        then: small estimates are the least reliable ones and exact
+        counts are cheap for them.
+        """
+        if threshold is None:
+            threshold = self.approximate_count_threshold
+
+        estimate = self.estimate_count(relations, clauses)
+        
+        if estimate is None or estimate < threshold:
+            return None
+        else:
+            return estimate
+
+    def estimate_count(self, relations, clauses):
+        """
+        Return an estimate for the number of rows in relations that
+        match clauses or None, if the backend can't provide one. 
+        """
+        return None
+
+    def search(self, dbclass, query, *clauses, **kw):
+        """
+        Run a full-text search and return the dbobjs of dbclass that
+        match query, best matches first.
+
+        @param query: The search query, either a string or unicode
+            object or a backend specific query expression (like
+            L{t4.orm.adapters.pgsql.fulltext.tsquery}).
+        @param clauses: Additional clauses as for select(). A WHERE
+            clause will be combined with the search condition using AND.
+        @param vector: (keyword parameter) The attribute name, column or
+            expression to search, the backend decides on a default.
+        @param limit: (keyword parameter) The maximum number of dbobjs
+            returned, defaults to 20. None means no limit.
+        @param offset: (keyword parameter) The number of best matches to
+            skip (for paging).
+
+        Other keyword parameters are passed to fulltext_expressions().
+        """
+        vector = kw.pop("vector", None)
+        limit = kw.pop("limit", 20)
+        offset = kw.pop("offset", None)
+        
+        condition, rank = self.fulltext_expressions(dbclass, query, vector,
+                                                    **kw)
+        
+        where = sql.where(condition)
+        clauses = list(clauses)
+        for counter, clause in enumerate(clauses):
+            if isinstance(clause, sql.where):
+                clauses[counter] = sql.where.and_(where, clause)
+                where = None
+
+        if where is not None: clauses.append(where)
+        clauses.append(sql.orderby(rank, dir="DESC"))
+        if limit is not None: clauses.append(sql.limit(limit))
+        if offset is not None: clauses.append(sql.offset(offset))
+
+        return self.select(dbclass, *clauses)
+        
+    def fulltext_expressions(self, dbclass, query, vector=None, **kw):
+        """
+        Return a pair of SQL expressions for search(): the condition
+        for matching rows and the rank to order them by.
+        """
+        raise NotImplementedError("%s does not support full-text search" % \
+                                      self.__class__.__name__)
+    
     def join_select(self, dbclass, *clauses):
         # this may take some figuring
         pass
@@ -464,6 +709,35 @@ class datasource_base:
         except StopIteration:
             return None
 
+    def select_by_primary_keys(self, dbclass, primary_keys):
+        """
+        Select the objects of dbclass whose (single column) primary key
+        is among primary_keys with as few queries as possible. See L{sql.in_}.
+
+        @param primary_keys: A sequence of Python values
+        @return: A list of dbobjs in the order of primary_keys. Keys that don't
+           exist in the database are skipped.
+        """
+        attribute = keys.primary_key(dbclass).attribute()
+        values = map(attribute.__convert__, primary_keys)
+
+        # If the backend can't pass the keys as an array, it has to
+        # render them all into the statement. Don't let that get too long.
+        if self.supports_array_params:
+            batch_size = len(values) or 1
+        else:
+            batch_size = self.max_in_list_length
+
+        by_key = {}
+        for start in range(0, len(values), batch_size):
+            where = sql.where(sql.in_(attribute.column,
+                                      values[start:start+batch_size],
+                                      attribute.sql_literal_class))
+            for dbobj in self.select(dbclass, where):
+                by_key[dbobj.__primary_key__.value()] = dbobj
+
+        return [ by_key[value] for value in values if by_key.has_key(value) ]
+        
     def select_for_update(self, dbclass, key):
         """
         This method works like L{select_by_primary_key} above, except that it
@@ -500,7 +774,27 @@ class datasource_base:
         """
         if dbobj.__is_stored__():
             raise ObjectAlreadyInserted(repr(dbobj))
+
+        for dbprop in dbobj.__dbproperties__():
+            dbprop.__preallocate__([ dbobj, ])
         
+        sql_columns, sql_values = self.insert_columns_and_values(dbobj)
+        statement = sql.insert(dbobj.__relation__, sql_columns, sql_values)
+
+        self.execute(statement)
+        dbobj.__insert__(self)
+
+        if dbobj.__primary_key__ is not None and not dont_select:
+            self.select_after_insert(dbobj)
+
+        return cursor
+
+    def insert_columns_and_values(self, dbobj):
+        """
+        Return a pair of lists, the columns and the values (as SQL
+        literals or expressions) that make up the INSERT statement
+        for dbobj.
+        """
         sql_columns = []
         sql_values = []
         for property in dbobj.__dbproperties__():
@@ -515,16 +809,174 @@ class datasource_base:
             raise DBObjContainsNoData(
                 "Please set at least one of the attributes of this dbobj")
 
-        statement = sql.insert(dbobj.__relation__, sql_columns, sql_values)
+        return ( sql_columns, sql_values, )
 
-        self.execute(statement)
-        dbobj.__insert__(self)
+    def upsert(self, dbobj, conflict_attributes=None, update_attributes=None):
+        """
+        INSERT dbobj or, if a row with the same primary key (or the same
+        values for conflict_attributes) exists, UPDATE that row, using
+        a single statement. Columns provided by the backend are picked up
+        as with insert().
 
-        if dbobj.__primary_key__ is not None and not dont_select:
-            self.select_after_insert(dbobj)
+        @param conflict_attributes: Names of the attributes that make up
+           the unique key existing rows are identified by. Defaults to the
+           dbclass' primary key. These attributes must be set.
+        @param update_attributes: Names of the attributes whose columns
+           are updated in an existing row. Defaults to all attributes
+           that are set, except the conflict_attributes.
+        """
+        self.upsert_many([ dbobj, ], conflict_attributes, update_attributes)
 
-        return cursor
+    def upsert_many(self, dbobjs, conflict_attributes=None,
+                    update_attributes=None):
+        """
+        Like L{upsert()} for a sequence of dbobjs. Consecutive dbobjs of
+        the same dbclass that have the same set of attributes set are
+        combined into one statement.
+        """
+        batch = []
+        batch_columns = None
+        batch_size = self._unit_of_work.batch_size
+        
+        for dbobj in dbobjs:
+            if dbobj.__is_stored__():
+                raise ObjectAlreadyInserted(repr(dbobj))
+            
+            columns, values = self.insert_columns_and_values(dbobj)
+
+            if len(batch) > 0 and ( dbobj.__class__ is not \
+                                        batch[0][0].__class__ or \
+                                    columns != batch_columns or \
+                                    len(batch) >= batch_size ):
+                self.upsert_batch(batch_columns, batch,
+                                  conflict_attributes, update_attributes)
+                batch = []
+
+            batch_columns = columns
+            batch.append( (dbobj, values,) )
+
+        if len(batch) > 0:
+            self.upsert_batch(batch_columns, batch,
+                              conflict_attributes, update_attributes)
+
+    def upsert_batch(self, columns, batch, conflict_attributes=None,
+                     update_attributes=None):
+        """
+        UPSERT a list of ( dbobj, values, ) pairs for dbobjs of the same
+        dbclass with the same columns as returned by
+        insert_columns_and_values().
+        """
+        dbclass = batch[0][0].__class__
+        
+        if conflict_attributes is None:
+            if dbclass.__primary_key__ is None:
+                raise NoPrimaryKey("Can't UPSERT %s without conflict "
+                                   "attributes." % dbclass.__name__)
+            conflict_properties = list(
+                keys.primary_key(dbclass).attributes())
+        else:
+            conflict_properties = map(dbclass.__dbproperty__,
+                                      conflict_attributes)
+        conflict_columns = [ p.column for p in conflict_properties ]
 
+        for column in conflict_columns:
+            if column not in columns:
+                raise KeyNotSet("Conflict column %s must be set for UPSERT."%\
+                                    str(column))
+
+        if update_attributes is None:
+            update_columns = None
+        else:
+            update_columns = [ dbclass.__dbproperty__(name).column
+                               for name in update_attributes ]
+            update_columns = [ column for column in columns
+                               if column in update_columns ]
+
+        def needs_select(dbprop, dbobj):
+            try:
+                return dbprop.__select_after_insert__(dbobj)
+            except ObjectAlreadyInserted:
+                # Serials complain about being set, but that's what
+                # an UPSERT by primary key is all about.
+                return False
+            
+        first = batch[0][0]
+        properties = [ dbprop for dbprop in first.__dbproperties__()
+                       if dbprop.column is not None and \
+                          needs_select(dbprop, first) ]
+
+        if conflict_attributes is not None and \
+               dbclass.__primary_key__ is not None:
+            # The row that was updated may have a different primary key
+            # than the one set in the dbobj.
+            for dbprop in keys.primary_key(dbclass).attributes():
+                if dbprop not in properties and \
+                       dbprop not in conflict_properties:
+                    properties.append(dbprop)
+        
+        if self.supports_returning and len(properties) > 0:
+            # The backend does not return the rows in the order of the
+            # VALUES, the conflict columns tell us which is which.
+            returning = [ dbprop.column for dbprop in properties ] + \
+                        conflict_columns
+        else:
+            returning = ()
+            
+        statement = sql.upsert(dbclass.__relation__, columns,
+                               [ values for dbobj, values in batch ],
+                               conflict_columns, update_columns, returning)
+        cursor = self.execute(statement)
+
+        for dbobj, values in batch:
+            dbobj.__insert__(self)
+
+        if len(properties) == 0:
+            return
+        
+        if returning:
+            def key(dbprops, values):
+                ret = []
+                for dbprop, value in zip(dbprops, values):
+                    if type(value) == StringType and \
+                           dbprop.python_class is UnicodeType:
+                        value = unicode(value, self.backend_encoding())
+                    if dbprop.python_class is not None:
+                        value = dbprop.__convert__(value)
+                    ret.append(value)
+                return tuple(ret)
+            
+            by_key = {}
+            for row in cursor.fetchall():
+                by_key[key(conflict_properties,
+                           row[len(properties):])] = row
+
+            rows = []
+            for dbobj, values in batch:
+                row = by_key.get(key(conflict_properties,
+                                     [ dbprop.get_data(dbobj, None)
+                                       for dbprop in conflict_properties ]))
+                if row is None:
+                    raise ObjectWasNotInserted()
+                rows.append(row)
+        else:
+            rows = []
+            for dbobj, values in batch:
+                where = sql.where.and_(
+                    *[ sql.where(column, " = ", values[columns.index(column)])
+                       for column in conflict_columns ])
+                query = sql.select([ dbprop.column for dbprop in properties ],
+                                   dbclass.__relation__, where)
+                
+                cursor.execute(query)
+                row = cursor.fetchone()
+                if row is None:
+                    raise ObjectWasNotInserted()
+                rows.append(row)
+
+        for ( dbobj, values, ), row in zip(batch, rows):
+            for dbprop, value in zip(properties, row):
+                dbprop.__set_from_result__(self, dbobj, value)
+        
     def select_after_insert(self, dbobj):
         """
         This method will be run after each INSERT statement automaticaly
@@ -50,6 +50,15 @@ from t4 import sql
 
 _property_counter = 0
 
+class _unset_marker:
+    """
+    Marks an unset entry in a compact dbobject's value store.
+    """
+    def __repr__(self):
+        return "<unset>"
+    
+_unset = _unset_marker()
+
 class datatype(property):
     """
     This class encapsulates a dbclass' property (=attribute). It takes
@@ -66,6 +75,10 @@ class datatype(property):
     python_class = None    
     sql_literal_class = None
 
+    # Index into a compact dbobject's value store. See
+    # L{t4.orm.dbobject.dbobject} for __compact__.
+    _value_index = None
+
     def __init__(self, column=None, title=None,
                  validators=(), has_default=False):
         """
@@ -100,6 +113,8 @@ class datatype(property):
             self.validators = ( validators, )
         else:
             self.validators = tuple(validators)
+
+        self._validate = compile_validators(self.validators)
                 
         self.has_default = has_default
 
@@ -125,6 +140,12 @@ class datatype(property):
             
         self._data_attribute_name = " %s" % str(self.column)
 
+        if getattr(dbclass, "__compact__", False):
+            self._value_index = dbclass.__value_slot__(
+                self._data_attribute_name)
+        else:
+            self._value_index = None
+
         if self.title is None:
             self.title = unicode(self.attribute_name, "ascii")
             # It's save to use ascii, because Python does not allow non-ascii
@@ -137,6 +158,54 @@ class datatype(property):
             from exceptions import DatatypeMustBeUsedInClassDefinition
             raise DatatypeMustBeUsedInClassDefinition(self.__class__.__name__)
 
+    def get_data(self, dbobj, default=_unset):
+        """
+        Return the Python value stored for this datatype in dbobj. If
+        it has not been set, return default, or raise AttributeError if
+        no default is given.
+        """
+        index = self._value_index
+        if index is None:
+            if default is _unset:
+                return getattr(dbobj, self.data_attribute_name())
+            else:
+                return getattr(dbobj, self.data_attribute_name(), default)
+        else:
+            values = dbobj._values
+            if index < len(values) and values[index] is not _unset:
+                return values[index]
+            elif default is _unset:
+                raise AttributeError(self.data_attribute_name())
+            else:
+                return default
+
+    def set_data(self, dbobj, value):
+        """
+        Store value in dbobj without conversion, validation or change
+        tracking.
+        """
+        index = self._value_index
+        if index is None:
+            setattr(dbobj, self.data_attribute_name(), value)
+        else:
+            values = dbobj._values
+            if index >= len(values):
+                values.extend([_unset] * (index - len(values) + 1))
+            values[index] = value
+
+    def del_data(self, dbobj):
+        """
+        Remove the value stored for this datatype from dbobj.
+        """
+        index = self._value_index
+        if index is None:
+            delattr(dbobj, self.data_attribute_name())
+        else:
+            values = dbobj._values
+            if index >= len(values) or values[index] is _unset:
+                raise AttributeError(self.data_attribute_name())
+            values[index] = _unset
+        
     def expression_attribute_name(self):
         return " expression" + self.data_attribute_name()
         
@@ -166,7 +235,7 @@ class datatype(property):
         self.check_dbobj(dbobj)
             
         if self.isset(dbobj):
-            return getattr(dbobj, self.data_attribute_name())
+            return self.get_data(dbobj)
         else:
             if dbobj.__primary_key__ is not None:
                 primary_key_property = repr(tuple(
@@ -203,26 +272,37 @@ class datatype(property):
             if self.isset(dbobj):
                 # Remove the current value from the dbobj so we don't
                 # return a value that's not in sync with the database.
-                delattr(dbobj, self.data_attribute_name())                
+                self.del_data(dbobj)
             dbobj.__register_change__(self)
         else:
             self.remove_expression(dbobj)
                 
             if value is not None: value = self.__convert__(value)
 
-            for validator in self.validators:
-                validator.check(dbobj, self, value)
+            old = self.get_data(dbobj, StringType)
+            if old is not StringType and type(old) is type(value) and \
+                   old == value:
+                # Nothing changes. The value has either been validated
+                # before or it has been loaded from the database. 
+                return
+            
+            if self._validate is not None:
+                self._validate(dbobj, self, value)
 
-            old = getattr(dbobj, self.data_attribute_name(), StringType)
-            setattr(dbobj, self.data_attribute_name(), value)
+            self.set_data(dbobj, value)
+            dbobj.__register_change__(self)
 
-            if old != value:
-                dbobj.__register_change__(self)
+    def validate(self, dbobj, value):
+        """
+        Run this datatype's validators on value, raising a
+        ValidatorException if it is not valid. 
+        """
+        if self._validate is not None:
+            self._validate(dbobj, self, value)
 
     def __set_from_result__(self, ds, dbobj, value):
         self.remove_expression(dbobj)            
-        setattr(dbobj, self.data_attribute_name(),
-                self.__convert__(value))
+        self.set_data(dbobj, self.__convert__(value))
 
     def check_dbobj(self, dbobj):
         if self.attribute_name is not None and \
@@ -236,7 +316,12 @@ class datatype(property):
         """
         @returns: True, if this property is set, otherwise... well.. False.
         """
-        return hasattr(dbobj, self.data_attribute_name())
+        index = self._value_index
+        if index is None:
+            return hasattr(dbobj, self.data_attribute_name())
+        else:
+            values = dbobj._values
+            return index < len(values) and values[index] is not _unset
     
     def update_expression(self, dbobj):
         """
@@ -283,7 +368,7 @@ class datatype(property):
             msg = "This attribute has not been retrieved from the database."
             raise AttributeError(msg)
         else:        
-            value = getattr(dbobj, self.data_attribute_name())
+            value = self.get_data(dbobj)
 
             if value is None:
                 return sql.NULL
@@ -299,6 +384,15 @@ class datatype(property):
         return ( not self.isset(dbobj) and \
                      (self.has_default or self.is_set_to_an_expression(dbobj)))
 
+    def __preallocate__(self, dbobjs):
+        """
+        Called with the list of dbobjs that are about to be INSERTed. A
+        datatype that is able to come up with values for itself (like
+        keys generated on the client side) may set them here, all at
+        once, so that they need not be SELECTed after the INSERT.
+        """
+        pass
+
     def __delete__(self, dbobj):
         raise NotImplementedError(
             "Can't delete a database property from a dbobj.")
@@ -399,7 +493,7 @@ class Unicode(string):
             except TypeError:
                 raise TypeError(repr(self) + " " + repr(value))
             
-        setattr(dbobj, self.data_attribute_name(), value)
+        self.set_data(dbobj, value)
 
     def __convert__(self, value):
         if type(value) != UnicodeType:
@@ -470,7 +564,7 @@ class datetime_base(datatype):
             msg = "This attribute has not been retrieved from the database."
             raise AttributeError(msg)
         else:        
-            value = getattr(dbobj, self.data_attribute_name())
+            value = self.get_data(dbobj)
 
             if value is None:
                 return sql.NULL
@@ -674,7 +768,7 @@ class delayed(wrapper):
         self.check_dbobj(dbobj)
             
         if self.isset(dbobj):
-            return getattr(dbobj, self.data_attribute_name())
+            return self.get_data(dbobj)
         else:
             query = sql.select(( self.column, ),
                                dbobj.__view__,
@@ -692,16 +786,16 @@ class delayed(wrapper):
             # representation (t4.orm.util.pickle works that way for instance).
             # So we use the function to do its job and, if we're not supposed
             # to cache the value, *undo* the changes it made on the dbobj.
-            # This presumes that the data_attribute_name() mechanism is used
+            # This presumes that the get_data()/set_data() mechanism is used
             # by __set_from_result__(), which is relatively save, I guess.
             
             self.inside_datatype.__set_from_result__(dbobj.__ds__(),
                                                      dbobj, value)
 
-            ret = getattr(dbobj, self.data_attribute_name())
+            ret = self.get_data(dbobj)
 
-            if not self.cache and hasattr(dbobj, self.data_attribute_name()):
-                delattr(dbobj, self.data_attribute_name())
+            if not self.cache and self.isset(dbobj):
+                self.del_data(dbobj)
 
             return ret
             
@@ -1085,7 +1179,7 @@ class PDomain(Unicode):
         if value is not None and type(value) != UnicodeType:
             value = unicode(value, "idna")
             
-        setattr(dbobj, self.data_attribute_name(), value)
+        self.set_data(dbobj, value)
         
     def __convert__(self, value):
         if type(value) is not UnicodeType:
@@ -1123,11 +1217,86 @@ class PEMail(Unicode):
             return value
         
 
-class pickle(datatype):
+class _encoded:
+    """
+    A value retrieved from the database that has not been decoded by
+    its datatype, yet. See L{lazy_decoding}.
+    """
+    def __init__(self, data):
+        self.data = data
+
+    def __repr__(self):
+        return "<encoded %s>" % repr(self.data)
+    
+class lazy_decoding(object):
+    """
+    Mix-in for datatypes that store serialized Python objects, which may
+    be expensive to decode. The data retrieved from the database is
+    kept as-is and only decoded on first access. If the attribute is
+    written back without having been accessed, the original data is
+    used rather than re-encoding the value.
+
+    Subclasses implement decode() and encode(), which return the
+    serialized data as a string.
+    """
+    def decode(self, data):
+        raise NotImplementedError()
+
+    def encode(self, value):
+        raise NotImplementedError()
+
+    def __set_from_result__(self, ds, dbobj, value):
+        self.remove_expression(dbobj)
+        if value is None:
+            self.set_data(dbobj, None)
+        else:
+            self.set_data(dbobj, _encoded(value))
+
+    def __set__(self, dbobj, value):
+        # Don't decode the old value just to compare it to the new one.
+        if not self.is_decoded(dbobj):
+            self.del_data(dbobj)
+        datatype.__set__(self, dbobj, value)
+        
+    def get_data(self, dbobj, default=_unset):
+        value = datatype.get_data(self, dbobj, default)
+        if isinstance(value, _encoded):
+            value = self.decode(value.data)
+            self.set_data(dbobj, value)
+        return value
+
+    def is_decoded(self, dbobj):
+        """
+        Return False if the value stored in dbobj has been retrieved from
+        the database and not been accessed, yet.
+        """
+        value = datatype.get_data(self, dbobj, None)
+        return not isinstance(value, _encoded)
+
+    def sql_literal(self, dbobj):
+        if not self.isset(dbobj):
+            msg = "This attribute has not been retrieved from the database."
+            raise AttributeError(msg)
+        
+        value = datatype.get_data(self, dbobj)
+        if value is None:
+            return sql.NULL
+        elif isinstance(value, _encoded):
+            data = value.data
+        else:
+            data = self.encode(value)
+
+        if type(data) == UnicodeType:
+            return sql.unicode_literal(data)
+        else:
+            return sql.string_literal(data)
+        
+class pickle(lazy_decoding, datatype):
     """
     This datatype uses Python's pickle module to serialize (nearly)
     arbitrary Python objects into a string representation that is then
     stored in a regular database column. See U{http://localhost/Documentation/Python/Main/lib/module-pickle.html} for details on pickling.
+    The values are un-pickled on first access.
     """
     
     def __init__(self, pickle_protocol=cPickle.HIGHEST_PROTOCOL,
@@ -1142,37 +1311,22 @@ class pickle(datatype):
                          has_default)
         
 
-    def __set_from_result__(self, ds, dbobj, value):
+    def decode(self, data):
         """
         This method takes care of un-pickling the value stored in the datbase.
         """
-        value = cPickle.loads(value)
-        setattr(dbobj, self.data_attribute_name(), value)
+        return cPickle.loads(str(data))
 
+    def encode(self, value):
+        return cPickle.dumps(value, self.pickle_protocol)
+    
     def __convert__(self, value):
         """
         Since we store the Python object 'as is', convert does nothing.
         """
         return value
-
-    def sql_literal(self, dbobj):
-        """
-        This function takes care of converting the Python object into a
-        serialized string representation.
-        """
-        if not self.isset(dbobj):
-            msg = "This attribute has not been retrieved from the database."
-            raise AttributeError(msg)
-        else:        
-            value = getattr(dbobj, self.data_attribute_name())
-
-            if value is None:
-                return sql.NULL
-            else:
-                pickled = cPickle.dumps(value, self.pickle_protocol)
-                return sql.string_literal(pickled)
     
-class python_literal(datatype):
+class python_literal(lazy_decoding, datatype):
     """
     This datatype is for built-in python datastructures. They will be
     represented as a string when stored using repr() and parsed using
@@ -1186,35 +1340,20 @@ class python_literal(datatype):
                  validators=(), has_default=False):
         datatype.__init__(self, column, title, validators, has_default)
 
-    def __set_from_result__(self, ds, dbobj, value):
+    def decode(self, data):
         """
         This method evaulates the value into a Python datastructure.
         """
-        value = eval(value)
-        setattr(dbobj, self.data_attribute_name(), value)
+        return eval(data)
+
+    def encode(self, value):
+        return repr(value)
 
     def __convert__(self, value):
         """
         Since we store the Python object 'as is', convert does nothing.
         """
         return value
-
-    def sql_literal(self, dbobj):
-        """
-        This function takes care of converting the Python object into a
-        serialized string representation.
-        """
-        if not self.isset(dbobj):
-            msg = "This attribute has not been retrieved from the database."
-            raise AttributeError(msg)
-        else:        
-            value = getattr(dbobj, self.data_attribute_name())
-
-            if value is None:
-                return sql.NULL
-            else:
-                r = repr(value)
-                return sql.string_literal(r)
     
 class path(datatype):
     """
@@ -1236,7 +1375,7 @@ class path(datatype):
         This method takes care of un-pickling the value stored in the datbase.
         """
         value = tuple(split(value, "/"))
-        setattr(dbobj, self.data_attribute_name(), value)
+        self.set_data(dbobj, value)
 
     def __convert__(self, value):
         """
@@ -1258,7 +1397,7 @@ class path(datatype):
             msg = "This attribute has not been retrieved from the database."
             raise AttributeError(msg)
         else:        
-            value = getattr(dbobj, self.data_attribute_name())
+            value = self.get_data(dbobj)
 
             if value is None:
                 return sql.NULL
@@ -40,7 +40,7 @@ from t4 import sql
 import keys
 from datasource import datasource_base
 from exceptions import *
-from datatypes import datatype
+from datatypes import datatype, _unset
 from relationships import relationship
 
 class result:
@@ -75,7 +75,8 @@ class result:
 
         if getattr(self.ds, "no_fetchone", False):
             self.rows = self.cursor.fetchall()
-            self.rows.reverse()            
+            self.rows.reverse()
+            self.rowcount = len(self.rows)
 
     def __iter__(self):
         return self
@@ -98,6 +99,9 @@ class result:
     fetchone = next
 
     def __len__(self):
+        if hasattr(self, "rows"):
+            return self.rowcount
+        
         ret = self.cursor.rowcount
         if ret == -1: raise Exception("No query has been run, yet.")        
         return ret
@@ -105,7 +109,7 @@ class result:
     def empty(self):
         return len(self) == 0
     
-    def count(self):
+    def count(self, **kw):
         """
         This is a helper function that will perform a query as
 
@@ -117,6 +121,9 @@ class result:
 
         This can't be called __len__(), because then it is used by
         list() and yields a superflous SELECT query.
+
+        The approximate and threshold keyword parameters work as for
+        L{datasource_base.count()}.
         """
         if not isinstance(self.select, sql.select):
             raise TypeError("result.count() can only work if the select was a"
@@ -125,6 +132,13 @@ class result:
         where = filter(lambda clause: isinstance(clause, (sql.where,
                                                           sql.left_join)),
                        self.select.clauses)
+
+        if kw.get("approximate", False):
+            count = self.ds.approximate_count(self.select.relations, where,
+                                              kw.get("threshold", None))
+            if count is not None:
+                return count
+            
         count_select = sql.select(sql.expression("COUNT(*)"),
                                   self.select.relations,
                                   *where)
@@ -134,6 +148,25 @@ class result:
     count_all = count
 
 
+class _compact_primary_key(object):
+    """
+    Compact dbclasses can't keep the per-object primary key in the
+    instance's __dict__, because they don't want one. This descriptor
+    returns the dbclass' primary key definition on class level and the
+    dbobject's L{keys.primary_key} instance, once there is one.
+    """
+    def __init__(self, definition):
+        self.definition = definition
+
+    def __get__(self, dbobj, owner=None):
+        if dbobj is None:
+            return self.definition
+        else:
+            return getattr(dbobj, "_primary_key_object", self.definition)
+
+    def __set__(self, dbobj, value):
+        dbobj._primary_key_object = value
+
     
 class dbobject(object):
     """
@@ -170,16 +203,61 @@ class dbobject(object):
     
     @cvar __schema__: String containing the name of the schema this dbclass'
       relatin resides in.    
+
+    @cvar __compact__: If set to True, the metaclass will give this
+      dbclass __slots__ for the dbobject's bookkeeping and store the
+      dbproperties' values in a single list indexed by the datatypes
+      rather than as individual instance attributes. A dbobject
+      retrieved from the database will not need an instance __dict__
+      this way, which saves a lot of memory for caches that hold a
+      great number of them. Subclasses of compact dbclasses are
+      compact, too.
     """
 
     __primary_key__ = "id"
     __result__ = result
+    __compact__ = False
+
+    # Instance attributes a compact dbobject keeps in __slots__.
+    _compact_slots = ( "_ds", "_is_stored", "_values",
+                       "__changed_columns__", "_primary_key_object", )
     
     class __metaclass__(type):
         def __new__(cls, name, bases, dict):
+            compact = dict.get("__compact__", False) or \
+                      True in [ getattr(base, "__compact__", False)
+                                for base in bases ]
+            
+            if name != "dbobject" and compact:
+                have = set()
+                for base in bases:
+                    for klass in base.__mro__:
+                        have.update(klass.__dict__.get("__slots__", ()))
+                        
+                dict["__slots__"] = tuple(
+                    [ a for a in dbobject._compact_slots if a not in have ])
+
+                if not isinstance(dict.get("__primary_key__"),
+                                  _compact_primary_key):
+                    for d in [ dict, ] + [ base.__dict__ for base in bases ]:
+                        if d.has_key("__primary_key__"):
+                            definition = d["__primary_key__"]
+                            break
+                    else:
+                        definition = bases[0].__primary_key__
+
+                    if isinstance(definition, _compact_primary_key):
+                        definition = definition.definition
+                        
+                    dict["__primary_key__"] = _compact_primary_key(definition)
+                    
             ret = type.__new__(cls, name, bases, dict)
             
             if name != "dbobject":
+                if compact:
+                    ret.__compact__ = True
+                    ret.__value_slots__ = {}
+                    
                 if not hasattr(ret, "__relation__") or \
                        getattr(ret.__relation__, "__autocreated__", False):
                     # __relation__ which are set by this procedure
@@ -247,6 +325,9 @@ class dbobject(object):
         inserted yet and might need a ds to construct stuff.
         """
         self.__changed_columns__ = {}
+
+        if self.__compact__:
+            self._values = [ _unset, ] * len(self.__value_slots__)
         
         if kw.has_key("__ds"):
             __ds = kw["__ds"]
@@ -275,6 +356,17 @@ class dbobject(object):
             self.__primary_key__ = keys.primary_key(self)
 
 
+    @classmethod
+    def __value_slot__(cls, name):
+        """
+        Return the index into a compact dbobject's value store for the
+        data attribute called name, allocating a new one if needed.
+        """
+        slots = cls.__value_slots__
+        if not slots.has_key(name):
+            slots[name] = len(slots)
+        return slots[name]
+
     def __register_change__(self, dbproperty):
         if self.__is_stored__():
             self._ds.__register_change_of__(self)
@@ -552,6 +644,38 @@ class dbobject(object):
                 if not ignore_extra_keys:
                     raise NoSuchAttributeOrColumn(name)
 
+    @classmethod
+    def __validate_batch__(cls, rows, ignore_extra_keys=False):
+        """
+        Construct dbobjs of this class from a sequence of dicts
+        (attribute names to values), as for a bulk import. Rows that
+        don't pass the validators (or can't be converted to the
+        attributes' types) do not stop the process but are reported.
+        Since the validators' caches are shared by all rows, repeated
+        values are only validated once.
+
+        @returns: A pair of lists: the valid dbobjs and ( index,
+           exception, ) pairs, one for each invalid attribute value,
+           index being the row's index in rows.
+        """
+        dbobjs = []
+        errors = []
+        for index, row in enumerate(rows):
+            dbobj = cls()
+            valid = True
+            for name, value in row.items():
+                try:
+                    dbobj.__update_from_dict__({ name: value, },
+                                               ignore_extra_keys)
+                except (ValidatorException, ValueError, TypeError,), e:
+                    errors.append( ( index, e, ) )
+                    valid = False
+
+            if valid:
+                dbobjs.append(dbobj)
+
+        return dbobjs, errors
+
     def __as_dict__(self, include_relationships=False):
         """
         Return a representation of this dbobject as dictionary. 
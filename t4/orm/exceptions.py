@@ -146,3 +146,9 @@ class IllegalForeignKey(ORMException):
 class PasswordsDontMatch(ORMException):
     pass
 
+
+class ShardKeyNotKnown(ORMException):
+    """
+    Raised by the L{t4.orm.sharding.sharded_datasource} if a dbobj
+    can't be routed to a shard, because its shard key is not set.
+    """
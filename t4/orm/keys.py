@@ -157,7 +157,7 @@ class key:
             msg = "%s not a single column key" % repr(self.key_columns)
             raise SimplePrimaryKeyNeeded(msg)
         else:
-            return self.values().next()
+            return self.values()[0]
 
     def values(self):
         """
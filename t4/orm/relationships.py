@@ -37,7 +37,7 @@ from types import *
 # t4
 from t4 import sql
 import keys
-from datatypes import datatype
+from datatypes import datatype, _unset
 from exceptions import *
 
 
@@ -127,7 +127,7 @@ class _2many(relationship):
         def select(self, *clauses):
             raise NotImplementedError()
 
-        def len(self, *claises):
+        def len(self, *clauses, **kw):
             raise NotImplementedError()
                         
         def append(self, *new_child_objects):
@@ -250,16 +250,17 @@ class one2many(_2many):
             clauses = self.add_where(clauses)
             return self.ds().select(self.child_class(), *clauses)
 
-        def len(self, *clauses):
+        def len(self, *clauses, **kw):
             """
             Return the number of child objects that would be returned by
             the select() method using clauses. Note that a call to this
             function will yield a SQL query seperate from the one used to
             actually retrieve the dbobjects. (See datasource_base.count() for
-            details)
+            details, including the approximate and threshold keyword
+            parameters)
             """
             clauses = self.add_where(clauses)
-            return self.ds().count(self.child_class(), *clauses)
+            return self.ds().count(self.child_class(), *clauses, **kw)
 
         def append(self, *new_child_objects):
             """
@@ -349,18 +350,25 @@ class many2many(_2many):
                 self.child_class(), query)
                                                   
 
-        def len(self, *clauses):
+        def len(self, *clauses, **kw):
             """
             Return the number of child objects associated with a parent.
             You may supply a where clause. The same things apply as for the
-            where clause for select(), see above.
+            where clause for select(), see above. The approximate and
+            threshold keyword parameters work as for
+            datasource_base.count().
             """
             clauses = self.add_where(clauses)
+            relations = ( self.relationship.link_relation,
+                          self.child_class().__view__, )
+            
+            if kw.get("approximate", False):
+                len = self.ds().approximate_count(relations, clauses,
+                                                  kw.get("threshold", None))
+                if len is not None:
+                    return len
             
-            query = sql.select("COUNT(*)",
-                               ( self.relationship.link_relation,
-                                 self.child_class().__view__, ),
-                               *clauses)
+            query = sql.select("COUNT(*)", relations, *clauses)
             
             len, = self.ds().query_one(query)
             return len
@@ -597,6 +605,8 @@ class many2many(_2many):
         
 
 class many2one(relationship):
+    _cache_index = None
+    
     def __init__(self, child_class, 
                  child_key=None, foreign_key=None, column=None,
                  title=None, has_default=None,
@@ -629,7 +639,7 @@ class many2one(relationship):
         self.cache = cache
         
     def __set_from_result__(self, ds, dbobj, value):
-        setattr(dbobj, self.data_attribute_name(), value)
+        self.set_data(dbobj, value)
 
     def __init_dbclass__(self, dbclass, attribute_name):
         if self.column is None and self.foreign_key is None:
@@ -643,13 +653,46 @@ class many2one(relationship):
         
         if self.foreign_key is not None:
             self.column = None
-            
 
+        # Compact dbobjects keep the cached child object in their value
+        # store, too.
+        if self._value_index is not None:
+            self._cache_index = dbclass.__value_slot__(
+                self.data_attribute_name() + "_cache")
+        else:
+            self._cache_index = None
+
+    def _cached(self, dbobj):
+        if self._cache_index is None:
+            return getattr(dbobj, self.data_attribute_name() + "_cache",
+                           _unset)
+        else:
+            values = dbobj._values
+            if self._cache_index < len(values):
+                return values[self._cache_index]
+            else:
+                return _unset
+
+    def _set_cache(self, dbobj, value):
+        if self._cache_index is None:
+            setattr(dbobj, self.data_attribute_name() + "_cache", value)
+        else:
+            values = dbobj._values
+            if self._cache_index >= len(values):
+                values.extend([_unset] * (self._cache_index-len(values)+1))
+            values[self._cache_index] = value
+
+    def _del_cache(self, dbobj):
+        if self._cache_index is None:
+            if hasattr(dbobj, self.data_attribute_name() + "_cache"):
+                delattr(dbobj, self.data_attribute_name() + "_cache")
+        elif self._cache_index < len(dbobj._values):
+            dbobj._values[self._cache_index] = _unset
 
     def __get__(self, dbobj, owner=None):
-        if self.cache and \
-               hasattr(dbobj, self.data_attribute_name() + "_cache"):
-            return getattr(dbobj, self.data_attribute_name() + "_cache")
+        if self.cache:
+            ret = self._cached(dbobj)
+            if ret is not _unset: return ret
         
         ds = dbobj.__ds__()
         
@@ -695,7 +738,7 @@ class many2one(relationship):
                                         "exaxtly one child object")
 
         if self.cache:
-            setattr(dbobj, self.data_attribute_name() + "_cache", ret)
+            self._set_cache(dbobj, ret)
 
         return ret
 
@@ -715,8 +758,7 @@ class many2one(relationship):
                 for prop in foreign_key.my_attributes():
                     prop.__set__(dbobj, None)
                     
-            if hasattr(dbobj, self.data_attribute_name() + "_cache"):
-                delattr(dbobj, self.data_attribute_name() + "_cache")
+            self._del_cache(dbobj)
         else:            
             if not isinstance(value, self.child_class):
                 raise TypeError("A many2one attribute can only be set to " + \
@@ -740,7 +782,7 @@ class many2one(relationship):
                     
 
             if self.cache:
-                setattr(dbobj, self.data_attribute_name() + "_cache", value)
+                self._set_cache(dbobj, value)
 
 
     def isset(self, dbobj):
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+__docformat__ = "epytext en"
+
+"""
+Horizontal sharding: a L{sharded_datasource} wraps several adapter
+datasources (the shards) and routes operations on dbclasses to them
+by a shard key::
+
+   ds = sharded_datasource([ datasource("adapter=pgsql host=db1"),
+                             datasource("adapter=pgsql host=db2"), ])
+   ds.shard_key(order, "customer_id")
+
+   ds.insert(order(customer_id=17, ...))   # goes to one shard
+   o = ds.select_by_primary_key(order, 4711) # asks all shards
+   recent = ds.select(order, sql.orderby("ctime", dir="DESC"),
+                      sql.limit(10))         # scatter-gather
+
+dbobjs belong to the shard they have been selected from or inserted
+into, so updates go there on their own, and commit() commits on all
+shards. Note that this is not a distributed transaction: if the commit
+on one shard fails, the others may have committed already.
+
+Operations that can't be routed to a single shard are run on all of
+them in parallel threads, one per shard. Each shard datasource is only
+ever used by one thread at a time, so this is safe with the regular
+adapters. Results are merged, and sorted and limited again if the
+clauses call for it.
+"""
+
+# Python
+import sys, threading, zlib
+from types import *
+
+# t4
+from t4 import sql
+from exceptions import *
+import keys
+
+def default_shard_function(value, shard_count):
+    """
+    Map a shard key value to a shard index: integers modulo the number
+    of shards, other values by their CRC32. Unlike hash(), this is
+    stable across processes and platforms.
+    """
+    if type(value) in ( IntType, LongType, ):
+        return int(value % shard_count)
+    else:
+        if type(value) == UnicodeType:
+            value = value.encode("utf-8")
+        else:
+            value = str(value)
+        return (zlib.crc32(value) & 0xffffffff) % shard_count
+
+def scatter(function, shards):
+    """
+    Call function(shard) for each of shards in a thread of its own and
+    return the results in the order of shards. If any of the calls
+    raises an exception, the first one is re-raised here.
+    """
+    if len(shards) == 1:
+        return [ function(shards[0]), ]
+    
+    results = [ None, ] * len(shards)
+    errors = [ None, ] * len(shards)
+
+    def run(index, shard):
+        try:
+            results[index] = function(shard)
+        except:
+            errors[index] = sys.exc_info()
+
+    threads = [ threading.Thread(target=run, args=( index, shard, ))
+                for index, shard in enumerate(shards) ]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    for error in errors:
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    return results
+
+class _shard_key:
+    def __init__(self, dbclass, attribute, function):
+        self.dbclass = dbclass
+        self.attribute = attribute
+        self.function = function
+        
+        # If the shard key is part of the primary key, we can route
+        # select_by_primary_key() and friends.
+        self.primary_key_index = None
+        if dbclass.__primary_key__ is not None:
+            names = list(keys.primary_key(dbclass).attribute_names())
+            if attribute in names:
+                self.primary_key_index = names.index(attribute)
+
+    def value_from_primary_key(self, key):
+        if self.primary_key_index is None:
+            return None
+        elif type(key) == TupleType:
+            return key[self.primary_key_index]
+        else:
+            return key
+
+class sharded_datasource:
+    """
+    Route operations on dbclasses to a number of shard datasources.
+    A dbclass must be registered with shard_key() before it can be
+    used with a sharded_datasource.
+    """
+    def __init__(self, shards):
+        """
+        @param shards: A list of datasources. The order matters to the
+           shard functions, it must be the same in all processes using
+           the shards.
+        """
+        if len(shards) == 0:
+            raise ValueError("A sharded_datasource needs at least one shard.")
+        
+        self.shards = list(shards)
+        self._shard_keys = {}
+
+    def shard_key(self, dbclass, attribute=None, function=None):
+        """
+        Set the shard key for dbclass.
+
+        @param attribute: The name of the attribute the shard is
+           determined by. It defaults to the primary key, which must be
+           a single attribute key then.
+        @param function: A function that is passed the attribute's value
+           and the number of shards and returns the index of the shard
+           the dbobj lives on. Defaults to L{default_shard_function}.
+        """
+        if attribute is None:
+            attribute = keys.primary_key(dbclass).attribute_name()
+        else:
+            # Raises an exception if there is no such attribute.
+            dbclass.__dbproperty__(attribute)
+
+        if function is None:
+            function = default_shard_function
+
+        self._shard_keys[dbclass] = _shard_key(dbclass, attribute, function)
+
+    def _key(self, dbclass):
+        try:
+            return self._shard_keys[dbclass]
+        except KeyError:
+            raise ORMException("No shard key set for %s" % repr(dbclass))
+
+    def shard_for(self, dbclass, value):
+        """
+        Return the shard datasource for dbobjs of dbclass whoes shard
+        key attribute is set to value.
+        """
+        index = self._key(dbclass).function(value, len(self.shards))
+        return self.shards[index]
+
+    def shard_of(self, dbobj):
+        """
+        Return the shard datasource dbobj belongs on.
+        """
+        key = self._key(dbobj.__class__)
+        dbprop = dbobj.__dbproperty__(key.attribute)
+
+        if not dbprop.isset(dbobj):
+            # Client-side generated keys may be assigned right away.
+            dbprop.__preallocate__([ dbobj, ])
+        
+        if not dbprop.isset(dbobj):
+            raise ShardKeyNotKnown("Shard key %s of %s is not set." % (
+                    key.attribute, repr(dbobj), ))
+
+        return self.shard_for(dbobj.__class__, getattr(dbobj, key.attribute))
+        
+    def _shard_for_primary_key(self, dbclass, primary_key):
+        value = self._key(dbclass).value_from_primary_key(primary_key)
+        if value is None:
+            return None
+        else:
+            return self.shard_for(dbclass, value)
+        
+    def insert(self, dbobj, dont_select=False):
+        """
+        INSERT dbobj into its shard. The shard key must be set.
+        """
+        self.shard_of(dbobj).insert(dbobj, dont_select)
+
+    def register_new(self, dbobj):
+        """
+        Schedule dbobj to be INSERTed into its shard on the next flush.
+        """
+        self.shard_of(dbobj).register_new(dbobj)
+
+    def select_by_primary_key(self, dbclass, key):
+        """
+        Select a dbobj of dbclass by its primary key. If the shard key is
+        not part of the primary key, all shards are asked.
+        """
+        shard = self._shard_for_primary_key(dbclass, key)
+        
+        if shard is not None:
+            return shard.select_by_primary_key(dbclass, key)
+        else:
+            for dbobj in scatter(lambda shard: shard.select_by_primary_key(
+                                                       dbclass, key),
+                                 self.shards):
+                if dbobj is not None:
+                    return dbobj
+            return None
+
+    def delete_by_primary_key(self, dbclass, key):
+        """
+        DELETE a row of dbclass by its primary key. If the shard key is
+        not part of the primary key, the DELETE is run on all shards.
+        """
+        shard = self._shard_for_primary_key(dbclass, key)
+        
+        if shard is not None:
+            shard.delete_by_primary_key(dbclass, key)
+        else:
+            scatter(lambda shard: shard.delete_by_primary_key(dbclass, key),
+                    self.shards)
+        
+    def select(self, dbclass, *clauses, **kw):
+        """
+        SELECT dbobjs of dbclass from all shards or, if the shard_key
+        keyword parameter is given, from the shard that shard key value
+        belongs to. 
+
+        On all shards, the results are merged. If there is an ORDER BY
+        clause, the result is sorted by the dbclass attributes of the
+        columns in it, each in its own direction: a column given as a
+        string may carry an ASC or DESC suffix and the clause's dir
+        applies to its last column, as in SQL. LIMIT and OFFSET are
+        applied to the merged result, each shard is asked for LIMIT +
+        OFFSET rows.
+
+        As opposed to the datasources' select(), this returns a list.
+        """
+        if kw.has_key("shard_key"):
+            shard = self.shard_for(dbclass, kw["shard_key"])
+            return [ dbobj for dbobj in shard.select(dbclass, *clauses) ]
+        
+        limit, offset, order_by, shard_clauses = None, 0, None, []
+        for clause in clauses:
+            if isinstance(clause, sql.limit):
+                limit = clause._limit
+            elif isinstance(clause, sql.offset):
+                offset = clause._offset
+            else:
+                if isinstance(clause, sql.order_by):
+                    order_by = clause
+                shard_clauses.append(clause)
+
+        if limit is not None:
+            shard_clauses.append(sql.limit(int(limit + offset)))
+
+        # Find the attributes to sort by before we bother the backends.
+        if order_by is not None:
+            sort_attributes = self._sort_attributes(dbclass, order_by)
+            
+        results = scatter(lambda shard: [ dbobj for dbobj in shard.select(
+                                                    dbclass, *shard_clauses) ],
+                          self.shards)
+
+        ret = []
+        for result in results: ret.extend(result)
+
+        if order_by is not None:
+            # Python's sort is stable, so sorting by the last column
+            # first leaves the rows ordered by all of them.
+            for attribute, descending in reversed(sort_attributes):
+                ret.sort(key=lambda dbobj: getattr(dbobj, attribute),
+                         reverse=descending)
+
+        if limit is not None:
+            ret = ret[offset:offset+limit]
+        elif offset:
+            ret = ret[offset:]
+
+        return ret
+
+    def _sort_attributes(self, dbclass, order_by):
+        """
+        Return a list of pairs as ( attribute_name, descending, ) for
+        the columns of order_by.
+        """
+        by_column = {}
+        for dbprop in dbclass.__dbproperties__(include_relationships=False):
+            if isinstance(dbprop.column, sql.column):
+                by_column[dbprop.column.name()] = dbprop.attribute_name
+            
+        ret = []
+        for index, column in enumerate(order_by._columns):
+            descending = False
+            
+            if isinstance(column, sql.column):
+                column = column.name()
+            elif type(column) == StringType:
+                parts = column.split()
+                if len(parts) == 2 and parts[1].upper() in ( "ASC", "DESC", ):
+                    column = parts[0]
+                    descending = ( parts[1].upper() == "DESC" )
+            else:
+                column = None
+
+            if index == len(order_by._columns) - 1 and \
+                   order_by._dir is not None:
+                descending = ( order_by._dir.upper() == "DESC" )
+
+            if not by_column.has_key(column):
+                raise ValueError("Can't merge results ordered by %s, "
+                                 "it is not a column of %s." % (
+                        repr(column), dbclass.__name__, ))
+            
+            ret.append( ( by_column[column], descending, ) )
+
+        return ret
+    
+    def select_one(self, dbclass, *clauses, **kw):
+        """
+        Like select(), but return the first dbobj or None.
+        """
+        clauses = [ clause for clause in clauses
+                    if not isinstance(clause, sql.limit) ] + [ sql.limit(1), ]
+        result = self.select(dbclass, *clauses, **kw)
+        if len(result) == 0:
+            return None
+        else:
+            return result[0]
+
+    def count(self, dbclass, *clauses, **kw):
+        """
+        Return the sum of datasource.count() on all shards. The keyword
+        parameters are passed on.
+        """
+        return sum(scatter(lambda shard: shard.count(dbclass, *clauses, **kw),
+                           self.shards))
+
+    def flush_updates(self):
+        scatter(lambda shard: shard.flush_updates(), self.shards)
+        
+    def commit(self):
+        """
+        Commit on all shards (one after the other, see above).
+        """
+        for shard in self.shards:
+            shard.commit()
+        
+    def rollback(self):
+        for shard in self.shards:
+            shard.rollback()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+__docformat__ = "epytext en"
+
+"""
+The unit of work keeps track of the dbobjects a datasource needs to
+write to the database: new ones that are to be INSERTed, stored ones
+that have been modified and need to be UPDATEd and those that are to
+be DELETEd. On flush() it writes all of them in one go, ordered by the
+dependencies between the dbclasses that are expressed through their
+many2one and one2many relationships:
+
+   - INSERTs for the referenced (parent) dbclasses come first,
+   - UPDATEs come next in the order the changes were registered,
+   - DELETEs come last, dependent (child) dbclasses first.
+
+Objects of the same dbclass are written using as few statements as
+possible: new objects that have the same set of columns and don’t
+need to SELECT anything after the INSERT are combined into
+multi-row INSERTs, deleted objects into one DELETE per dbclass.
+"""
+
+# t4
+from t4 import sql
+from relationships import many2one, one2many
+from exceptions import *
+
+class unit_of_work:
+    """
+    Instantiated by L{t4.orm.datasource.datasource_base}, one for each
+    datasource.
+    """
+
+    # The maximum number of rows combined in one INSERT or DELETE.
+    batch_size = 500
+
+    def __init__(self, ds):
+        self.ds = ds
+        self._flushing = False
+        self.clear()
+
+    def clear(self):
+        """
+        Forget about all pending changes.
+        """
+        self._new = []
+        self._dirty = []
+        self._deleted = []
+
+        # Maps id(dbobj) to 'new', 'dirty' or 'deleted'. I'm using the
+        # id() rather than the dbobj itself, because dbobject.__eq__()
+        # compares primary keys, which may not be set, yet.
+        self._states = {}
+
+    def __len__(self):
+        return len(self._states)
+
+    def register_new(self, dbobj):
+        if dbobj.__is_stored__():
+            raise ObjectAlreadyInserted(repr(dbobj))
+
+        state = self._states.get(id(dbobj), None)
+        if state is None:
+            self._states[id(dbobj)] = "new"
+            self._new.append(dbobj)
+        elif state == "new":
+            # Already queued.
+            pass
+        elif state == "deleted":
+            raise ValueError("Can't re-insert a dbobj that has been "
+                             "scheduled for deletion: %s" % repr(dbobj))
+
+    def register_dirty(self, dbobj):
+        if not self._states.has_key(id(dbobj)):
+            self._states[id(dbobj)] = "dirty"
+            self._dirty.append(dbobj)
+
+    def register_deleted(self, dbobj):
+        if dbobj.__primary_key__ is None:
+            raise NoPrimaryKey("Can't DELETE a %s by its primary key." % \
+                               dbobj.__class__.__name__)
+
+        state = self._states.get(id(dbobj), None)
+        if state == "new":
+            # It never made it to the database, so there is nothing
+            # to delete. It must leave the queue, too, or registering it
+            # as new again would INSERT it twice.
+            del self._states[id(dbobj)]
+            self._new = [ other for other in self._new
+                          if other is not dbobj ]
+        elif state != "deleted":
+            self._states[id(dbobj)] = "deleted"
+            self._deleted.append(dbobj)
+
+    def flush(self, cursor, select_after_update=True):
+        """
+        Write all pending changes to the database using cursor.
+        """
+        if self._flushing or len(self._states) == 0:
+            return
+
+        def pending(dbobjs, state):
+            return [ dbobj for dbobj in dbobjs
+                     if self._states.get(id(dbobj)) == state ]
+
+        new = pending(self._new, "new")
+        dirty = pending(self._dirty, "dirty")
+        deleted = pending(self._deleted, "deleted")
+
+        order = dependency_order(classes_of(new + deleted))
+
+        # The statements may be queued by the datasource and fail only
+        # when they are sent. In that case the dbobjs must not look as
+        # if they had been written.
+        changed = [ ( dbobj, dict(dbobj.__changed_columns__), )
+                    for dbobj in dirty + deleted ]
+
+        self._flushing = True
+        try:
+            for dbclass in order:
+                self.insert(cursor, [ dbobj for dbobj in new
+                                      if dbobj.__class__ is dbclass ])
+
+            for dbobj in dirty:
+                dbobj.__perform_updates__(cursor, select_after_update)
+
+            order.reverse()
+            for dbclass in order:
+                self.delete(cursor, dbclass,
+                            [ dbobj for dbobj in deleted
+                              if dbobj.__class__ is dbclass ])
+
+            self.ds.sync_pipeline()
+        except:
+            for dbobj in new:
+                dbobj._is_stored = False
+            for dbobj in deleted:
+                dbobj._is_stored = True
+            for dbobj, changed_columns in changed:
+                dbobj.__changed_columns__.update(changed_columns)
+            raise
+        finally:
+            self._flushing = False
+
+        self.clear()
+
+    def insert(self, cursor, dbobjs):
+        """
+        INSERT dbobjs, which must all be of the same dbclass.
+        """
+        batch = []
+        batch_columns = None
+
+        if len(dbobjs) > 0:
+            for dbprop in dbobjs[0].__dbproperties__():
+                dbprop.__preallocate__(dbobjs)
+
+        for dbobj in dbobjs:
+            if dbobj.__primary_key__ is not None and \
+                   True in [ dbprop.__select_after_insert__(dbobj)
+                             for dbprop in dbobj.__dbproperties__() ]:
+                # These need their own INSERT, followed by a SELECT. The
+                # datasource knows how to do that.
+                self.insert_batch(cursor, batch_columns, batch)
+                batch = []
+
+                self.ds.insert(dbobj)
+            else:
+                columns, values = self.ds.insert_columns_and_values(dbobj)
+
+                if columns != batch_columns or len(batch) >= self.batch_size:
+                    self.insert_batch(cursor, batch_columns, batch)
+                    batch = []
+                    batch_columns = columns
+
+                batch.append( (dbobj, values,) )
+
+        self.insert_batch(cursor, batch_columns, batch)
+
+    def insert_batch(self, cursor, columns, batch):
+        if len(batch) > 0:
+            relation = batch[0][0].__relation__
+            values = [ values for dbobj, values in batch ]
+            cursor.execute(sql.insert(relation, columns, *values))
+
+            for dbobj, values in batch:
+                dbobj.__insert__(self.ds)
+
+    def delete(self, cursor, dbclass, dbobjs):
+        """
+        DELETE dbobjs, which must all be of dbclass, using as few DELETE
+        statements as possible.
+        """
+        for start in range(0, len(dbobjs), self.batch_size):
+            batch = dbobjs[start:start+self.batch_size]
+            keys = [ dbobj.__primary_key__ for dbobj in batch ]
+
+            if len(keys[0].key_attributes) == 1:
+                attribute = keys[0].attribute()
+                where = sql.where(sql.in_(attribute.column,
+                                          [ key.value() for key in keys ],
+                                          attribute.sql_literal_class))
+            else:
+                where = sql.where.or_(*[ key.where() for key in keys ])
+
+            cursor.execute(sql.delete(dbclass.__relation__, where))
+
+            for dbobj in batch:
+                dbobj._is_stored = False
+                dbobj.__changed_columns__.clear()
+
+
+def classes_of(dbobjs):
+    """
+    Return the dbclasses of dbobjs in the order of their first
+    appearance.
+    """
+    ret = []
+    for dbobj in dbobjs:
+        if dbobj.__class__ not in ret:
+            ret.append(dbobj.__class__)
+    return ret
+
+def dependency_order(dbclasses):
+    """
+    Return a list of dbclasses ordered so that each of them comes after
+    those it refers to through a many2one relationship (or that refer to
+    it through a one2many relationship). Classes that are part of a
+    reference cycle retain their original order at the end of the list.
+    """
+    depends_on = {}
+    for dbclass in dbclasses:
+        depends_on[dbclass] = set()
+
+    def matching(cls):
+        return [ dbclass for dbclass in dbclasses
+                 if issubclass(dbclass, cls) ]
+
+    for dbclass in dbclasses:
+        for dbprop in dbclass.__dbproperties__():
+            if isinstance(dbprop, many2one):
+                for other in matching(dbprop.child_class):
+                    if other is not dbclass:
+                        depends_on[dbclass].add(other)
+            elif isinstance(dbprop, one2many):
+                for other in matching(dbprop.child_class):
+                    if other is not dbclass:
+                        depends_on[other].add(dbclass)
+
+    ret = []
+    remaining = list(dbclasses)
+    while remaining:
+        ready = [ dbclass for dbclass in remaining
+                  if not depends_on[dbclass].difference(ret) ]
+        if not ready:
+            # A reference cycle.
+            ret.extend(remaining)
+            break
+
+        for dbclass in ready:
+            ret.append(dbclass)
+            remaining.remove(dbclass)
+
+    return ret
@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english"; -*-
+
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006-12 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Benchmark suite for the DSC parser in t4.psg::
+
+   python -m t4.psg.benchmark --pages=5000
+   python -m t4.psg.benchmark --file=printjob.ps --only=parse
+
+Unless a PostScript file is given, the benchmarks run on a synthetic
+multi-page DSC document written to a temporary file: a header, a
+prolog with a couple of resources, a setup section and PAGES pages of
+LINES lines of PostScript each. For each benchmark the best of the
+repeated runs is reported as megabytes and pages per second.
+
+The write benchmark creates a document of PAGES pages in memory, each
+with nested boxes containing LINES lines in total, and writes it to a
+temporary file. It also reports the number of string fragments
+written and the number of chunks they were written in.
+"""
+
+import sys, os, time, optparse, tempfile
+
+from t4.psg.util import mm
+from t4.psg.util.misc import line_iterator
+from t4.psg.util.file_like_buffer import chunk_writer
+from t4.psg.document.dsc import dsc_document
+from t4.psg.drawing.box import box
+
+def synthetic_document(fp, pages, lines):
+    """
+    Write a DSC document with the given number of pages and lines of
+    PostScript per page to fp.
+    """
+    print >> fp, "%!PS-Adobe-3.0"
+    print >> fp, "%%Creator: t4.psg.benchmark"
+    print >> fp, "%%Title: Benchmark"
+    print >> fp, "%%Pages:", pages
+    print >> fp, "%%BoundingBox: 0 0 595 842"
+    print >> fp, "%%DocumentSuppliedResources: procset bench_a 1.0 0"
+    print >> fp, "%%+ procset bench_b 1.0 0"
+    print >> fp, "%%EndComments"
+    print >> fp, "%%BeginProlog"
+    for name in ( "bench_a", "bench_b", ):
+        print >> fp, "%%BeginResource: procset", name, "1.0 0"
+        for i in range(50):
+            print >> fp, "/%s_%i { %i %i moveto } bind def" % (name, i, i, i)
+        print >> fp, "%%EndResource"
+    print >> fp, "%%EndProlog"
+    print >> fp, "%%BeginSetup"
+    print >> fp, "<< /PageSize [595 842] >> setpagedevice"
+    print >> fp, "%%EndSetup"
+
+    for page in range(1, pages+1):
+        print >> fp, "%%%%Page: %i %i" % ( page, page, )
+        print >> fp, "%%PageBoundingBox: 0 0 595 842"
+        print >> fp, "%%BeginPageSetup"
+        print >> fp, "save"
+        print >> fp, "%%EndPageSetup"
+        for i in range(lines):
+            print >> fp, "%i %i moveto (Line %i of page %i) show" % (
+                72, 800 - i % 700, i, page, )
+        print >> fp, "restore showpage"
+        print >> fp, "%%PageTrailer"
+
+    print >> fp, "%%Trailer"
+    print >> fp, "%%EOF"
+
+def generated_document(pages, lines):
+    """
+    Return a dsc_document the way psg programs create them: each page
+    with a canvas containing nested boxes of LINES lines of PostScript
+    written with print.
+    """
+    document = dsc_document("Benchmark")
+    for i in range(pages):
+        page = document.page()
+        canvas = page.canvas(margin=mm(18))
+        parent = canvas
+        for j in range(5):
+            child = box(parent, 10, 10, parent.w() - 20, parent.h() - 20)
+            parent.append(child)
+            parent = child
+            
+            for k in range(lines / 5):
+                print >> child, "%i %i moveto (Line %i) show" % ( 72, k, k, )
+
+    return document
+        
+def bench_lines(fp):
+    fp.seek(0)
+    for line in line_iterator(fp):
+        pass
+
+def bench_comments(fp):
+    fp.seek(0)
+    lines = line_iterator(fp)
+    try:
+        while True:
+            lines.skip_to("%%")
+    except StopIteration:
+        pass
+
+def bench_parse(fp):
+    fp.seek(0)
+    return dsc_document.from_file(fp)
+
+def bench_parse_lazily(fp):
+    fp.seek(0)
+    return dsc_document.from_file(fp, lazy=True)
+
+def bench_write(( document, fp, )):
+    fp.seek(0)
+    fp.truncate()
+    writer = chunk_writer(fp)
+    document.write_to(writer)
+    writer.flush()
+    return writer
+
+def input_file(fp, options):
+    return fp
+
+def generated(fp, options):
+    return ( generated_document(options.pages, options.lines),
+             tempfile.TemporaryFile(), )
+
+benchmarks = ( ( "line_iterator", input_file, bench_lines, ),
+               ( "skip_to_comments", input_file, bench_comments, ),
+               ( "parse", input_file, bench_parse, ),
+               ( "parse_lazily", input_file, bench_parse_lazily, ),
+               ( "write", generated, bench_write, ), )
+
+def run(state, repeat, function):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = function(state)
+        seconds = time.time() - start
+
+        # We keep the fastest run, the others have been disturbed by
+        # something.
+        if best is None or seconds < best:
+            best = seconds
+
+    return max(best, 1e-9), result
+
+def main():
+    op = optparse.OptionParser(usage="usage: %prog [options]")
+    op.add_option("-p", "--pages", dest="pages", type="int", default=2000,
+                  help="Number of pages of the synthetic document "
+                       "(default 2000)")
+    op.add_option("-l", "--lines", dest="lines", type="int", default=100,
+                  help="Lines of PostScript per page (default 100)")
+    op.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                  help="Number of runs per benchmark, the best one is "
+                       "reported (default 3)")
+    op.add_option("-o", "--only", dest="only", default=None,
+                  help="Only run the benchmarks whoes name contains ONLY")
+    op.add_option("-f", "--file", dest="filename", default=None,
+                  help="DSC file to use instead of the synthetic document")
+    
+    options, args = op.parse_args()
+
+    if options.filename is None:
+        fp = tempfile.TemporaryFile()
+        synthetic_document(fp, options.pages, options.lines)
+        fp.flush()
+    else:
+        fp = open(options.filename, "rb")
+
+    size = os.fstat(fp.fileno()).st_size
+    pages = len(list(bench_parse(fp).pages_section.subsections()))
+
+    print "%i bytes, %i pages" % ( size, pages, )
+    print "%-24s %10s %10s %12s" % ( "benchmark", "seconds", "MB/s",
+                                     "pages/s", )
+    for name, setup, function in benchmarks:
+        if options.only is None or options.only in name:
+            seconds, result = run(setup(fp, options), options.repeat,
+                                  function)
+            
+            if isinstance(result, chunk_writer):
+                # The write benchmark reports on its own output.
+                size = result.fp.tell()
+                print "%-24s %10.3f %10.1f %12.1f  %i fragments in " \
+                      "%i chunks" % ( name, seconds,
+                                      size / seconds / 1048576.0,
+                                      options.pages / seconds,
+                                      result.fragments, result.chunks, )
+            else:
+                print "%-24s %10.3f %10.1f %12.1f" % (
+                    name, seconds, size / seconds / 1048576.0,
+                    pages / seconds, )
+
+    fp.close()
+
+if __name__ == "__main__":
+    main()
@@ -47,6 +47,7 @@ from t4.debug import debug
 from t4.psg.util import *
 from t4.psg.document.document import *
 from t4.psg.fonts.type1 import type1
+from t4.psg.fonts.type1_subset import subset
 
 
 # Utility functions
@@ -639,6 +640,11 @@ class section(file_like_buffer):
        section in the subsection list). If a section is mandatory its begin
        or(!) end keyword may be None. The pages_section is an exception to
        this rule.
+    @cvar lazy: Boolean indicating whether this section may be parsed on
+       demand. When a document is parsed with lazy=True, sections of such
+       classes are only delimited when the document is read. Their
+       comments and subsections are parsed from their subfile the first
+       time they are accessed.
     """
     comment_re = re.compile(r"^%%[A-Za-z0-1\+]+.*?$")
 
@@ -646,6 +652,7 @@ class section(file_like_buffer):
     end = None
     possible_subsections = ()
     mandatory = False
+    lazy = False
 
     def __init__(self, info=None, empty=False, subfile=None):
         """
@@ -674,6 +681,7 @@ class section(file_like_buffer):
         """
         Return an iterator over the comments in this section. 
         """
+        self.load()
         for a in self.__dict__.values():
             if isinstance(a, comment):
                 yield a
@@ -702,6 +710,7 @@ class section(file_like_buffer):
 
         @param name: Return only those subsections whoes name is 'name'.
         """
+        self.load()
         if name is None:
             for a in self:
                 if isinstance(a, section):
@@ -724,8 +733,11 @@ class section(file_like_buffer):
     
     def write_to(self, fp):
         if hasattr(self, "subfile"):
-            self.subfile.seek(0)
-            copy_linewise(self.subfile, fp)
+            if hasattr(self.subfile, "write_to"):
+                self.subfile.write_to(fp)
+            else:
+                self.subfile.seek(0)
+                copy_linewise(self.subfile, fp)
         else:
             if self.begin is not None:
                 if self.info:
@@ -760,10 +772,16 @@ class section(file_like_buffer):
                setattr(self, what.name, what)
 
         if isinstance(what, section):
-            if self.has_subsection(what.name(), what.info):
+            # Keep track of the subsections appended so far, so we don't
+            # have to look through all of them each time. (Subsections
+            # may have been removed since, hence the double check.)
+            key = ( what.name(), what.info, )
+            keys = self.__dict__.setdefault("_subsection_keys", set())
+            if key in keys and self.has_subsection(what.name(), what.info):
                 msg = "A subsection %s %s already exists in this section."
                 msg = msg % ( repr(what.name()), repr(what.info), )
                 raise AttributeError(msg)
+            keys.add(key)
 
             if not hasattr(self, what.name()):
                 setattr(self, what.name(), what)
@@ -777,12 +795,94 @@ class section(file_like_buffer):
                                                 len(list(self.subsections())),)
 
 
-    def parse(cls, parent, lines, level=1):
-        print >> debug, ">>" * level, cls.name()
+    def dispatch_table(cls):
+        """
+        Return a pair ( header_class, subsection_keywords, ) for this
+        section class: header_class is the section class of the
+        mandatory first subsection or None, subsection_keywords a
+        dictionary mapping the begin keywords of the possible subsections
+        to their classes. The table is compiled on first use and kept
+        with the class (the subsection classes are referred to by name
+        and may be defined after this one).
+        """
+        table = cls.__dict__.get("_dispatch_table", None)
         
-        # On entry to the parse() function the file pointer must be set
-        # to the begining of the first line of this section's content.
-        start_seek_pointer = lines.fp.tell()
+        if table is None:
+            classes = map(_subsection_class, cls.possible_subsections)
+
+            if len(classes) > 0 and classes[0].mandatory:
+                header_class = classes[0]
+            else:
+                header_class = None
+
+            subsection_keywords = {}
+            for c in classes:
+                if c.begin is not None:
+                    subsection_keywords[c.begin] = c
+
+            table = ( header_class, subsection_keywords, )
+            setattr(cls, "_dispatch_table", table)
+
+        return table
+    dispatch_table = classmethod(dispatch_table)
+
+    def load(self):
+        """
+        Parse this section's comments and subsections from its subfile,
+        if that hasn't happened yet (see the lazy class variable).
+        """
+        if self.__dict__.has_key("_lazy_parent"):
+            parent = self.__dict__.pop("_lazy_parent")
+
+            self.subfile.seek(0)
+            parsed = self.parse(parent, line_iterator(self.subfile))
+
+            list.extend(self, list.__iter__(parsed))
+            for name, value in parsed.__dict__.items():
+                if name not in ( "info", "subfile", ):
+                    self.__dict__[name] = value
+
+    def is_loaded(self):
+        return not self.__dict__.has_key("_lazy_parent")
+
+    def __getattr__(self, name):
+        # Only called for attributes that don't exist (yet).
+        if name.startswith("__") or self.is_loaded():
+            raise AttributeError(name)
+        else:
+            self.load()
+            return getattr(self, name)
+
+    def __iter__(self):
+        self.load()
+        return list.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self.load()
+        return list.__getitem__(self, index)
+
+    def parse(cls, parent, lines, level=1, lazy=False):
+        """
+        Parse a section of class cls from line_iterator lines.
+
+        @param parent: The parent section or None
+        @param lazy: If set, subsections whoes class' lazy attribute is
+           set are only delimited, not parsed (see load()).
+        """
+        if lazy and cls.lazy:
+            return cls.delimit(parent, lines)
+        
+        trace = debug.verbose
+        if trace: print >> debug, ">>" * level, cls.name()
+        
+        # On entry to the parse() function the iterator must be
+        # positioned at the begining of the first line of this section's
+        # content.
+        start_seek_pointer = lines.tell()
 
         info = None
         if cls.begin is not None:
@@ -800,25 +900,24 @@ class section(file_like_buffer):
                     
         self = cls(info=info, empty=True)
 
+        header_class, subsection_keywords = cls.dispatch_table()
+
+        # The begin keywords of our peer sections.
+        if parent is None:
+            peer_keywords = {}
+        else:
+            peer_keywords = parent.dispatch_table()[1]
+        
         # This section has a header.
-        if len(cls.possible_subsections) > 0 and \
-               _subsection_class(cls.possible_subsections[0]).mandatory:
-            c = _subsection_class(cls.possible_subsections[0])
-            c = c.parse(self, lines, level+1)
-            self.append(c)
+        if header_class is not None:
+            self.append(header_class.parse(self, lines, level+1, lazy))
             
         try:
             last_comment = None
             while True:
                 # Seek forward to the next DSC comment
-                line = lines.next()
-                while not line.startswith("%%"):
-                    line = lines.next()
-
+                line = lines.skip_to("%%")
                 line = strip(line)
-
-                #print >> debug, cls.name(), repr(line)[:60]
-                
                 line = line[2:]                
 
                 # Here's another exception: In a Resource section the
@@ -829,8 +928,7 @@ class section(file_like_buffer):
                 # initialization lines.
                 if line == cls.end:
                     if cls.__name__ == "resource_section":
-                        while not line.startswith("%%"):
-                            line = lines.next()
+                        lines.skip_to("%%")
                         lines.rewind()
 
                     raise StopIteration
@@ -848,21 +946,8 @@ class section(file_like_buffer):
                 else:
                     info = ""
 
-                print >> debug, "++" * level, repr(keyword), repr(info)
-
-                # Collect possible peer and subsection keywords
-                subsection_keywords = {}
-                for a in cls.possible_subsections:
-                    c = _subsection_class(a)
-                    if c.begin is not None:
-                        subsection_keywords[c.begin] = c
-
-                peer_keywords = []
-                if parent is not None:
-                    for a in parent.possible_subsections:
-                        c = _subsection_class(a)
-                        if c.begin is not None:
-                            peer_keywords.append(c)
+                if trace: print >> debug, "++" * level, repr(keyword), \
+                        repr(info)
 
                 if keyword == page_section.begin:
                     # If the keyword is "Page" pass controll to a
@@ -874,23 +959,25 @@ class section(file_like_buffer):
                     lines.rewind()
                     if issubclass(cls, document_section):
                         self.pages_section = pages_section.parse(
-                            self, lines, level+1)
+                            self, lines, level+1, lazy)
                     elif issubclass(cls, pages_section):
                         self.pages_section = page_section.parse(
-                            self, lines, level+1)
+                            self, lines, level+1, lazy)
                     else:
                         raise StopIteration
 
                     self.append(self.pages_section)
                     
-                elif keyword in subsection_keywords.keys():
+                elif subsection_keywords.has_key(keyword):
                     # A regular subsection for ourselves.
                     subsection_cls = subsection_keywords[keyword]
                     lines.rewind()
-                    self.append(subsection_cls.parse(self, lines, level+1))
+                    self.append(subsection_cls.parse(self, lines, level+1,
+                                                     lazy))
                     
-                elif keyword in peer_keywords:
+                elif peer_keywords.has_key(keyword):
                     # Pass controll back to the caller.
+                    lines.rewind()
                     raise StopIteration
                 
                 elif keyword[0] == "+" and last_comment is not None: 
@@ -919,14 +1006,71 @@ class section(file_like_buffer):
                         
         # Initialize a subfile
         self.subfile = subfile(lines.fp, start_seek_pointer,
-                               lines.fp.tell() - start_seek_pointer)
+                               lines.tell() - start_seek_pointer)
         
-        print >> debug,  "<<" * level, "E", self.name()
+        if trace: print >> debug,  "<<" * level, "E", self.name()
 
         return self
     
     parse = classmethod(parse)
 
+    def delimit(cls, parent, lines):
+        """
+        Create an unparsed section of class cls that starts at the
+        current line and ends right before the next line starting a peer
+        section (or the Trailer or the end of the document). Embedded
+        documents are skipped. Only the DSC comments are looked at on
+        the way.
+        """
+        start_seek_pointer = lines.tell()
+
+        # Our start line.
+        parts = split(lines.next(), ":", 1)
+        if len(parts) > 1:
+            info = parts[1]
+        else:
+            info = ""
+
+        self = cls(info=info, empty=True)
+
+        if parent is None:
+            peer_keywords = {}
+            end = None
+        else:
+            peer_keywords = parent.dispatch_table()[1]
+            end = parent.end
+
+        nesting = 0
+        try:
+            while True:
+                keyword = split(strip(lines.skip_to("%%"))[2:], ":", 1)[0]
+                
+                if keyword == document_section.begin:
+                    nesting += 1
+                elif keyword == document_section.end and nesting > 0:
+                    nesting -= 1
+                elif nesting == 0 and (keyword == cls.end or
+                                       keyword == end or
+                                       keyword == trailer_section.begin or
+                                       keyword == dsc_document.end or
+                                       peer_keywords.has_key(keyword)):
+                    if keyword != cls.end:
+                        lines.rewind()
+                    raise StopIteration
+        except StopIteration:
+            pass
+
+        # The file is only read once the section is loaded. Don't use
+        # up a file descriptor before that.
+        self.subfile = subfile(lines.fp, start_seek_pointer,
+                               lines.tell() - start_seek_pointer,
+                               lazy=True)
+        self._lazy_parent = parent
+
+        return self
+    
+    delimit = classmethod(delimit)
+
     def name(cls):
         return cls.__name__[:-len("_section")]
     name = classmethod(name)
@@ -1004,6 +1148,7 @@ class pages_section(section):
 
 class page_section(section):
     begin = "Page"
+    lazy = True
     possible_subsections = ( "pageheader", "pagesetup",
                              "document", "object",
                              "pagetrailer", )
@@ -1126,15 +1271,44 @@ class pdfpage_setup_buffer(file_like_buffer):
         print >> self, "% End pdfpage_setup_buffer"
         
     
+class type1_subset_buffer:
+    """
+    Write a subset of a Type1 font to the output file, containing only
+    the glyphs used in the document. Which these are is determined on
+    write_to(), see dsc_document.used_glyphs(). If the font file can't
+    be subset, the whole font is written by the font_file buffer.
+    """
+    def __init__(self, document, font, font_file):
+        self.document = document
+        self.font = font
+        self.font_file = font_file
+
+    def write_to(self, fp):
+        try:
+            program = subset(self.font.main_font_file(),
+                             self.document.used_glyphs(self.font))
+        except Type1FontError:
+            if debug.verbose:
+                print >> debug, "Can't subset %s, embedding the whole " \
+                      "font." % self.font.ps_name
+            self.font_file.write_to(fp)
+        else:
+            fp.write(program)
+            
+    
 # Document
     
 class dsc_document(document_section, document):
     """
     Models a regular Adobe Document Structurnig Convention 3.0 complient
     PostScript document.
+
+    @cvar subset_fonts: Embed Type1 fonts with only those glyphs the
+       document uses. This is determined when the document is written.
     """
     begin = None
     end = "EOF"
+    subset_fonts = True
 
     def __init__(self, title="", info="", empty=False):
         """
@@ -1160,14 +1334,21 @@ class dsc_document(document_section, document):
             self.document_needed_resources = dsc_resource_set()
             self._embed_counter = 0
 
-    def from_file(cls, fp):
+    def from_file(cls, fp, lazy=False):
         """
         Create a dsc_document from file pointer fp.
+
+        @param lazy: If set, the pages are only delimited while reading
+           the document. Each page's comments and subsections are parsed
+           when they are first accessed. Opening a large document this
+           way takes time proportional to its number of pages rather
+           than its size. fp must not be closed while the document is
+           in use.
         """
         lines = line_iterator(fp)
         first_line = lines.next()
 
-        ret = cls.parse(None, lines)
+        ret = cls.parse(None, lines, lazy=lazy)
         ret.subfile = fp
         
         return ret
@@ -1251,6 +1432,9 @@ class dsc_document(document_section, document):
                             raise NotImplementedError("Not a pfa/b file!")
                         else:
                             font_file = file_as_buffer(fp)
+
+                    if self.subset_fonts:
+                        font_file = type1_subset_buffer(self, font, font_file)
                         
                     section = resource_section(info=resource_name)
                     section.append(font_file)
@@ -1258,6 +1442,25 @@ class dsc_document(document_section, document):
         else:
             raise NotImplementedError("Fonts other than Type1")
 
+    def used_glyphs(self, font):
+        """
+        Return a set of the names of the glyphs of font that are
+        referred to by the encoding vectors of the document's and its
+        pages' font_wrappers, plus .notdef and space.
+        """
+        wrappers = [ self._font_wrappers.get(font.ps_name, None), ]
+        for page in self.pages():
+            wrappers.append(page._font_wrappers.get(font.ps_name, None))
+
+        ret = set([ ".notdef", "space", ])
+        for wrapper in wrappers:
+            if wrapper is not None:
+                for char in wrapper.mapping.keys():
+                    if font.metrics.has_key(char):
+                        ret.add(font.metrics[char].ps_name)
+
+        return ret
+        
     def register_font(self, font):
         """
         This function will register a font with this document and
@@ -1372,6 +1575,162 @@ class dsc_page(page, page_section):
 
         return ret
 
+class streaming_dsc_document(dsc_document):
+    """
+    A dsc_document that writes its pages to an output file as soon as
+    they are finished, rather than keeping all of them in memory until
+    write_to() is called. A page is considered finished when the next
+    one is created with page() or when flush() or close() is called.
+    Written pages are removed from the pages section.
+
+    The document's header, defaults, prolog and setup sections are
+    written along with the first page. The header's Pages,
+    DocumentNeededResources and DocumentSuppliedResources comments are
+    (atend) and written to the trailer by close(). Resources and
+    setup code added to the document after that go into the setup
+    section of the next page written, as do the re-encoded versions of
+    document level fonts when pages have used characters not in their
+    encoding vectors before.
+
+    Usage::
+
+       document = streaming_dsc_document(open("out.ps", "w"), "Title")
+       for record in records:
+           page = document.page()
+           ...
+       document.close()
+    """
+    atend_comments = ( "Pages", "DocumentNeededResources",
+                       "DocumentSuppliedResources", )
+
+    # The fonts are written before the pages that use them are known.
+    subset_fonts = False
+    
+    def __init__(self, fp, title="", info=""):
+        dsc_document.__init__(self, title, info)
+        
+        self.fp = fp
+        self._pages_written = 0
+        self._closed = False
+
+        # The number of elements of the prolog and setup sections
+        # written so far. Elements added later go into the next page.
+        self._written = None
+
+        # Maps PostScript font names of document level font wrappers to
+        # the number of characters in their mapping when they were
+        # last written.
+        self._wrapper_sizes = {}
+
+    def page(self, page_size="a4", label=None):
+        if self._closed:
+            raise IllegalFunctionCall("This document has been closed.")
+        
+        self.flush()
+        return dsc_document.page(self, page_size, label)
+
+    def flush(self):
+        """
+        Write all pages that have not been written to the output file,
+        yet, and remove them from the pages section. The document's
+        head is written with the first page.
+        """
+        if list.__len__(self.pages_section) == 0:
+            return
+        
+        if self._written is None:
+            self._write_head()
+
+        for page in list.__iter__(self.pages_section):
+            for element in self._late_elements():
+                list.insert(page.pagesetup, 0, element)
+                
+            page.write_to(self.fp)
+            self._pages_written += 1
+
+        del self.pages_section[:]
+        self.pages_section.__dict__.pop("page", None)
+        self.pages_section.__dict__.pop("_subsection_keys", None)
+
+    def _write_head(self):
+        header = self.header
+        for keyword in self.atend_comments:
+            if not header.has_comment(keyword):
+                header.append(comment(keyword, "(atend)"))
+
+        for element in list.__iter__(self):
+            if element is self.pages_section:
+                break
+            elif hasattr(element, "write_to"):
+                element.write_to(self.fp)
+            else:
+                self.fp.write(str(element))
+
+        self._written = [ len(self.prolog), len(self.setup_section), ]
+        self._remember_wrapper_sizes()
+
+    def _remember_wrapper_sizes(self):
+        for ps_name, wrapper in self._font_wrappers.items():
+            self._wrapper_sizes[ps_name] = len(wrapper.mapping)
+
+    def _late_elements(self):
+        """
+        Return a list of the prolog and setup elements added since the
+        last time and the document level font wrappers whoes mapping
+        has grown since they were written. The font wrappers' sizes
+        are updated, as the elements are about to be written.
+        """
+        ret = []
+        for index, section in enumerate(( self.prolog, self.setup_section, )):
+            ret.extend(section[self._written[index]:])
+            self._written[index] = len(section)
+
+        for ps_name, wrapper in self._font_wrappers.items():
+            if wrapper not in ret and \
+                   len(wrapper.mapping) > self._wrapper_sizes.get(ps_name, 0):
+                ret.append(wrapper)
+
+        self._remember_wrapper_sizes()
+
+        # They are inserted at the beginning of the page setup one by
+        # one.
+        ret.reverse()
+        return ret
+
+    def close(self):
+        """
+        Write the remaining pages and the trailer to the output file.
+        The output file is not closed.
+        """
+        if self._closed:
+            return
+        
+        self.flush()
+        if self._written is None:
+            self._write_head()
+        
+        trailer = self.trailer
+        trailer.append(comment("Pages", str(self._pages_written)))
+        for a in self.document_needed_resources.as_comments(
+            "DocumentNeededResources"):
+            trailer.append(a)
+        for a in self.resources().as_comments("DocumentSuppliedResources"):
+            trailer.append(a)
+
+        trailer.write_to(self.fp)
+        print >> self.fp, "%%" + self.end
+        self._closed = True
+
+    def write_to(self, fp):
+        """
+        A streaming document has been written to its output file
+        already, fp must be that file. This will close() the document.
+        """
+        if fp is not self.fp:
+            raise IllegalFunctionCall("A streaming_dsc_document can only "
+                                      "be written to its own output file.")
+        self.close()
+        
 class eps_document(dsc_document):
     """
     An EPS document is a DSC document with a small number of
@@ -41,6 +41,7 @@ from t4.uuid import uuid4 as uuid
 from t4.psg.document import document 
 from t4.psg.exceptions import *
 from t4.psg.util import *
+from t4.psg.util.subfile import _subfile
 from t4.psg.fonts import font as font_cls
 
 # For car and cdr refer to your favorite introduction to LISP. The
@@ -729,7 +730,7 @@ class eps_image(_eps_image):
         bb = get_eps_bb(fp)
         fp.seek(0)
 
-        if not isinstance(fp, subfile._subfile):
+        if not isinstance(fp, _subfile):
             fp = file_as_buffer(fp)
 
         _eps_image.__init__(self, parent, fp,
@@ -1017,30 +1017,37 @@ class syllable(_node):
 
         if with_hyphen:
             letters.append(hyphen_character)
-                
-        def kerning_for_pairs():
+
+        metrics = font_wrapper.font.metrics
+        spacing = self.style.char_spacing
+        char_widths = map(lambda char: metrics.charwidth(
+            ord(char), font_size), letters)
+        
+        def offsets():
             """
-            For each characters in this syllable, return the kerning between
-            it and the next character.
+            For each character in this syllable, return its width plus the
+            character spacing and the kerning between it and the next
+            character.
             """
-            for char, next_ in here_and_next(letters):
+            for width, ( char, next_, ) in zip(char_widths,
+                                               here_and_next(letters)):
                 if next_ is None:
-                    yield 0.0
+                    yield width
+                elif self.style.kerning:
+                    yield width + spacing + metrics.kerning_pairs.get(
+                        ( ord(char), ord(next_), ), 0.0) * font_size / 1000.0
                 else:
-                    yield font_wrapper.font.metrics.kerning_pairs.get(
-                        ( char, next_, ), 0.0)
+                    yield width + spacing
 
-        if self.style.kerning:
-            kerning = kerning_for_pairs()
+        # The glyphs used to be placed by their widths only. Take kerning
+        # and character spacing into account only if the metrics are
+        # told to measure kerning, too, see t4.psg.fonts.metrics.
+        if metrics.measure_kerning:
+            char_offsets = list(offsets())
         else:
-            kerning = itertools.repeat(0.0)
-
-        spacing = self.style.char_spacing
-        char_widths = map(lambda char: font_wrapper.font.metrics.charwidth(
-            ord(char), font_size), letters)
-        char_offsets = map(lambda (width, kerning,): width + kerning + spacing,
-                           zip(char_widths, kerning))
-        char_offsets = map(lambda f: "%.2f" % f, char_widths)        
+            char_offsets = char_widths
+            
+        char_offsets = map(lambda f: "%.2f" % f, char_offsets)
         glyph_representation = font_wrapper.postscript_representation(
             map(ord, letters))
         
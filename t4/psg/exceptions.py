@@ -50,6 +50,7 @@ class IllegalFunctionCall(PSGException): pass
 class DSCSyntaxError(PSGException): pass
 class CommentMissing(PSGException): pass
 class PFBError(PSGException): pass
+class Type1FontError(PSGException): pass
 
 class EndOfBox(PSGException): pass
 class BoxTooSmall(PSGException): pass
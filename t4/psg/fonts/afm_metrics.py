@@ -39,6 +39,7 @@ from t4.psg.util import *
 from afm_parser import parse_afm
 from metrics import metrics, glyph_metric
 from encoding_tables import *
+import metrics_cache
 
 class global_info(property):
     """
@@ -51,6 +52,34 @@ class global_info(property):
     def __get__(self, metrics, owner="dummy"):
         return metrics.FontMetrics.get(self.keyword, None)
 
+def primitive(value):
+    """
+    Return a copy of the AFM parser's data structure in value with
+    dicts, lists, tuples and builtin numbers and strings replacing the
+    parser's classes.
+    """
+    if type(value) == BooleanType:
+        return value
+    elif isinstance(value, FloatType):
+        return float(value)
+    elif isinstance(value, IntType):
+        return int(value)
+    elif isinstance(value, LongType):
+        return long(value)
+    elif isinstance(value, StringType):
+        return str(value)
+    elif isinstance(value, UnicodeType):
+        return unicode(value)
+    elif isinstance(value, dict):
+        return dict([ ( primitive(key), primitive(item), )
+                      for key, item in value.iteritems() ])
+    elif isinstance(value, list):
+        return map(primitive, value)
+    elif isinstance(value, tuple):
+        return tuple(map(primitive, value))
+    else:
+        return value
+    
 class afm_metrics(metrics):
     gs_uni_re = re.compile("uni([A-Fa-f0-9]+).*")
     
@@ -60,9 +89,19 @@ class afm_metrics(metrics):
         @raises KeyError: if the font's encoding is not known.
         """
         metrics.__init__(self)
-        
-        self.FontMetrics = parse_afm(fp)
 
+        data = metrics_cache.load(fp)
+        if data is None:
+            self.FontMetrics = parse_afm(fp)
+            self._create_glyph_metrics()
+            metrics_cache.store(fp, self.compiled())
+        else:
+            self.restore(data)
+
+    def _create_glyph_metrics(self):
+        """
+        Populate self and self.kerning_pairs from self.FontMetrics.
+        """
         try:
             encoding_table = encoding_tables.get(self.encoding_scheme, {})
         except KeyError:
@@ -119,6 +158,37 @@ class afm_metrics(metrics):
         except KeyError:
             pass
         
+    def compiled(self):
+        """
+        Return the data needed to re-create this object without parsing
+        the AFM file as a structure of Python primitives, see
+        L{t4.psg.fonts.metrics_cache}.
+        """
+        glyphs = []
+        for unicode_char_code, glyph in self.iteritems():
+            glyphs.append( primitive( ( unicode_char_code,
+                                        glyph.font_character_code,
+                                        glyph.width,
+                                        glyph.ps_name,
+                                        glyph.bounding_box.as_tuple(), ) ) )
+            
+        return { "FontMetrics": primitive(self.FontMetrics),
+                 "glyphs": glyphs,
+                 "kerning_pairs": primitive(self.kerning_pairs), }
+
+    def restore(self, data):
+        """
+        Restore the state of this object from the data returned by
+        compiled().
+        """
+        self.FontMetrics = data["FontMetrics"]
+        for unicode_char_code, char_code, width, glyph_name, bb in \
+                data["glyphs"]:
+            self[unicode_char_code] = glyph_metric(
+                char_code, width, glyph_name, bounding_box.from_tuple(bb))
+            
+        self.kerning_pairs.update(data["kerning_pairs"])
+        
     ps_name = global_info("FontName")
     full_name = global_info("FullName")
     family_name = global_info("FamilyName")
@@ -30,6 +30,8 @@ This module defines a generic class for font metrics.
 """
 
 from types import *
+from array import array
+from itertools import repeat
 
 class glyph_metric:
     def __init__(self, font_character_code, 
@@ -59,12 +61,47 @@ class metrics(dict):
     objects. The class provides a special mechanism for accessing
     calculated attributes, see __getattr__() below.
 
+    For text measurement the glyph widths are copied into a dense
+    array indexed by character code on first use (see _widths()
+    below). Adding or removing glyphs discards that array.
+
+    @cvar measure_kerning: Text measurement used to ignore kerning
+      pairs, whatever its kerning parameter said. Layouts computed
+      that way change if kerning is taken into account, so this is
+      opt-in: Set measure_kerning to True on a metrics object or
+      class to make the kerning parameter of width_of_codes(),
+      stringwidth() and stringwidths() take effect.
     @ivar kerning_pairs: Dict object mapping tuples of integer (unicode
       codes) to floats (kerning value for that pair).
     """
+    measure_kerning = False
+    
     def __init__(self):
         self.kerning_pairs = {}
-        self.kerning_pairs.setdefault(0.0)
+
+    def _invalidate(self):
+        """
+        Discard the width information calculated from the glyphs.
+        """
+        for name in ( "widths", "default_width", ):
+            if self.__dict__.has_key(name):
+                del self.__dict__[name]
+
+    def __setitem__(self, code, glyph):
+        dict.__setitem__(self, code, glyph)
+        self._invalidate()
+
+    def __delitem__(self, code):
+        dict.__delitem__(self, code)
+        self._invalidate()
+
+    def update(self, *args, **kw):
+        dict.update(self, *args, **kw)
+        self._invalidate()
+
+    def clear(self):
+        dict.clear(self)
+        self._invalidate()
     
     def __getattr__(self, name):
         """
@@ -94,33 +131,118 @@ class metrics(dict):
         """
         return self.keys()
 
+    def _default_width(self):
+        """
+        The width used for characters not in the font: that of the
+        space character.
+        """
+        if self.has_key(32):
+            return self[32].width
+        else:
+            return 0.0
+    
+    def _widths(self):
+        """
+        Return an array of glyph widths indexed by unicode character
+        code, covering the Basic Multilingual Plane up to the highest
+        character in the font. Characters not in the font have the
+        default width.
+        """
+        codes = filter(lambda code: code < 0x10000, self.keys())
+        if len(codes) == 0:
+            size = 0
+        else:
+            size = max(codes) + 1
+            
+        ret = array("d", [ self.default_width, ]) * size
+        for code in codes:
+            ret[code] = self[code].width
+            
+        return ret
+
+    def width_of_codes(self, codes, kerning=True):
+        """
+        Return the width of a list of unicode character codes in
+        1/1000 of the font size, including pair-wise kerning if
+        kerning and measure_kerning are True.
+        """
+        try:
+            width = sum(map(self.widths.__getitem__, codes))
+        except IndexError:
+            widths = self.widths
+            size = len(widths)
+            default = self.default_width
+            width = 0.0
+            for code in codes:
+                if code < size:
+                    width += widths[code]
+                else:
+                    glyph = self.get(code, None)
+                    if glyph is None:
+                        width += default
+                    else:
+                        width += glyph.width
+
+        if kerning and self.measure_kerning and self.kerning_pairs \
+               and len(codes) > 1:
+            # Look up all pairs without a Python level loop. 
+            pairs = zip(codes, codes[1:])
+            width += sum(map(self.kerning_pairs.get, pairs,
+                             repeat(0.0, len(pairs))))
+
+        return width
+    
     def charwidth(self, s, font_size):
-        return self.get(s, self[32]).width * font_size / 1000.0
+        """
+        Return the width of the character with unicode code s in
+        regular PostScript units.
+        """
+        return self.width_of_codes([ s, ], False) * font_size / 1000.0
         
     def stringwidth(self, s, font_size, kerning=True, char_spacing=0.0):
         """
         Return the width of s when rendered in the current font in
         regular PostScript units. The boolean parameter kerning
         indicates whether the font's pair-wise kerning information
-        will be taken into account, if available. The char_spacing
-        parameter is in regular PostScript units, too.
+        will be taken into account, if available and measure_kerning
+        is set. The char_spacing parameter is in regular PostScript
+        units, too. s may be a string or a list of characters.
         """
-        if len(s) == 1:
-            return self.charwidth(ord(s[0]), font_size)
-        else:
-            width = sum(map(lambda char: self.get(ord(char), self[32]).width,
-                            s)) * font_size
+        width = self.width_of_codes(map(ord, s), kerning) * font_size
+
+        if char_spacing > 0 and len(s) > 1:
+            width += (len(s) - 1) * char_spacing * 1000.0
+
+        return width / 1000.0
+
+    def stringwidths(self, words, font_size, kerning=True, char_spacing=0.0):
+        """
+        Return a list of the widths of each of the strings in words,
+        as stringwidth() would.
+        """
+        # This is width_of_codes() with the attribute lookups taken
+        # out of the loop.
+        width_of_codes = self.width_of_codes
+        width_of = self.widths.__getitem__
+        kerning_of = self.kerning_pairs.get
+        kerning = kerning and self.measure_kerning and \
+                  len(self.kerning_pairs) > 0
+        
+        ret = []
+        for word in words:
+            codes = map(ord, word)
+            try:
+                width = sum(map(width_of, codes))
+            except IndexError:
+                width = width_of_codes(codes, False)
+
+            if kerning and len(codes) > 1:
+                pairs = zip(codes, codes[1:])
+                width += sum(map(kerning_of, pairs, repeat(0.0, len(pairs))))
+
+            width *= font_size
+            if char_spacing > 0 and len(word) > 1:
+                width += (len(word) - 1) * char_spacing * 1000.0
+            ret.append(width / 1000.0)
             
-            if kerning:
-                for a in range(len(s)-1):
-                    char = s[a]
-                    next = s[a+1]
-                    kerning = self.kerning_pairs.get( (char, next,), 0.0 )
-                    width += kerning * font_size
-            else:
-                kerning = 0.0
-
-            if char_spacing > 0:
-                width += (len(s) - 1) * char_spacing * 1000.0
-
-            return width / 1000.0
+        return ret
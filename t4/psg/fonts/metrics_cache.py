@@ -0,0 +1,241 @@
+#!/usr/bin/python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english"; -*-
+
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006-12 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+"""
+A cache of compiled AFM metrics. Parsing an AFM file and creating the
+afm_metrics object from it takes a while, loading the data compiled
+by afm_metrics from a marshal file is a lot faster.
+
+The cache files are stored in the directory named by the
+T4_PSG_METRICS_CACHE environment variable or, by default, in t4-psg
+in the user's cache directory ($XDG_CACHE_HOME or ~/.cache). If
+next_to_afm is set, they are stored next to the AFM file instead, with
+a 'c' appended to its name (like .pyc files). A cache file is
+invalidated by the AFM file's modification time and size. Errors
+writing the cache are ignored, it is an optimization only.
+
+Run this module to compile the metrics of all AFM files on
+Ghostscript's search path and in the directories given on the command
+line::
+
+   python -m t4.psg.fonts.metrics_cache [-x gs] [-a] [directory ...]
+"""
+
+import sys, os, marshal
+from hashlib import md5
+
+# Increment this if the data stored by afm_metrics changes.
+format_version = 2
+
+def _default_cache_dir():
+    """
+    Return the directory named by T4_PSG_METRICS_CACHE or t4-psg in
+    the user's cache directory, or None if there is no home directory
+    to put it in.
+    """
+    ret = os.environ.get("T4_PSG_METRICS_CACHE", None)
+    if ret is not None:
+        return ret
+    
+    base = os.environ.get("XDG_CACHE_HOME", None)
+    if base is None:
+        home = os.path.expanduser("~")
+        if home == "~":
+            return None
+        base = os.path.join(home, ".cache")
+
+    return os.path.join(base, "t4-psg")
+    
+# Directory to store the cache files in. If None, nothing is cached.
+cache_dir = _default_cache_dir()
+
+# If set, the cache files are stored next to the AFM files instead.
+next_to_afm = False
+
+def _afm_info(fp):
+    """
+    Return a tuple of ( absolute path, mtime, size, ) of fp if it is a
+    regular file with a name, None otherwise.
+    """
+    try:
+        info = os.fstat(fp.fileno())
+        path = os.path.abspath(fp.name)
+    except (AttributeError, EnvironmentError, TypeError, ValueError):
+        return None
+
+    if os.path.isfile(path):
+        return ( path, info.st_mtime, info.st_size, )
+    else:
+        return None
+
+def cache_file_name(path):
+    """
+    Return the name of the cache file for the AFM file at path or
+    None, if nothing is cached.
+    """
+    if next_to_afm:
+        return path + "c"
+    elif cache_dir is None:
+        return None
+    else:
+        return os.path.join(cache_dir, md5(path).hexdigest() + ".afmc")
+    
+def load(fp):
+    """
+    Return the data stored for AFM file pointer fp or None, if there
+    is no valid cache file for it.
+    """
+    info = _afm_info(fp)
+    if info is None:
+        return None
+
+    path = cache_file_name(info[0])
+    if path is None:
+        return None
+    
+    try:
+        f = open(path, "rb")
+        try:
+            stored_info, data = marshal.load(f)
+        finally:
+            f.close()
+    except (EnvironmentError, EOFError, ValueError, TypeError):
+        return None
+
+    if stored_info == ( format_version, ) + info[1:]:
+        return data
+    else:
+        return None
+
+def store(fp, data):
+    """
+    Store data, which must be marshal-able, as the compiled metrics
+    of AFM file pointer fp.
+    """
+    info = _afm_info(fp)
+    if info is None:
+        return
+
+    path = cache_file_name(info[0])
+    if path is None:
+        return
+    
+    try:
+        dump = marshal.dumps( ( ( format_version, ) + info[1:], data, ) )
+    except ValueError:
+        return
+
+    if not next_to_afm and not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                return
+    
+    tmp = "%s.%i" % ( path, os.getpid(), )
+    try:
+        f = open(tmp, "wb")
+        try:
+            f.write(dump)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+    except EnvironmentError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def afm_files(directories):
+    """
+    Yield the paths of the AFM files in directories and their
+    subdirectories.
+    """
+    for directory in directories:
+        for path, dirnames, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.lower().endswith(".afm"):
+                    yield os.path.join(path, filename)
+                    
+def compile_afm(path):
+    """
+    Compile the AFM file at path into the cache, unless its cache file
+    is up to date. Return True if the file was compiled.
+    """
+    from afm_metrics import afm_metrics
+
+    fp = open(path, "r")
+    try:
+        if load(fp) is not None:
+            return False
+        else:
+            afm_metrics(fp)
+            return True
+    finally:
+        fp.close()
+
+def main():
+    global next_to_afm
+    from optparse import OptionParser
+    from t4.psg.interpreters.gs import gs
+    
+    parser = OptionParser(usage="usage: %prog [options] [directory ...]")
+    parser.add_option("-x", "--executable", dest="executable", default="gs",
+                      help="Ghostscript executable whoes search path to "
+                      "look for AFM files on (default: gs)")
+    parser.add_option("-n", "--no-gs", dest="gs", default=True,
+                      action="store_false",
+                      help="Don't use Ghostscript's search path")
+    parser.add_option("-a", "--next-to-afm", dest="next_to_afm",
+                      default=False, action="store_true",
+                      help="Store the cache files next to the AFM files "
+                      "rather than in %s" % cache_dir)
+    ( options, args, ) = parser.parse_args()
+
+    next_to_afm = options.next_to_afm
+
+    directories = list(args)
+    if options.gs:
+        directories.extend(gs(options.executable).fontpath)
+
+    compiled = failed = uptodate = 0
+    for path in afm_files(directories):
+        try:
+            if compile_afm(path):
+                compiled += 1
+            else:
+                uptodate += 1
+        except Exception, e:
+            print >> sys.stderr, "%s: %s" % ( path, str(e), )
+            failed += 1
+
+    print "%i compiled, %i up to date, %i failed" % ( compiled, uptodate,
+                                                       failed, )
+
+if __name__ == "__main__":
+    main()
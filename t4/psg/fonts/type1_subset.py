@@ -0,0 +1,410 @@
+#!/usr/bin/python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english"; -*-
+
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006-12 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+
+"""
+Subsetting of PostScript Type1 fonts: Write a font program that only
+contains the glyphs (CharStrings) actually used in a document. This is
+how it works:
+
+   - The font is read as pfa, from a pfa file or converted from pfb
+     (see L{t4.psg.util.misc.cached_pfa}). It is split into its clear
+     text part, the eexec encrypted private part and the trailer
+     (512 zeros and cleartomark).
+   - The private part is decrypted. CharStrings of glyphs not used are
+     removed. The CharStrings kept are decrypted and interpreted far
+     enough to find the Subrs they call (directly, through other Subrs
+     or hint replacement) and the glyphs accented characters are
+     composed of (seac). Subrs nobody calls are replaced by a short
+     CharString that just returns, so the Subrs array keeps its
+     indices.
+   - The private part is encrypted again and written as hex.
+
+The encryption algorithms are described in Adobe's 'Type 1 Font
+Format' book, chapter 7.
+"""
+
+import re
+from types import *
+from string import *
+from binascii import unhexlify
+
+from t4.psg.exceptions import *
+from t4.psg.util.misc import cached_pfa, hex_lines, PFBError
+
+eexec_key = 55665
+charstring_key = 4330
+
+def decrypt(data, r):
+    """
+    Decrypt data (a string) using Type1 encryption with initial key r.
+    The leading random bytes are not removed.
+    """
+    ret = []
+    append = ret.append
+    for c in map(ord, data):
+        append(chr(c ^ (r >> 8)))
+        r = ((c + r) * 52845 + 22719) & 0xffff
+    return join(ret, "")
+
+def encrypt(data, r):
+    """
+    Encrypt data (a string) using Type1 encryption with initial key r.
+    """
+    ret = []
+    append = ret.append
+    for p in map(ord, data):
+        c = p ^ (r >> 8)
+        append(chr(c))
+        r = ((c + r) * 52845 + 22719) & 0xffff
+    return join(ret, "")
+
+
+eexec_re = re.compile(r"currentfile\s+eexec[ \t]*\r?\n?")
+trailer_re = re.compile(r"^(?:0+[ \t\r]*\n)+\s*cleartomark", re.M)
+
+def split_font_program(fp):
+    """
+    Return a tuple of the clear text part, the decrypted private part
+    (including its leading random bytes) and the trailer of the Type1
+    font in pfa or pfb file pointer fp.
+
+    The pfa conversion of pfb files is cached (see
+    L{t4.psg.util.misc.cached_pfa}), the decryption is not: a
+    document's write_to() subsets each font once.
+
+    @raises Type1FontError: if the file can't be split.
+    """
+    fp.seek(0)
+    first_byte = fp.read(1)
+    fp.seek(0)
+
+    if first_byte == chr(128):
+        try:
+            text = cached_pfa(fp)
+        except PFBError, e:
+            raise Type1FontError(str(e))
+    else:
+        text = fp.read()
+
+    match = eexec_re.search(text)
+    if match is None:
+        raise Type1FontError("No eexec section in Type1 font file.")
+
+    trailer = trailer_re.search(text, match.end())
+    if trailer is None:
+        raise Type1FontError("No eexec trailer in Type1 font file.")
+
+    try:
+        encrypted = unhexlify(join(split(text[match.end():trailer.start()]),
+                                   ""))
+    except TypeError:
+        raise Type1FontError("Can't read eexec section (not hex encoded?)")
+
+    return ( text[:match.end()], decrypt(encrypted, eexec_key),
+             text[trailer.start():], )
+
+
+lenIV_re = re.compile(r"/lenIV\s+(-?\d+)")
+subrs_re = re.compile(r"/Subrs\s+(\d+)\s+array\s*")
+subr_re = re.compile(r"dup\s+(\d+)\s+(\d+)\s+(\S+) ")
+charstrings_re = re.compile(r"/CharStrings\s+\d+\s+dict\s+dup\s+begin\s*")
+charstring_re = re.compile(r"/([^\s/\[\]{}()<>%]+)\s+(\d+)\s+(\S+) ")
+entry_end_re = re.compile(r"[ \t]*(?:noaccess\s+(?:put|def)|\S+)?[ \t]*\r?\n?")
+
+def entries(private, regex, start):
+    """
+    Return a list of entries of the Subrs array or the CharStrings
+    dict, starting at position start of private, as tuples of ( key,
+    RD token, charstring, tail, ) and the position of the first
+    character after the last entry.
+    """
+    ret = []
+    here = start
+    while True:
+        match = regex.match(private, here)
+        if match is None:
+            break
+
+        key, length, rd = match.groups()
+        end = match.end() + int(length)
+        if end > len(private):
+            raise Type1FontError("Truncated CharString in Type1 font.")
+        
+        tail = entry_end_re.match(private, end)
+        ret.append( ( key, rd, private[match.end():end], tail.group(), ) )
+        here = tail.end()
+
+        # Skip whitespace between entries.
+        while here < len(private) and private[here] in whitespace:
+            here += 1
+            
+    return ret, here
+
+# Glyph names in Adobe's StandardEncoding, which seac uses to refer to
+# the base character and the accent. (The encoding_tables module maps
+# StandardEncoding's upper half differently.)
+standard_encoding = dict(zip(range(32, 127), split(
+    "space exclam quotedbl numbersign dollar percent ampersand quoteright "
+    "parenleft parenright asterisk plus comma hyphen period slash zero one "
+    "two three four five six seven eight nine colon semicolon less equal "
+    "greater question at A B C D E F G H I J K L M N O P Q R S T U V W X Y "
+    "Z bracketleft backslash bracketright asciicircum underscore quoteleft "
+    "a b c d e f g h i j k l m n o p q r s t u v w x y z braceleft bar "
+    "braceright asciitilde")))
+standard_encoding.update(dict(zip(range(161, 176), split(
+    "exclamdown cent sterling fraction yen florin section currency "
+    "quotesingle quotedblleft guillemotleft guilsinglleft guilsinglright "
+    "fi fl"))))
+standard_encoding.update({
+    177: "endash", 178: "dagger", 179: "daggerdbl", 180: "periodcentered",
+    182: "paragraph", 183: "bullet", 184: "quotesinglbase",
+    185: "quotedblbase", 186: "quotedblright", 187: "guillemotright",
+    188: "ellipsis", 189: "perthousand", 191: "questiondown",
+    193: "grave", 194: "acute", 195: "circumflex", 196: "tilde",
+    197: "macron", 198: "breve", 199: "dotaccent", 200: "dieresis",
+    202: "ring", 203: "cedilla", 205: "hungarumlaut", 206: "ogonek",
+    207: "caron", 208: "emdash", 225: "AE", 227: "ordfeminine",
+    232: "Lslash", 233: "Oslash", 234: "OE", 235: "ordmasculine",
+    241: "ae", 245: "dotlessi", 248: "lslash", 249: "oslash", 250: "oe",
+    251: "germandbls", })
+
+class charstring_interpreter:
+    """
+    Walk the CharStrings of a glyph keeping track of the Subrs called
+    and the glyphs referred to by seac. The operand stack is
+    maintained only as far as needed to know the Subr numbers.
+
+    @ivar subrs: Set of the Subr indices called
+    @ivar seac: List of StandardEncoding codes of the glyphs used by seac
+    @ivar all_subrs: Set to True, if a Subr number could not be determined.
+    """
+    def __init__(self, subrs, lenIV):
+        self._subrs = subrs
+        self.lenIV = lenIV
+        
+        self.subrs = set()
+        self.seac = []
+        self.all_subrs = False
+
+    def decrypt(self, charstring):
+        if self.lenIV < 0:
+            return charstring
+        else:
+            return decrypt(charstring, charstring_key)[self.lenIV:]
+        
+    def run(self, charstring, stack=None, ps_stack=None, depth=0):
+        """
+        Interpret charstring (encrypted, as found in the font file).
+        Return True if it ended with endchar or seac.
+        """
+        if stack is None: stack = []
+        if ps_stack is None: ps_stack = []
+        
+        if depth > 10:
+            # The Type1 spec limits Subr calls to a depth of 10.
+            self.all_subrs = True
+            return True
+        
+        data = map(ord, self.decrypt(charstring))
+        i = 0
+        while i < len(data):
+            v = data[i]
+            i += 1
+
+            if v >= 32:
+                if v <= 246:
+                    stack.append(v - 139)
+                elif v <= 250:
+                    stack.append((v - 247) * 256 + data[i] + 108)
+                    i += 1
+                elif v <= 254:
+                    stack.append(-(v - 251) * 256 - data[i] - 108)
+                    i += 1
+                else:
+                    n = data[i] << 24 | data[i+1] << 16 | \
+                        data[i+2] << 8 | data[i+3]
+                    if n >= 1 << 31: n -= 1 << 32
+                    stack.append(n)
+                    i += 4
+            elif v == 10: # callsubr
+                if len(stack) == 0:
+                    self.all_subrs = True
+                    return True
+
+                number = stack.pop()
+                if self._subrs.has_key(number):
+                    if number not in self.subrs:
+                        self.subrs.add(number)
+                    if self.run(self._subrs[number], stack, ps_stack,
+                                depth + 1):
+                        return True
+                else:
+                    self.all_subrs = True
+            elif v == 11: # return
+                return False
+            elif v == 14: # endchar
+                return True
+            elif v == 12:
+                v = data[i]
+                i += 1
+                
+                if v == 6: # seac
+                    if len(stack) >= 2:
+                        self.seac.extend(stack[-2:])
+                    return True
+                elif v == 12: # div
+                    if len(stack) >= 2:
+                        b = stack.pop()
+                        a = stack.pop()
+                        if b != 0:
+                            stack.append(a / b)
+                        else:
+                            stack.append(0)
+                elif v == 16: # callothersubr
+                    if len(stack) < 2:
+                        del stack[:]
+                    else:
+                        stack.pop() # othersubr number
+                        count = stack.pop()
+                        args = stack[len(stack)-count:]
+                        del stack[len(stack)-count:]
+                        args.reverse()
+                        ps_stack.extend(args)
+                elif v == 17: # pop
+                    if ps_stack:
+                        stack.append(ps_stack.pop())
+                    else:
+                        stack.append(0)
+                else:
+                    del stack[:]
+            else:
+                del stack[:]
+
+        return False
+        
+def subset(fp, glyph_names):
+    """
+    Return a pfa representation of the Type1 font in pfa or pfb file
+    pointer fp that contains only the glyphs in glyph_names (and
+    .notdef). Glyphs not in the font are ignored.
+
+    @raises Type1FontError: if the font file can't be parsed.
+    """
+    cleartext, private, trailer = split_font_program(fp)
+
+    match = subrs_re.search(private)
+    if match is None:
+        subrs, subrs_start, subrs_end = [], None, None
+    else:
+        subrs_start = match.end()
+        subrs, subrs_end = entries(private, subr_re, subrs_start)
+
+    match = charstrings_re.search(private, subrs_end or 0)
+    if match is None:
+        raise Type1FontError("No CharStrings in Type1 font.")
+
+    charstrings_start = match.end()
+
+    # Only look at the part of the private dict before the first
+    # binary data for lenIV.
+    match = lenIV_re.search(private, 0, subrs_start or charstrings_start)
+    if match is None:
+        lenIV = 4
+    else:
+        lenIV = int(match.group(1))
+    charstrings, charstrings_end = entries(private, charstring_re,
+                                           charstrings_start)
+
+    subr_dict = {}
+    for key, rd, charstring, tail in subrs:
+        subr_dict[int(key)] = charstring
+
+    charstring_dict = {}
+    for key, rd, charstring, tail in charstrings:
+        charstring_dict[key] = charstring
+
+    # Find the glyphs and Subrs we need.
+    interpreter = charstring_interpreter(subr_dict, lenIV)
+
+    needed = set([ ".notdef", ])
+    todo = list(glyph_names)
+    while todo:
+        name = todo.pop()
+        if name in needed or not charstring_dict.has_key(name):
+            continue
+        
+        needed.add(name)
+        
+        interpreter.seac = []
+        interpreter.run(charstring_dict[name])
+
+        for code in interpreter.seac:
+            if standard_encoding.has_key(code):
+                todo.append(standard_encoding[code])
+
+    interpreter.run(charstring_dict.get(".notdef", ""))
+    
+    # Subrs 0 to 3 are used by the flex and hint replacement
+    # mechanisms through OtherSubrs.
+    keep_subrs = interpreter.subrs.union(range(4))
+
+    # Assemble the new private part.
+    ret = []
+
+    if subrs_start is None:
+        ret.append(private[:charstrings_start])
+    else:
+        ret.append(private[:subrs_start])
+
+        if interpreter.all_subrs:
+            ret.append(private[subrs_start:subrs_end])
+        else:
+            if lenIV < 0:
+                stub = chr(11) # return
+            else:
+                stub = encrypt("\0" * lenIV + chr(11), charstring_key)
+            
+            for key, rd, charstring, tail in subrs:
+                if int(key) not in keep_subrs:
+                    charstring = stub
+
+                ret.append("dup %s %i %s %s%s" % ( key, len(charstring), rd,
+                                                  charstring, tail, ))
+
+        ret.append(private[subrs_end:charstrings_start])
+
+    for key, rd, charstring, tail in charstrings:
+        if key in needed:
+            ret.append("/%s %i %s %s%s" % ( key, len(charstring), rd,
+                                           charstring, tail, ))
+
+    ret.append(private[charstrings_end:])
+
+    return join([ cleartext,
+                  hex_lines(encrypt(join(ret, ""), eexec_key)),
+                  trailer, ], "")
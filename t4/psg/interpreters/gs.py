@@ -61,6 +61,7 @@ class gs(interpreter):
             found = False
             while not found:
                 line = gs_help.readline()
+                if line == "": break
                 if line.startswith("Search path:"): found = True
 
             compiled_path = ""
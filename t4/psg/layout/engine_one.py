@@ -208,7 +208,17 @@ class style(dict):
             else:
                 if type(word) != types.UnicodeType:
                     word = unicode(str(word))
-                ret.append( (word, self.word_width(word),) )
+                ret.append(word)
+
+        # Measure the words without a width in one go.
+        unmeasured = [ word for word in ret
+                       if type(word) != types.TupleType ]
+        widths = iter(self.font.metrics.stringwidths(
+            unmeasured, self.font_size, True, self.char_spacing))
+
+        for idx, word in enumerate(ret):
+            if type(word) != types.TupleType:
+                ret[idx] = ( word, widths.next(), )
 
         return ret
 
@@ -25,7 +25,9 @@
 ##
 ##  I have added a copy of the GPL in the file gpl.txt.
 
-import re, subfile, struct
+import re, struct
+
+from subfile import subfile
 from measure import bounding_box
 
 hires_bbre = re.compile(
@@ -96,6 +98,6 @@ def eps_file_without_preview(epsfp):
         return epsfp
     else:        
         marker, pspos, pslength = struct.unpack("<III", header[:12])
-        return subfile.subfile(epsfp, pspos, pslength)
+        return subfile(epsfp, pspos, pslength)
         
     
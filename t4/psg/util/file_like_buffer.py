@@ -33,13 +33,72 @@ Buffers for output file generation
 import sys, os
 from string import *
 from types import *
-from cStringIO import StringIO
 
 from t4.psg.exceptions import *
 from misc import *
+from subfile import zero_copy, copy_blocks
 
 # Utilities for creating files
 
+class chunk_writer:
+    """
+    A file-like object that gathers the strings written to it and
+    passes them on to its target file in chunks of at least chunk_size
+    bytes, using a single write() call for each. If the target is None
+    all strings are kept and getvalue() returns them as one. This is
+    what file_like_buffer.write_to() uses to write its fragments.
+
+    @ivar fragments: The number of strings written to the chunk_writer
+    @ivar chunks: The number of write() calls to the target file
+    """
+    chunk_size = 64 * 1024
+    
+    def __init__(self, fp, chunk_size=None):
+        self.fp = fp
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+            
+        self.fragments = 0
+        self.chunks = 0
+        self._buffer = []
+        self._size = 0
+
+    def write(self, s):
+        self._buffer.append(s)
+        self._size += len(s)
+        self.fragments += 1
+
+        if self._size >= self.chunk_size and self.fp is not None:
+            self.flush()
+
+    def writelines(self, l):
+        for s in l: self.write(s)
+
+    def flush(self):
+        """
+        Write the strings gathered so far to the target file. The
+        target file itself is not flushed.
+        """
+        if self._size > 0 and self.fp is not None:
+            self.fp.write(join(self._buffer, ""))
+            self.chunks += 1
+            self._buffer = []
+            self._size = 0
+
+    def raw_file(self):
+        """
+        Flush the chunk_writer and return its target file, so the
+        caller may write to it directly. See subfile.zero_copy().
+        """
+        self.flush()
+        return self.fp
+
+    def getvalue(self):
+        ret = join(self._buffer, "")
+        self._buffer = [ ret, ]
+        return ret
+    
+        
 class file_like_buffer(list):
     """
     This class provides a minimal subset of a writable file: the
@@ -82,21 +141,47 @@ class file_like_buffer(list):
         """
         Return the buffer as an ordinary string.
         """
-        fp = StringIO()
-        self.write_to(fp)
-        return fp.getvalue()
+        writer = chunk_writer(None)
+        self.write_to(writer)
+        return writer.getvalue()
 
     __str__ = as_string
 
     def write_to(self, fp):
         """
         Write the buffer to file pointer fp.
+
+        Unless fp is a chunk_writer already, the output goes through one,
+        so the many small strings a buffer usually contains reach fp in
+        a few large chunks. Nested file_like_buffers that don't overload
+        write_to() are walked in place rather than recursed into.
         """
-        for a in self:
-            if hasattr(a, "write_to"):
-                a.write_to(fp)
+        if isinstance(fp, chunk_writer):
+            writer = fp
+        else:
+            writer = chunk_writer(fp)
+
+        write = writer.write
+        plain = file_like_buffer.write_to.im_func
+        
+        stack = [ list.__iter__(self), ]
+        while stack:
+            for a in stack[-1]:
+                if type(a) is StringType:
+                    write(a)
+                elif isinstance(a, file_like_buffer) and \
+                         a.__class__.write_to.im_func is plain:
+                    stack.append(list.__iter__(a))
+                    break
+                elif hasattr(a, "write_to"):
+                    a.write_to(writer)
+                else:
+                    write(str(a))
             else:
-                fp.write(str(a))
+                stack.pop()
+
+        if writer is not fp:
+            writer.flush()
                 
     def append(self, what):
         """
@@ -137,16 +222,15 @@ class file_as_buffer:
         self.filepointer = fp.tell()
 
     def write_to(self, fp):
+        # Regular files are copied without going through Python
+        # strings, if possible.
+        if zero_copy(self.fp, self.filepointer, None, fp):
+            return
+        
         # Make sure the file pointer is at the desired position,
         # that is, the one, we were initialized with.
         self.fp.seek(self.filepointer)
-        
-        while True:
-            s = self.fp.read(1024)
-            if s == "":
-                break
-            else:
-                fp.write(s)
+        copy_blocks(self.fp, fp)
 
     def as_string(self):
         return self.fp.read()
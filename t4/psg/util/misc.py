@@ -30,14 +30,18 @@
 Misc utility functions and classes. 
 """
 
-import sys, os
+import sys, os, re, mmap
 from string import *
 from types import *
+from array import array
+from bisect import bisect_right
+from binascii import hexlify
+from hashlib import md5
 
 from measure import *
 
-from file_like_buffer import file_like_buffer
-from subfile import subfile
+from file_like_buffer import file_like_buffer, chunk_writer
+from subfile import subfile, filesystem_subfile
 
 # Lost In Single Paranthesis
 def car(l): return l[0]
@@ -51,84 +55,198 @@ def toppop(l):
     return ret
 
 
+eol_re = re.compile(r"\r\n|\r|\n")
+
 class line_iterator:
     r"""
     Iterate over the lines in a file. Keep track of the line numbers.
-    After a call to next() the file's seek indcator will point at the
-    next by after the newline. Lines are delimeted by either \r\n, \n,
-    \r, which ever comes first, in this order. Lines that are longer
-    than 10240 bytes will be returned as 10240 byte strings without a
-    newline (because that's the buffer size). This function is binary
-    save, no newline transformations are performed.
-
-    FIXME: This needs to be rewriten! Best in C, I guess.
+    Lines are delimeted by either \r\n, \n, \r, which ever comes first,
+    in this order, and returned including their delimeter. This class
+    is binary save, no newline transformations are performed.
+
+    Regular files (and subfiles of regular files) are memory mapped,
+    anything else is read into memory at once. The offsets of the line
+    ends are recorded in an index, which is built a block of
+    index_block_size bytes at a time as the iterator proceeds, so each
+    byte of the file is looked at exactly once. Because of that index
+    rewind() is O(1) and may be called repeatedly.
+
+    Note that the file's seek indicator is not moved line by line. Use
+    tell() to find out where the current line ends in the file and
+    sync() to seek the file there. Once the iterator is exhausted the
+    file's seek indicator will point to its end.
     """
+    index_block_size = 256 * 1024
+    
     def __init__(self, fp):
         """
         Make sure to open fp binary mode so no newline conversion is
-        performed.
+        performed. Iteration starts at fp's current position.
         """
         self.fp = fp
         self.line_number = 0
-        self.again = False
-        self.last_line = ""
 
-    def next(self):
-        if self.again:
-            self.again = False
-            self.fp.seek(self.last_line_length, 1)
-            return self.last_line
-            
-        old = self.fp.tell()
-        buffer = self.fp.read(10240)
+        self._data, self._origin, self._start, self._end = _map_file(fp)
         
-        bytes_read = len(buffer)
-        if bytes_read == 0: # eof
-            raise StopIteration
-        else:
-            unix_index = buffer.find("\n")
-            mac_index = buffer.find("\r")
+        # self._ends[i] is the offset in self._data right after line i.
+        self._ends = array("l")
+        self._indexed = self._start
 
-            if unix_index == -1 and mac_index == -1:
-                return buffer
-            else:
-                if unix_index == -1: unix_index = len(buffer)
-                if mac_index == -1: mac_index = len(buffer)
-
-            if unix_index == mac_index + 1:
-                eol = mac_index + 1
-            elif unix_index > mac_index:
-                eol = mac_index
-            else:
-                eol = unix_index
+    def _index(self):
+        """
+        Extend the index by at least one line, unless the end of the
+        data has been reached.
+        """
+        ends = self._ends
+        count = len(ends)
+        data = self._data
+        
+        while len(ends) == count and self._indexed < self._end:
+            endpos = min(self._indexed + self.index_block_size, self._end)
+            if endpos < self._end and data[endpos-1] == "\r":
+                # Don't split a \r\n in two.
+                endpos += 1
+
+            for match in eol_re.finditer(data, self._indexed, endpos):
+                ends.append(match.end())
+
+            if endpos == self._end and \
+                   (len(ends) == 0 or ends[-1] < self._end):
+                # The last line has no newline.
+                ends.append(self._end)
+                
+            self._indexed = endpos
 
-            ret = buffer[:eol+1]
+    def next(self):
+        if self.line_number == len(self._ends):
+            self._index()
+            if self.line_number == len(self._ends):
+                self.sync()
+                raise StopIteration
+
+        if self.line_number == 0:
+            begin = self._start
+        else:
+            begin = self._ends[self.line_number-1]
 
-            self.last_line_length = len(ret)
-            self.fp.seek(old + self.last_line_length, 0)
-            
-            self.last_line = ret
+        end = self._ends[self.line_number]
+        self.line_number += 1
 
-            self.line_number += 1
-            
-            return ret            
+        return self._data[begin:end]
 
     readline = next
 
+    def skip_to(self, prefix):
+        """
+        Skip all lines that do not start with prefix and return the
+        next one that does, just like next() would. The data is searched
+        for prefix directly, rather than line by line, and the lines
+        skipped are only indexed if they have been before. Otherwise
+        they end up in the index as a whole: rewind() will go back to
+        the line returned, but a second rewind() will return all of
+        the skipped lines at once. (The same goes for line_number.)
+
+        @raises: StopIteration if there is no such line.
+        """
+        data = self._data
+        ends = self._ends
+        position = self.tell() + self._origin
+
+        while True:
+            hit = data.find(prefix, position, self._end)
+            if hit == -1:
+                hit = self._end
+                break
+            elif hit == position or data[hit-1] in "\r\n":
+                break
+            else:
+                position = hit + 1
+
+        if hit < self._indexed:
+            # The line starting at hit is line number i, since the line
+            # before it ends at hit.
+            i = bisect_right(ends, hit)
+            while len(ends) <= i and self._indexed < self._end:
+                self._index()
+        else:
+            if (len(ends) == 0 and hit > self._start) or \
+                   (len(ends) > 0 and hit > ends[-1]):
+                ends.append(hit)
+            i = len(ends)
+
+            if hit < self._end:
+                match = eol_re.search(data, hit, self._end)
+                if match is None:
+                    ends.append(self._end)
+                else:
+                    ends.append(match.end())
+                    
+            self._indexed = ends[-1]
+
+        self.line_number = i
+        return self.next()
+
     def rewind(self):
         """
         'Rewind' the file to the line before this one.
 
-        @raises: OSError (from file.seek())
+        @raises: IOError if there is no line before this one.
         """
-        self.again = True
-        self.line_number -= 1
-        self.fp.seek(-self.last_line_length, 1)
+        if self.line_number == 0:
+            raise IOError("Can't rewind beyond the first line.")
         
+        self.line_number -= 1
+
+    def tell(self):
+        """
+        Return the position in fp right after the last line returned.
+        """
+        if self.line_number == 0:
+            position = self._start
+        else:
+            position = self._ends[self.line_number-1]
+
+        return position - self._origin
+
+    def sync(self):
+        """
+        Seek fp to the position returned by tell().
+        """
+        self.fp.seek(self.tell())
 
     def __iter__(self):
         return self
 
+def _map_file(fp):
+    """
+    Return a tuple ( data, origin, start, end, ) for the line_iterator
+    class: data is a string or mmap object containing the file's
+    content, origin the offset in data that corresponds to position 0
+    in fp and start and end the offsets in data of fp's current position
+    and the end of fp.
+    """
+    position = fp.tell()
+    
+    if hasattr(fp, "fileno"):
+        if isinstance(fp, filesystem_subfile):
+            origin = fp.offset
+            length = fp.length
+        else:
+            origin = 0
+            length = os.fstat(fp.fileno()).st_size
+        
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            # Empty files, pipes and the like.
+            pass
+        else:
+            return ( data, origin, origin + position,
+                     min(origin + length, len(data)), )
+
+    data = fp.read()
+    return ( data, -position, 0, len(data), )
+
 
 def copy_linewise(frm, to, ignore_comments=False):
     """
@@ -243,61 +361,149 @@ def eight_squares(canvas, spacing=mm(6)):
 
 class PFBError(Exception): pass
         
+def hex_lines(data):
+    """
+    Return data hex encoded in lines of 30 bytes (60 characters). Each
+    complete line ends in a newline, the last (partial) line is
+    followed by one, too.
+    """
+    encoded = hexlify(data)
+    full = (len(data) - len(data) % 30) * 2
+    return join([ encoded[i:i+60] + "\n" for i in range(0, full, 60) ] +
+                [ encoded[full:], "\n", ], "")
+    
 def pfb2pfa(pfb, pfa):
     """
     Convert a PostScript Type1 font in binary representation (pfb) to
     ASCII representation (pfa). This function is modeled after the
     pfb2pfa program written in C by Piet Tutelaers. I freely admit 
     that I understand only rudimentarily what I'm doing here.
+
+    Each segment is read in one go. ASCII segments are copied with
+    their carriage returns replaced by newlines, binary segments are
+    hex encoded as a whole and written as lines of 30 bytes.
     """
 
     while True:
-        r = pfb.read(1)
-        if ord(r) != 128:
-            raise PFBError("Not a pfb file! (%s)" % repr(r + pfb.read(50)))
+        header = pfb.read(2)
+        if len(header) < 2 or ord(header[0]) != 128:
+            raise PFBError("Not a pfb file! (%s)" % repr(header +
+                                                         pfb.read(50)))
 
-        t = ord(pfb.read(1))
+        t = ord(header[1])
 
         if t == 1 or t == 2:
-            l1 = ord(pfb.read(1))
-            l2 = ord(pfb.read(1))
-            l3 = ord(pfb.read(1))
-            l4 = ord(pfb.read(1))
-
+            length = pfb.read(4)
+            if len(length) < 4:
+                raise PFBError("Error in PFB file: truncated segment header!")
+            
+            l1, l2, l3, l4 = map(ord, length)
             l = l1 | l2 << 8 | l3 << 16 | l4 << 24
+
+            segment = pfb.read(l)
+            if len(segment) < l:
+                raise PFBError("Error in PFB file: truncated segment "
+                               "(%i of %i bytes)!" % ( len(segment), l, ))
             
         if t == 1:
-            for i in range(l):
-                c = pfb.read(1)
-                if c == "\r":
-                    pfa.write("\n")
-                else:
-                    pfa.write(c)
+            pfa.write(replace(segment, "\r", "\n"))
                     
         elif t == 2:
-            for i in range(l):
-                c = pfb.read(1)
-                pfa.write("%02x" % ord(c))
-                if (i + 1) % 30 == 0:
-                    pfa.write("\n")
-
-            pfa.write("\n")
+            pfa.write(hex_lines(segment))
         elif t == 3:
             break
         else:
             raise PFBError("Error in PFB file: unknown field type %i!" % t)
 
+# Converted fonts, keyed by ( path, mtime, size, ) of their pfb file.
+pfa_cache = {}
+
+# If set, converted fonts are also stored in this directory, so other
+# processes can use them.
+pfa_cache_dir = os.environ.get("T4_PSG_PFA_CACHE", None)
+
+def _pfa_cache_key(pfb):
+    """
+    Return the cache key for pfb or None, if it is not a regular file
+    with a name.
+    """
+    try:
+        info = os.fstat(pfb.fileno())
+        path = os.path.abspath(pfb.name)
+    except (AttributeError, EnvironmentError, TypeError, ValueError):
+        return None
+    
+    if os.path.isfile(path):
+        return ( path, info.st_mtime, info.st_size, )
+    else:
+        return None
+
+def _pfa_cache_file(key):
+    return os.path.join(pfa_cache_dir, "%s.pfa" % md5(repr(key)).hexdigest())
+    
+def cached_pfa(pfb):
+    """
+    Return the pfa representation of pfb file pointer as a string. The
+    conversion result is kept in memory and, if pfa_cache_dir is set
+    (through the T4_PSG_PFA_CACHE environment variable), on disk, keyed
+    by the pfb file's path and modification time. Files without a name
+    are converted on each call.
+    """
+    key = _pfa_cache_key(pfb)
+    
+    if key is not None:
+        if pfa_cache.has_key(key):
+            return pfa_cache[key]
+
+        if pfa_cache_dir is not None:
+            try:
+                f = open(_pfa_cache_file(key), "rb")
+                try:
+                    pfa_cache[key] = f.read()
+                    return pfa_cache[key]
+                finally:
+                    f.close()
+            except IOError:
+                pass
+    
+    pfb.seek(0)
+    writer = chunk_writer(None)
+    pfb2pfa(pfb, writer)
+    ret = writer.getvalue()
+
+    if key is not None:
+        pfa_cache[key] = ret
+
+        if pfa_cache_dir is not None:
+            # Errors are ignored, the disk cache is an optimization only.
+            path = _pfa_cache_file(key)
+            tmp = "%s.%i" % ( path, os.getpid(), )
+            try:
+                f = open(tmp, "wb")
+                try:
+                    f.write(ret)
+                finally:
+                    f.close()
+                os.rename(tmp, path)
+            except EnvironmentError:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                
+    return ret
+
 
 class pfb2pfa_buffer(file_like_buffer):
     """
     A pfa2pfb buffer is a file like buffer which, initialized from a
-    pfb file, will write a pfa file into its output file.
+    pfb file, will write a pfa file into its output file. The
+    conversion is done once per pfb file, see cached_pfa().
     """
     def __init__(self, pfb_fp):
         self.pfb = pfb_fp
 
     def write_to(self, fp):
-        self.pfb.seek(0)
-        pfb2pfa(self.pfb, fp)
+        fp.write(cached_pfa(self.pfb))
 
 
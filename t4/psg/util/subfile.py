@@ -30,13 +30,129 @@ Wrapper class for file objects that will emulate a file that contains
 a specified subset of the 'parent' file.
 """
 
-import sys, os, threading
+import sys, os, stat, mmap, threading
 from string import *
 from types import *
 import cStringIO
 
+# The size of the blocks copied between files, if they have to go
+# through Python strings at all.
+copy_block_size = 1024 * 1024
 
-def subfile(fp, offset, length):
+# Only available from Python 3.3 on.
+sendfile = getattr(os, "sendfile", None)
+
+def _regular_fileno(fp):
+    """
+    Return fp's file descriptor if it is a regular file, None otherwise.
+    """
+    try:
+        fd = fp.fileno()
+        if stat.S_ISREG(os.fstat(fd).st_mode):
+            return fd
+    except (AttributeError, EnvironmentError, ValueError):
+        pass
+    
+    return None
+
+def zero_copy(fp, offset, length, to):
+    """
+    Copy length bytes of regular file fp, starting at offset, to file
+    to without reading them into Python strings. If length is None,
+    copy to the end of fp. If to is a real file, os.sendfile() is used
+    where available. Otherwise the range of fp is memory mapped and
+    written to 'to' in blocks of copy_block_size bytes, as buffers
+    when 'to' is a file object. fp's file pointer is not used or
+    modified.
+
+    If 'to' has a raw_file() method (a
+    L{t4.psg.util.file_like_buffer.chunk_writer}), whatever it has
+    buffered is written first and the bytes go directly to its target.
+
+    Return False if fp is not a regular file or can't be memory
+    mapped, in which case nothing has been written.
+    """
+    src = _regular_fileno(fp)
+    if src is None:
+        return False
+
+    size = os.fstat(src).st_size
+    if length is None or offset + length > size:
+        length = max(size - offset, 0)
+
+    if hasattr(to, "raw_file"):
+        target = to.raw_file()
+        if target is not None:
+            to = target
+
+    if length == 0:
+        return True
+    
+    if sendfile is not None and isinstance(to, file):
+        to.flush()
+        dst = to.fileno()
+        sent = 0
+        while sent < length:
+            count = sendfile(dst, src, offset + sent, length - sent)
+            if count == 0:
+                break
+            sent += count
+
+        # Make the file object aware of the data written to its
+        # file descriptor.
+        try:
+            to.seek(os.lseek(dst, 0, 1))
+        except EnvironmentError:
+            pass
+
+        if sent == length:
+            return True
+        else:
+            offset += sent
+            length -= sent
+
+    # mmap() wants its offset to be a multiple of the allocation
+    # granularity.
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    try:
+        data = mmap.mmap(src, offset - start + length,
+                         access=mmap.ACCESS_READ, offset=start)
+    except (EnvironmentError, ValueError, OverflowError):
+        return False
+
+    try:
+        end = offset - start + length
+        for here in range(offset - start, end, copy_block_size):
+            count = min(copy_block_size, end - here)
+            if isinstance(to, file):
+                to.write(buffer(data, here, count))
+            else:
+                to.write(data[here:here+count])
+    finally:
+        data.close()
+
+    return True
+
+def copy_blocks(fp, to, length=None):
+    """
+    Copy length bytes (or everything up to its end) from fp's current
+    position to file 'to' in blocks of copy_block_size bytes.
+    """
+    while length is None or length > 0:
+        if length is None:
+            s = fp.read(copy_block_size)
+        else:
+            s = fp.read(min(copy_block_size, length))
+            
+        if s == "":
+            break
+        else:
+            to.write(s)
+            if length is not None:
+                length -= len(s)
+
+
+def subfile(fp, offset, length, lazy=False):
     """
     This is a funny thing: A subfile class knows a file, an offset and
     a length. It implements the fill interface as described in the
@@ -48,7 +164,7 @@ def subfile(fp, offset, length):
 
     This function will return a filesystem_subfile instance if the
     provided file pointer is a regular file and a default_subfile if
-    it is not.
+    it is not. The lazy parameter is passed on to filesystem_subfile.
 
     Obviously, the filepointer must support seeking. The file should
     be opened read-only. Though you *may* write to the 'parent' as
@@ -56,7 +172,7 @@ def subfile(fp, offset, length):
     screw things up goood...
     """
     if hasattr(fp, "fileno"):
-        return filesystem_subfile(fp, offset, length)
+        return filesystem_subfile(fp, offset, length, lazy)
     if hasattr(fp, "getvalue"):
         return stringio_subfile(fp, offset, length)
     else:
@@ -156,29 +272,111 @@ class _subfile(file):
 
     def write_to(self, fp):
         self.seek(0)
-        while True:
-            r = self.read(1024)
-            if len(r) == 0:
-                break
-            else:
-                fp.write(r)
+        copy_blocks(self, fp)
 
 
 class filesystem_subfile(_subfile):
-    def __init__(self, fp, offset, length):
+    """
+    The file descriptor of the 'parent' file is duplicated, so the
+    subfile remains readable after the 'parent' file has been
+    closed. A duplicated descriptor shares its seek pointer with the
+    original, so the subfile keeps track of its own position and seeks
+    before each access.
+
+    If lazy is set, the descriptor is duplicated on first read or
+    write only, because a lazily parsed document may have thousands
+    of subfiles, most of which are never used. The 'parent' file must
+    stay open until then.
+    """
+    def __init__(self, fp, offset, length, lazy=False):
         if not hasattr(fp, "fileno"):
             raise ValueError("A filesystem_subfile must always be used with "
                              "a regular file, owning a fileno() method")
 
-        parent = os.fdopen(os.dup(fp.fileno()))
         if isinstance(fp, self.__class__):
-            _subfile.__init__(self, parent, offset+fp.offset, length)
+            offset += fp.offset
+            
+        self._fp = fp
+        self._position = 0
+        
+        if lazy:
+            parent = None
         else:
-            _subfile.__init__(self, parent, offset, length)
+            parent = self._dup()
+            
+        _subfile.__init__(self, parent, offset, length)
+
+    def _dup(self):
+        return os.fdopen(os.dup(self._fp.fileno()))
+    
+    def _get_parent(self):
+        if self._parent is None:
+            self._parent = self._dup()
+        return self._parent
+
+    def _set_parent(self, parent):
+        self._parent = parent
+        
+    parent = property(_get_parent, _set_parent)
+
+    def _seek_parent(self):
+        self.parent.seek(self.offset + self._position)
     
+    def read(self, bytes=None):
+        self._seek_parent()
+        ret = _subfile.read(self, bytes)
+        self._position += len(ret)
+        return ret
 
+    def readline(self, size=None):
+        self._seek_parent()
+        ret = _subfile.readline(self, size)
+        self._position += len(ret)
+        return ret
+
+    def readlines(self, sizehint=80):
+        self._seek_parent()
+        for line in _subfile.readlines(self, sizehint):
+            self._position += len(line)
+            yield line
+
+    def write(self, s):
+        self._seek_parent()
+        _subfile.write(self, s)
+        self._position = min(self.parent.tell() - self.offset, self.length)
+        
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            if offset < 0: raise IOError("Can't seek beyond file start")
+            self._position = offset
+        elif whence == 1:
+            if self._position + offset < 0:
+                raise IOError("Invalid argument (seek beyond file start)")
+            self._position += offset
+        elif whence == 2:
+            self._position = self.length + offset
+        else:
+            raise IOError("Invalid argument (don't know how to seek)")
+
+    def tell(self):
+        return self._position
+
+    def _source(self):
+        if self._parent is None:
+            return self._fp
+        else:
+            return self._parent
+        
     def fileno(self):
-        return self.parent.fileno()
+        return self._source().fileno()
+
+    def write_to(self, fp):
+        """
+        Copy the subfile to fp straight from the 'parent' file's
+        descriptor, see zero_copy() above.
+        """
+        if not zero_copy(self._source(), self.offset, self.length, fp):
+            _subfile.write_to(self, fp)
 
 class default_subfile(_subfile):
     def __init__(self, fp, offset, length):
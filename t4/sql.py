@@ -82,6 +82,16 @@ class backend:
     escaped_chars = ( ('"', r'\"',),
                       ("'", r"\'",),
                       ("%", "%%",), )
+
+    # Whether INSERT statements may have a RETURNING clause.
+    supports_returning = False
+
+    # Whether a Python list may be passed to the cursor as an array
+    # parameter, see in_().
+    supports_array_params = False
+
+    # The maximum number of elements in an IN (...) list.
+    max_in_list_length = 1000
     
     def identifyer_quotes(self, name):
         return '"%s"' % name
@@ -98,6 +108,14 @@ class backend:
     def backend_encoding(self):
         raise NotImplementedError()
 
+    def upsert_clause(self, runner, conflict_columns, update_columns):
+        """
+        Return the clause appended to an INSERT statement that turns it
+        into an L{upsert}.
+        """
+        raise NotImplementedError("%s does not support UPSERT" % \
+                                      self.__class__.__name__)
+
 class pgsql_backend(backend):
     """
     Backend definition for PostgreSQL.
@@ -112,6 +130,23 @@ class pgsql_backend(backend):
                       ("\t", "\\t"),
                       ("%",  "\\045",),
                       ("?", "\\077",), ]
+
+    supports_returning = True
+    supports_array_params = True
+
+    def upsert_clause(self, runner, conflict_columns, update_columns):
+        if not update_columns:
+            # A no-op update rather than DO NOTHING, so RETURNING
+            # yields the conflicting rows, too.
+            update_columns = conflict_columns
+            
+        assignments = [ "%s = EXCLUDED.%s" % ( runner(column),
+                                               runner(column), )
+                        for column in update_columns ]
+        
+        return "ON CONFLICT (%s) DO UPDATE SET %s" % (
+            flatten_identifyer_list(runner, list(conflict_columns)),
+            join(assignments, ", "), )
     
 class mysql_backend(backend):
     escaped_chars = ( ('"', r'\"',),
@@ -120,6 +155,19 @@ class mysql_backend(backend):
     
     def identifyer_quotes(self, name):
         return '`%s`' % name
+
+    def upsert_clause(self, runner, conflict_columns, update_columns):
+        # MySQL detects conflicts on any unique key, the
+        # conflict_columns are only used for a no-op update.
+        if update_columns:
+            assignments = [ "%s = VALUES(%s)" % ( runner(column),
+                                                  runner(column), )
+                            for column in update_columns ]
+        else:
+            assignments = [ "%s = %s" % ( runner(column), runner(column), )
+                            for column in conflict_columns ]
+            
+        return "ON DUPLICATE KEY UPDATE " + join(assignments, ", ")
     
     #def escape_string(self, string):
     #    return self._conn.escape_string(string)
@@ -133,6 +181,19 @@ class firebird_backend(backend):
 class gadfly_backend(backend):
     pass
 
+class sqlite_backend(backend):
+    """
+    Backend definition for SQLite. Strings are quoted the SQL92 way,
+    the '%' is escaped, because the sqlite adapter translates the
+    format paramstyle to sqlite3's qmark style, see
+    L{t4.orm.adapters.sqlite.datasource}.
+    """
+    escaped_chars = ( ("'", "''",),
+                      ("%", "%%",), )
+
+    # SQLite >= 3.24 uses PostgreSQL's ON CONFLICT syntax.
+    upsert_clause = pgsql_backend.upsert_clause.im_func
+
 
 class sql:
     """
@@ -571,6 +632,112 @@ class expression:
         return hash(self._identifyer)
 
 
+class in_(expression):
+    """
+    Encapsulate a test whether column's value is among values.
+
+    >>> sql(ds)( in_(column("id"), [ 1, 2, 3, ]) )
+    ==> id = ANY(%s)            (PostgreSQL, with [1, 2, 3] as parameter)
+    ==> id IN (1, 2, 3)         (other backends)
+
+    On backends that support array parameters, simple Python values
+    (numbers and strings) are passed to the cursor as a single array
+    parameter, so the statement stays the same size no matter how many
+    values there are. Otherwise, the values are rendered as IN lists of
+    at most the backend's max_in_list_length elements, connected by OR.
+    """
+    def __init__(self, column, values, literal_class=None):
+        """
+        @param values: A sequence of Python values or sql literals.
+        @param literal_class: The sql literal class used for Python
+           values in an IN list. By default, it's guessed from their type.
+        """
+        expression.__init__(self)
+        self._column = column
+        self._values = list(values)
+        self._literal_class = literal_class
+
+    def __sql__(self, runner):
+        if len(self._values) == 0:
+            return "1 = 0"
+        
+        if runner.ds.supports_array_params and \
+               array_parameter_possible(self._values):
+            return any_array(self._column, self._values).__sql__(runner)
+        
+        column = runner(self._column)
+        literals = map(self._literal, self._values)
+        n = runner.ds.max_in_list_length
+        
+        lists = []
+        for start in range(0, len(literals), n):
+            lists.append("%s IN (%s)" % (
+                column, flatten_identifyer_list(runner,
+                                                literals[start:start+n]), ))
+
+        if len(lists) == 1:
+            return lists[0]
+        else:
+            return "(" + join(lists, " OR ") + ")"
+
+    def _literal(self, value):
+        if hasattr(value, "__sql__"):
+            return value
+        elif self._literal_class is not None:
+            return self._literal_class(value)
+        else:
+            return literal_for(value)
+
+class any_array(expression):
+    """
+    Encapsulate a column = ANY(%s) expression with values passed to
+    the cursor as one array parameter. This is PostgreSQL specific, use
+    L{in_} for portable code.
+    """
+    def __init__(self, column, values):
+        expression.__init__(self)
+        self._column = column
+        self._values = list(values)
+
+    def __sql__(self, runner):
+        runner.params.append(self._values)
+        return runner(self._column) + " = ANY(%s)"
+
+_array_parameter_types = ( IntType, LongType, FloatType, BooleanType,
+                           StringType, UnicodeType, decimal.Decimal, )
+    
+def array_parameter_possible(values):
+    """
+    Return True if all of values are of a type that the DBAPI modules
+    know how to pass as elements of an array parameter.
+    """
+    for value in values:
+        if type(value) not in _array_parameter_types:
+            return False
+    return True
+
+def literal_for(value):
+    """
+    Return an sql literal for a simple Python value.
+    """
+    if value is None:
+        return NULL
+    elif type(value) == BooleanType:
+        return bool_literal(value)
+    elif type(value) in ( IntType, LongType, ):
+        return integer_literal(value)
+    elif type(value) == FloatType:
+        return float_literal(value)
+    elif isinstance(value, decimal.Decimal):
+        return decimal_literal(value)
+    elif type(value) == StringType:
+        return string_literal(value)
+    elif type(value) == UnicodeType:
+        return unicode_literal(value)
+    else:
+        raise TypeError("Can't guess an sql literal class for %s" % \
+                            repr(type(value)))
+        
 class as_(expression):
     """
     Encapsulates an expression that goes into an AS statement in a
@@ -854,6 +1021,46 @@ class insert(statement):
                                 
             return INSERT + " VALUES " + tuples
     
+class upsert(insert):
+    """
+    Encapsulate an INSERT statement that UPDATEs the existing row
+    instead, if a row conflicts with it on a unique key. The clause
+    that does this is provided by the backend, see
+    backend.upsert_clause().
+    """
+    def __init__(self, relation, columns, values, conflict_columns,
+                 update_columns=None, returning=()):
+        """
+        @param values: A list of value tuples, one for each row.
+        @param conflict_columns: The columns of the unique key that
+           identifies existing rows.
+        @param update_columns: The columns to be updated in existing rows.
+           Defaults to all columns except the conflict_columns.
+        @param returning: Columns to return from the affected rows, if
+           the backend supports it.
+        """
+        insert.__init__(self, relation, columns, *values)
+
+        if update_columns is None:
+            update_columns = [ column for column in columns
+                               if column not in conflict_columns ]
+            
+        self._conflict_columns = conflict_columns
+        self._update_columns = update_columns
+        self._returning = returning
+
+    def __sql__(self, runner):
+        ret = insert.__sql__(self, runner) + " " + \
+              runner.ds.upsert_clause(runner, self._conflict_columns,
+                                      self._update_columns)
+        
+        if self._returning:
+            ret += " RETURNING " + flatten_identifyer_list(
+                runner, list(self._returning))
+
+        return ret
+
+    
 class update(statement):
     """
     Encapsulate a UPDATE statement.
@@ -19,6 +19,9 @@ If all you want is a unique ID, you should probably call uuid1() or uuid4().
 Note that uuid1() may compromise privacy since it creates a UUID containing
 the computer's network address.  uuid4() creates a random UUID.
 
+To create many UUIDs at once use uuid4_batch(n).  uuid7() and uuid7_batch(n)
+create time-ordered UUIDs, which make index-friendly primary keys.
+
 Typical usage::
 
     >>> import uuid
@@ -297,6 +300,40 @@ def _ifconfig_getnode():
                 if words[i] in ['hwaddr', 'ether']:
                     return int(words[i + 1].replace(':', ''), 16)
 
+def _sysfs_getnode():
+    """Get the hardware address on Linux by reading /sys/class/net. This
+    doesn't launch a separate program.  Universally administered
+    addresses are preferred over locally administered ones (those of
+    bridges, tunnels and virtual interfaces)."""
+    import os
+    local = None
+    try:
+        interfaces = os.listdir('/sys/class/net')
+    except OSError:
+        return None
+    interfaces.sort()
+    for interface in interfaces:
+        if interface == 'lo':
+            continue
+        try:
+            f = open(os.path.join('/sys/class/net', interface, 'address'))
+            try:
+                address = f.read().strip()
+            finally:
+                f.close()
+            node = int(address.replace(':', ''), 16)
+        except (IOError, ValueError):
+            continue
+        if node == 0 or node >= 1<<48L:
+            continue
+        if node & 0x020000000000L:
+            # Locally administered; keep looking for a real one.
+            if local is None:
+                local = node
+        else:
+            return node
+    return local
+
 def _ipconfig_getnode():
     """Get the hardware address on Windows by running ipconfig.exe."""
     import os, re
@@ -397,21 +434,70 @@ def _random_getnode():
 
 _node = None
 
+# If set, the node found by getnode() is stored in this file so that
+# other processes don't have to look for it again.  The cache is off
+# unless the T4_UUID_NODE_CACHE environment variable names a file or
+# this is set by the application.
+import os as _os
+node_cache_path = _os.environ.get('T4_UUID_NODE_CACHE', None)
+
+def _read_node_cache():
+    """Return the node stored in the node cache file or None."""
+    try:
+        f = open(node_cache_path)
+        try:
+            node = int(f.read().strip(), 16)
+        finally:
+            f.close()
+    except (IOError, OSError, TypeError, ValueError):
+        return None
+    if 0 < node < 1<<48L:
+        return node
+    return None
+
+def _write_node_cache(node):
+    """Store node in the node cache file, replacing it atomically.
+    Errors are ignored: the cache is an optimization only."""
+    import os
+    if node_cache_path is None:
+        return
+    tmp = '%s.%d' % (node_cache_path, os.getpid())
+    try:
+        f = open(tmp, 'w')
+        try:
+            f.write('%012x\n' % node)
+        finally:
+            f.close()
+        os.rename(tmp, node_cache_path)
+    except (IOError, OSError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
 def getnode():
-    """Get the hardware address as a 48-bit integer.  The first time this
+    """Get the hardware address as a 48-bit integer.  The node is looked
+    up in the node cache file first, if there is one (see
+    node_cache_path).  Failing that, the first time this
     runs, it may launch a separate program, which could be quite slow.  If
     all attempts to obtain the hardware address fail, we choose a random
-    48-bit number with its eighth bit set to 1 as recommended in RFC 4122."""
+    48-bit number with its eighth bit set to 1 as recommended in RFC 4122.
+    The result is written to the node cache file."""
 
     global _node
     if _node is not None:
         return _node
 
+    if node_cache_path is not None:
+        _node = _read_node_cache()
+        if _node is not None:
+            return _node
+
     import sys
     if sys.platform == 'win32':
         getters = [_windll_getnode, _netbios_getnode, _ipconfig_getnode]
     else:
-        getters = [_unixdll_getnode, _ifconfig_getnode]
+        getters = [_sysfs_getnode, _unixdll_getnode, _ifconfig_getnode]
 
     for getter in getters + [_random_getnode]:
         try:
@@ -419,6 +505,7 @@ def getnode():
         except:
             continue
         if _node is not None:
+            _write_node_cache(_node)
             return _node
 
 def uuid1(node=None, clock_seq=None):
@@ -474,6 +561,128 @@ def uuid4():
         bytes = [chr(random.randrange(256)) for i in range(16)]
         return UUID(bytes=bytes, version=4)
 
+def _urandom(count):
+    """Return count random bytes from os.urandom() or, if that is not
+    available, the 'random' module."""
+    try:
+        import os
+        return os.urandom(count)
+    except:
+        import random
+        return ''.join([chr(random.randrange(256)) for i in range(count)])
+
+# Randomness for uuid7() is taken from this pool, which is refilled
+# _pool_size bytes at a time.  The pool and uuid7()'s clock state belong
+# to the process with the id _pid.  A forked child must not use them,
+# or it would hand out the same values as its parent.
+_pool_size = 4096
+_pool = ''
+_pool_position = 0
+_pid = None
+
+def _random_bytes(count):
+    """Return count bytes from the random pool.  The caller must hold
+    _lock."""
+    global _pool, _pool_position
+    if _pool_position + count > len(_pool):
+        _pool = _urandom(max(_pool_size, count))
+        _pool_position = 0
+    ret = _pool[_pool_position:_pool_position+count]
+    _pool_position += count
+    return ret
+
+def _ints(bytes):
+    """Yield the 16-byte chunks of bytes as 128-bit integers."""
+    import binascii
+    hex = binascii.hexlify(bytes)
+    for start in xrange(0, len(hex), 32):
+        yield long(hex[start:start+32], 16)
+
+def _version_bits(version):
+    """Return a pair of masks (keep, bits) that sets the RFC 4122 variant
+    and the version number of a 128-bit integer through
+    (int & keep) | bits."""
+    keep = ~((0xc000 << 48L) | (0xf000 << 64L)) & ((1L<<128L) - 1)
+    bits = (0x8000 << 48L) | (version << 76L)
+    return keep, bits
+
+def uuid4_batch(n):
+    """Generate a list of n random UUIDs.  The randomness for all of them
+    is drawn from os.urandom() in one call, which is a lot faster than
+    calling uuid4() n times."""
+    keep, bits = _version_bits(4)
+    return [ UUID(int=(value & keep) | bits)
+             for value in _ints(_urandom(16*n)) ]
+
+try:
+    import threading
+    _lock = threading.Lock()
+except ImportError:
+    import dummy_threading
+    _lock = dummy_threading.Lock()
+
+_last_timestamp = -1
+_counter = 0
+
+def _check_pid():
+    """Reset the random pool and uuid7()'s clock state if this process
+    has been forked from the one that used them.  The caller must hold
+    _lock."""
+    global _pid, _pool, _pool_position, _last_timestamp, _counter
+    import os
+    pid = os.getpid()
+    if pid != _pid:
+        _pid = pid
+        _pool = ''
+        _pool_position = 0
+        _last_timestamp = -1
+        _counter = 0
+
+def uuid7_batch(n):
+    """Generate a list of n time-ordered UUIDs with a layout that follows
+    version 7 of RFC 9562: a 48-bit Unix timestamp in milliseconds, a
+    12-bit counter and 62 random bits.  The UUIDs returned by this
+    function and uuid7() are strictly increasing within a process, even
+    if the system clock goes backwards, which makes them good primary
+    keys: new rows end up next to each other in B-tree indexes rather
+    than all over the place."""
+    global _last_timestamp, _counter
+    import time
+
+    keep, bits = _version_bits(7)
+    ret = []
+
+    _lock.acquire()
+    try:
+        _check_pid()
+        timestamp = int(time.time() * 1000)
+        random = _random_bytes(8*n)
+
+        for i in xrange(n):
+            if timestamp > _last_timestamp:
+                # A new millisecond: start the counter at a random value
+                # that leaves plenty of room to count upward.
+                _last_timestamp = timestamp
+                _counter = ord(random[8*i]) << 3
+            else:
+                _counter += 1
+                if _counter > 0xfff:
+                    # Counter overflow: borrow from the next millisecond.
+                    _last_timestamp += 1
+                    _counter = 0
+
+            tail = long(random[8*i:8*i+8].encode('hex'), 16)
+            value = (_last_timestamp << 80L) | (_counter << 64L) | tail
+            ret.append(UUID(int=(value & keep) | bits))
+    finally:
+        _lock.release()
+
+    return ret
+
+def uuid7():
+    """Generate a time-ordered UUID. See uuid7_batch()."""
+    return uuid7_batch(1)[0]
+
 def uuid5(namespace, name):
     """Generate a UUID from the SHA-1 hash of a namespace UUID and a name."""
     import sha
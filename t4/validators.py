@@ -112,14 +112,76 @@ class MoneyValidatorException(ValidatorException):
 class validator:
     """
     The default validator: It doesn't check anything.
+
+    @cvar cacheable: Set this to True, if check()'s outcome depends on
+       the value alone (not on the dbobj or external state), so that a
+       value that has passed once will always pass. See L{chain}.
     """
+    cacheable = False
+    
     def check(self, dbobj, dbproperty, value):
         pass
 
+class chain:
+    """
+    A sequence of validators compiled into a single check() method,
+    see L{compile_validators}. Values that have passed all the
+    validators are remembered (up to cache_size of them), if all of
+    the validators are cacheable. Later checks of such a value are
+    skipped. Failures are not cached, so every one of them raises a
+    fresh exception with the right dbobj in it. Unhashable values
+    (lists, dicts) are checked every time.
+    """
+    cache_size = 1024
+    
+    def __init__(self, validators):
+        self.validators = tuple(validators)
+        self._checks = tuple([ v.check for v in self.validators ])
+        self._cacheable = ( len(self.validators) > 0 and
+                            False not in [ v.cacheable
+                                           for v in self.validators ] )
+        self._valid = set()
+
+    def check(self, dbobj, dbproperty, value):
+        key = None
+        if self._cacheable:
+            try:
+                # 1 == 1.0 == True, but the validators may not think so.
+                key = ( type(value), value, )
+                hash(key)
+            except TypeError: # unhashable
+                key = None
+            else:
+                if key in self._valid: return
+
+        for check in self._checks:
+            check(dbobj, dbproperty, value)
+
+        if key is not None:
+            if len(self._valid) >= self.cache_size:
+                self._valid.clear()
+            self._valid.add(key)
+
+def compile_validators(validators):
+    """
+    Return a function check(dbobj, dbproperty, value) that runs all of
+    validators or None, if there are none.
+    """
+    validators = tuple(validators)
+    
+    if len(validators) == 0:
+        return None
+    elif len(validators) == 1 and not validators[0].cacheable:
+        return validators[0].check
+    else:
+        return chain(validators).check
+
 class not_null_validator(validator):
     """
     For NOT NULL columns.
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if value is None:
             if dbproperty:
@@ -138,6 +200,8 @@ class not_empty_validator(validator):
     """
     For columns which may not contain empty strings.
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if type(value) == StringType or type(value) == UnicodeType:
             if value == "":
@@ -154,6 +218,8 @@ class string_validator(validator):
     """
     Makes sure the value is a string.
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if type(value) not in ( StringType, UnicodeType, ):
             raise TypeError("String required.")
@@ -162,6 +228,8 @@ class int_validator(validator):
     """
     Makes sure the value is an integer or can be converted to one.
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if value is not None:
             try:
@@ -174,6 +242,8 @@ class float_validator(validator):
     """
     Makes sure the value is a float or can be converted to one.
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if value is not None:
             try:
@@ -187,6 +257,8 @@ class german_float_validator(validator):
     Makes sure the value is a float or can be converted to one.
     This will remove .s and replace ,s with . 
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if value is not None:
             try:
@@ -201,6 +273,8 @@ class german_money_validator(validator):
     Makes sure the value is a float or can be converted to one.
     This will remove .s and may replace a decimal , with . 
     """
+    cacheable = True
+    
     def check(self, dbobj, dbproperty, value):
         if value is not None:
             try:
@@ -213,6 +287,8 @@ class length_validator(validator):
     """
     Check an argument value's length. None values will be ignored.
     """
+    cacheable = True
+    
     def __init__(self, max_length):
         self.max_length = max_length
         
@@ -227,6 +303,8 @@ class range_validator(validator):
     A generic validator for value ranges (fortunately Python doesn't care, it
     can be used for numerals, dates, strings...)
     """
+    cacheable = True
+    
     def __init__(self, lo, hi, include_bounds=False):
         """
         The formula goes::
@@ -256,14 +334,16 @@ class range_validator(validator):
             else:
                 message = "Unmatched condition: %s <= %s <= %s (%s.%s)"
 
-        tpl = ( repr(self.lo), repr(self.hi), repr(value),
+        tpl = ( repr(self.lo), repr(value), repr(self.hi),
                 dbobj.__class__.__name__, dbproperty.attribute_name, )
-        raise RangeValidatorException(message % tpl, dbobj, dbproperty, value)
+        raise RangeValidatorError(message % tpl, dbobj, dbproperty, value)
 
 class re_validator(validator):
     """
     Regular expression validator. For strings and Unicode Objects
     """
+    cacheable = True
+    
     def __init__(self, RE):        
         if type(RE) in ( StringType, UnicodeType, ):
             self.re = re.compile(RE)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test the PostgreSQL catalog reflection and its cache file. This
+requires an environment variable called
+
+   ORMTEST_PGSQL_CONN
+
+to be set to an appropriate connection string, for example:
+
+   ORMTEST_PGSQL_CONN="adapter=pgsql host=localhost"
+"""
+
+import os, tempfile, shutil, unittest
+
+from t4.orm.dbobject import dbobject
+from t4.orm.datasource import datasource
+from t4.orm.relationships import many2one
+from t4.orm.adapters.pgsql.datatypes import *
+
+class country(dbobject):
+    __relation__ = "catalog_test_country"
+    __primary_key__ = "code"
+
+    code = Unicode()
+    name = Unicode()
+
+class broken_city(dbobject):
+    __relation__ = "catalog_test_city"
+
+    id = integer()
+    name = integer()
+    population = integer()
+
+class catalog_test(unittest.TestCase):
+
+    def setUp(self):
+        self.ds = datasource(os.getenv("ORMTEST_PGSQL_CONN"))
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmpdir, "catalog.pickle")
+        
+        self.ds.execute("DROP SCHEMA IF EXISTS catalog_test CASCADE")
+        self.ds.execute("CREATE SCHEMA catalog_test")
+        self.ds.execute("""CREATE TABLE catalog_test.catalog_test_country (
+                              code TEXT PRIMARY KEY,
+                              name TEXT NOT NULL
+                           )""")
+        self.ds.execute("""CREATE TABLE catalog_test.catalog_test_city (
+                              id SERIAL PRIMARY KEY,
+                              name TEXT NOT NULL,
+                              country_id TEXT NOT NULL
+                                 REFERENCES catalog_test.catalog_test_country
+                           )""")
+        self.ds.commit()
+        
+        self.schemas = ( "catalog_test", )
+
+    def tearDown(self):
+        self.ds.execute("DROP SCHEMA IF EXISTS catalog_test CASCADE")
+        self.ds.commit()
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        catalog = self.ds.load_catalog(schemas=self.schemas)
+
+        city = catalog.table("catalog_test_city")
+        self.assertEqual([ c.name for c in city.columns ],
+                         [ "id", "name", "country_id", ])
+        self.assertEqual(city.primary_key, ( "id", ))
+        self.assertEqual(city.column("id").sequence_name(),
+                         "catalog_test.catalog_test_city_id_seq")
+        
+        fk, = city.foreign_keys
+        self.assertEqual(fk.columns, ( "country_id", ))
+        self.assertEqual(fk.relation, "catalog_test_country")
+        self.assertEqual(fk.other_columns, ( "code", ))
+
+        self.assertEqual(catalog.table("catalog_test.catalog_test_country")\
+                                                             .primary_key,
+                         ( "code", ))
+        self.assertEqual(catalog.table("no_such_table"), None)
+
+    def test_dbclasses(self):
+        catalog = self.ds.load_catalog(schemas=self.schemas)
+        classes = catalog.dbclasses()
+
+        city = classes["catalog_test_city"]
+        self.assert_(isinstance(city.__dict__["id"], serial))
+        self.assert_(isinstance(city.__dict__["country"], many2one))
+        self.assertEqual(catalog.validate(city), [])
+        
+        namespace = {}
+        exec catalog.source() in namespace
+        self.assertEqual(catalog.validate(namespace["catalog_test_city"]),
+                         [])
+
+    def test_validate(self):
+        catalog = self.ds.load_catalog(schemas=self.schemas)
+        
+        self.assertEqual(catalog.validate(country), [])
+
+        problems = catalog.validate(broken_city)
+        self.assertEqual(len(problems), 3)
+        self.assert_("attribute name is a integer" in problems[0] or
+                     "attribute name is a integer" in problems[1])
+
+    def test_cache(self):
+        first = self.ds.load_catalog(self.cache_path, self.schemas)
+        self.assert_(os.path.exists(self.cache_path))
+
+        # Unchanged: the cached copy is used.
+        second = self.ds.load_catalog(self.cache_path, self.schemas)
+        self.assertEqual(second.fingerprint, first.fingerprint)
+        self.assert_(second.table("catalog_test_city").column("population")
+                     is None)
+
+        # Changed: the catalog is re-read and the cache file replaced.
+        self.ds.execute("ALTER TABLE catalog_test.catalog_test_city "
+                        "  ADD COLUMN population INTEGER")
+        self.ds.commit()
+        third = self.ds.load_catalog(self.cache_path, self.schemas)
+        self.assertNotEqual(third.fingerprint, first.fingerprint)
+        self.assert_(third.table("catalog_test_city").column("population")
+                     is not None)
+
+        # Without the check, the outdated cache file would have been used.
+        self.ds.execute("ALTER TABLE catalog_test.catalog_test_city "
+                        "  DROP COLUMN population")
+        self.ds.commit()
+        fourth = self.ds.load_catalog(self.cache_path, self.schemas,
+                                      check=False)
+        self.assertEqual(fourth.fingerprint, third.fingerprint)
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+
+    if os.environ.has_key("ORMTEST_PGSQL_CONN"):
+        suite.addTest(unittest.makeSuite(catalog_test))
+
+    unittest.TextTestRunner(verbosity=2).run(suite)
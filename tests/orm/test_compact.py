@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test dbclasses with __compact__ = True: they must behave like regular
+ones, but keep their values in the slot-backed value store. This runs
+on the sqlite adapter, so no database server is needed.
+"""
+
+import unittest
+
+from t4.orm.dbobject import dbobject
+from t4.orm.datatypes import integer, Unicode
+from t4.orm.relationships import many2one
+from t4.orm.adapters.sqlite.datasource import datasource
+
+class country(dbobject):
+    __compact__ = True
+    
+    id = integer()
+    name = Unicode()
+
+class city(dbobject):
+    __compact__ = True
+    
+    id = integer()
+    name = Unicode()
+    country_id = integer()
+    country = many2one(country, column="country_id")
+
+class capital(city):
+    __relation__ = "city"
+
+class compact_test(unittest.TestCase):
+
+    def setUp(self):
+        self.ds = datasource()
+
+        conn = self.ds._conn
+        conn.execute("CREATE TABLE country (id INTEGER PRIMARY KEY, "
+                     "                      name TEXT)")
+        conn.execute("CREATE TABLE city (id INTEGER PRIMARY KEY, "
+                     "   name TEXT, country_id INTEGER)")
+        conn.execute("INSERT INTO country VALUES (1, 'Germany')")
+        conn.execute("INSERT INTO city VALUES (1, 'Berlin', 1)")
+
+    def tearDown(self):
+        self.ds.close()
+
+    def test_slots(self):
+        self.assert_(city.__compact__)
+        self.assert_(capital.__compact__)
+        self.assert_("_values" in city.__slots__)
+        # Only the slots the base classes don't have.
+        self.assertEqual(capital.__slots__, ())
+
+    def test_values(self):
+        c = country(id=2, name=u"France")
+        self.assertEqual(c.id, 2)
+        self.assertEqual(c.name, u"France")
+
+        c.name = u"République française"
+        self.assertEqual(c.name, u"République française")
+
+        # Unset attributes behave as they do for regular dbclasses.
+        self.assertRaises(AttributeError, getattr, city(), "name")
+        
+    def test_select(self):
+        berlin = self.ds.select_by_primary_key(city, 1)
+        self.assertEqual(berlin.name, u"Berlin")
+        self.assertEqual(berlin.__primary_key__.value(), 1)
+        self.assertEqual(berlin.country.name, u"Germany")
+        self.assert_(berlin.country is berlin.country)
+        
+        self.assertEqual(self.ds.select_by_primary_key(capital, 1).name,
+                         u"Berlin")
+
+    def test_insert_and_update(self):
+        c = country(id=2, name=u"France")
+        self.ds.insert(c)
+        self.assert_(c.__is_stored__())
+
+        c.name = u"Frankreich"
+        self.ds.flush_updates()
+        self.assertEqual(self.ds.query_one("SELECT name FROM country "
+                                           "WHERE id = 2"),
+                         ( "Frankreich", ))
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(compact_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
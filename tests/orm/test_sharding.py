@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test the sharded_datasource on two sqlite shards: routing by the shard
+key and merging the results of a scatter-gather select().
+"""
+
+import unittest
+
+from t4 import sql
+from t4.orm.dbobject import dbobject
+from t4.orm.datatypes import integer, Unicode
+from t4.orm.sharding import sharded_datasource
+from t4.orm.adapters.sqlite.datasource import datasource
+
+class purchase(dbobject):
+    id = integer()
+    customer_id = integer()
+    product = Unicode()
+    amount = integer()
+
+class sharding_test(unittest.TestCase):
+
+    def setUp(self):
+        self.shards = [ datasource(), datasource(), ]
+        for shard in self.shards:
+            shard._conn.execute("CREATE TABLE purchase ( "
+                                "   id INTEGER PRIMARY KEY, "
+                                "   customer_id INTEGER, "
+                                "   product TEXT, "
+                                "   amount INTEGER )")
+
+        self.ds = sharded_datasource(self.shards)
+        self.ds.shard_key(purchase, "customer_id")
+        
+        self.rows = [ ( 1, 1, u"apple", 3, ),
+                      ( 2, 2, u"pear", 1, ),
+                      ( 3, 3, u"apple", 1, ),
+                      ( 4, 4, u"plum", 2, ),
+                      ( 5, 5, u"pear", 3, ),
+                      ( 6, 6, u"apple", 2, ), ]
+        for id, customer_id, product, amount in self.rows:
+            self.ds.insert(purchase(id=id, customer_id=customer_id,
+                                 product=product, amount=amount))
+
+    def tearDown(self):
+        for shard in self.shards:
+            shard.close()
+
+    def ids(self, *clauses):
+        return [ o.id for o in self.ds.select(purchase, *clauses) ]
+
+    def test_routing(self):
+        for shard, customer_ids in zip(self.shards, ( [2, 4, 6],
+                                                      [1, 3, 5], )):
+            self.assertEqual(sorted([ o.customer_id
+                                      for o in shard.select(purchase) ]),
+                             customer_ids)
+
+        self.assertEqual(self.ds.select(purchase, shard_key=3)[0].product,
+                         u"apple")
+        
+    def test_order_by(self):
+        self.assertEqual(self.ids(sql.orderby("id")), [ 1, 2, 3, 4, 5, 6, ])
+        self.assertEqual(self.ids(sql.orderby("id", dir="DESC")),
+                         [ 6, 5, 4, 3, 2, 1, ])
+        self.assertEqual(self.ids(sql.orderby("id", dir="asc")),
+                         [ 1, 2, 3, 4, 5, 6, ])
+        self.assertEqual(self.ids(sql.orderby("id", dir="desc")),
+                         [ 6, 5, 4, 3, 2, 1, ])
+
+    def test_multi_column_order_by(self):
+        # As in SQL, dir only applies to the last column.
+        self.assertEqual(self.ids(sql.orderby("product", "amount",
+                                              dir="DESC")),
+                         [ 1, 6, 3, 5, 2, 4, ])
+        self.assertEqual(self.ids(sql.orderby("product DESC", "amount")),
+                         [ 4, 2, 5, 3, 6, 1, ])
+        self.assertEqual(self.ids(sql.orderby("amount DESC", "id")),
+                         [ 1, 5, 4, 6, 2, 3, ])
+
+        self.assertRaises(ValueError, self.ids, sql.orderby("no_such"))
+
+    def test_limit_and_offset(self):
+        self.assertEqual(self.ids(sql.orderby("id"), sql.limit(2)),
+                         [ 1, 2, ])
+        self.assertEqual(self.ids(sql.orderby("id"), sql.limit(2),
+                                  sql.offset(3L)),
+                         [ 4, 5, ])
+        self.assertEqual(self.ids(sql.orderby("id"), sql.offset(4)),
+                         [ 5, 6, ])
+        self.assertEqual(self.ds.select_one(purchase, sql.orderby("amount"),
+                                            sql.limit(5)).amount, 1)
+    
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(sharding_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
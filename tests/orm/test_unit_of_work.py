@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test the unit of work: the order in which it writes pending changes
+and that it writes each of them only once. This runs on the sqlite
+adapter, so no database server is needed.
+"""
+
+import unittest
+
+from t4 import sql
+from t4.orm.dbobject import dbobject
+from t4.orm.datatypes import integer, Unicode
+from t4.orm.relationships import many2one, one2many
+from t4.orm.exceptions import DuplicateKey
+from t4.orm.adapters.sqlite.datasource import datasource
+
+class country(dbobject):
+    id = integer()
+    name = Unicode()
+
+class city(dbobject):
+    id = integer()
+    name = Unicode()
+    country = many2one(country, column="country_id")
+
+country.cities = one2many(city, child_key="country_id")
+
+class recording_cursor:
+    """
+    Keep a list of the SQL commands sent to the backend in the
+    datasource's commands attribute.
+    """
+    def __init__(self, ds, cursor):
+        self._ds = ds
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, command, params=None):
+        if isinstance(command, sql.statement):
+            runner = sql.sql(self._ds)
+            command = runner(command)
+            params = runner.params
+
+        self._ds.commands.append(command)
+        self._cursor.execute(command, params)
+
+class recording_datasource(datasource):
+    def __init__(self):
+        datasource.__init__(self)
+        self.commands = []
+
+    def cursor(self):
+        return recording_cursor(self, datasource.cursor(self))
+
+    def statements(self, verb):
+        return [ command for command in self.commands
+                 if command.lstrip().upper().startswith(verb) ]
+
+class queueing_cursor(recording_cursor):
+    """
+    Queue the commands until the datasource's sync_pipeline() is
+    called, like the pgsql adapter's pipeline does.
+    """
+    def execute(self, command, params=None):
+        if isinstance(command, sql.statement):
+            runner = sql.sql(self._ds)
+            command = runner(command)
+            params = runner.params
+
+        self._ds.queue.append( (command, params,) )
+
+class queueing_datasource(recording_datasource):
+    def __init__(self):
+        recording_datasource.__init__(self)
+        self.queue = []
+
+    def __modify_cursor__(self):
+        return queueing_cursor(self, None)
+
+    def sync_pipeline(self):
+        queue, self.queue = self.queue, []
+        cursor = recording_datasource.cursor(self)
+        for command, params in queue:
+            cursor.execute(command, params)
+
+    def cursor(self):
+        self.sync_pipeline()
+        return recording_datasource.cursor(self)
+
+class unit_of_work_test(unittest.TestCase):
+    datasource_class = recording_datasource
+    
+    def setUp(self):
+        self.ds = self.datasource_class()
+        self.ds.autoflush = False
+
+        conn = self.ds._conn
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("CREATE TABLE country (id INTEGER PRIMARY KEY, "
+                     "                      name TEXT)")
+        conn.execute("CREATE TABLE city (id INTEGER PRIMARY KEY, "
+                     "   name TEXT, "
+                     "   country_id INTEGER REFERENCES country(id))")
+
+    def tearDown(self):
+        self.ds.close()
+
+    def test_new_deleted_new(self):
+        c = country(id=1, name=u"Germany")
+        self.ds.register_new(c)
+        self.ds.register_deleted(c)
+        self.ds.register_new(c)
+        self.ds.register_new(c)
+        self.ds.flush_updates()
+
+        self.assertEqual(len(self.ds.statements("INSERT")), 1)
+        self.assert_(c.__is_stored__())
+        self.assertEqual(self.ds.select_by_primary_key(country, 1).name,
+                         u"Germany")
+
+    def test_new_deleted(self):
+        c = country(id=1, name=u"Germany")
+        self.ds.register_new(c)
+        self.ds.register_deleted(c)
+        self.ds.flush_updates()
+
+        self.assertEqual(self.ds.commands, [])
+        self.assert_(not c.__is_stored__())
+
+    def test_failure(self):
+        self.ds.register_new(country(id=1, name=u"Germany"))
+        self.ds.register_new(city(id=1, name=u"Berlin"))
+        self.ds.flush_updates()
+        
+        berlin = self.ds.select_by_primary_key(city, 1)
+        berlin.name = u"Berlin (Spree)"
+        fr = country(id=2, name=u"France")
+        de = country(id=1, name=u"Germany")
+        self.ds.register_new(fr)
+        self.ds.register_new(de)
+
+        # The INSERT is sent after the unit of work is done with the
+        # UPDATE and fails.
+        self.assertRaises(DuplicateKey, self.ds.flush_updates)
+
+        # Neither has been written and they must not look like it.
+        self.assert_(not fr.__is_stored__())
+        self.assert_(not de.__is_stored__())
+        self.assert_(len(berlin.__changed_columns__) > 0)
+        self.assertEqual(self.ds.select_by_primary_key(city, 1).name,
+                         u"Berlin")
+
+    def test_batching(self):
+        for i in range(5):
+            self.ds.register_new(country(id=i, name=u"country %i" % i))
+        self.ds.flush_updates()
+
+        self.assertEqual(len(self.ds.statements("INSERT")), 1)
+        self.assertEqual(len(list(self.ds.select(country))), 5)
+
+        for c in self.ds.select(country, sql.where("id < 3")):
+            self.ds.register_deleted(c)
+        self.ds.flush_updates()
+
+        self.assertEqual(len(self.ds.statements("DELETE")), 1)
+        self.assertEqual(len(list(self.ds.select(country))), 2)
+
+    def test_dependency_order(self):
+        # Register the children before their parent: the parent must be
+        # INSERTed first and DELETEd last, or the foreign key is violated.
+        cities = []
+        for i in range(3):
+            ci = city(id=i, name=u"city %i" % i)
+            ci.__dict__[" country_id"] = 1
+            self.ds.register_new(ci)
+            cities.append(ci)
+        de = country(id=1, name=u"Germany")
+        self.ds.register_new(de)
+        self.ds.flush_updates()
+
+        inserts = self.ds.statements("INSERT")
+        self.assertEqual(len(inserts), 2)
+        self.assert_("country" in inserts[0])
+        self.assert_("city" in inserts[1])
+
+        self.ds.commands = []
+        self.ds.register_deleted(de)
+        for ci in cities:
+            self.ds.register_deleted(ci)
+        self.ds.flush_updates()
+
+        deletes = self.ds.statements("DELETE")
+        self.assertEqual(len(deletes), 2)
+        self.assert_("city" in deletes[0])
+        self.assert_("country" in deletes[1])
+        self.assertEqual(len(list(self.ds.select(city))), 0)
+
+class queued_unit_of_work_test(unit_of_work_test):
+    datasource_class = queueing_datasource
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(unit_of_work_test))
+    suite.addTest(unittest.makeSuite(queued_unit_of_work_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
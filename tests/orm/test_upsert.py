@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test datasource_base.upsert() and upsert_many() on the sqlite adapter,
+with and without RETURNING.
+"""
+
+import unittest
+
+from t4.orm.dbobject import dbobject
+from t4.orm.datatypes import integer, Unicode
+from t4.orm.adapters.sqlite.datasource import datasource
+
+class item(dbobject):
+    id = integer()
+    code = Unicode()
+    name = Unicode()
+    stamp = Unicode(has_default=True)
+
+class reversing_cursor:
+    """
+    Return the rows of a query in reverse order, as a backend may for
+    the RETURNING clause of a multi-row INSERT.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchall(self):
+        ret = list(self._cursor.fetchall())
+        ret.reverse()
+        return ret
+
+class reversing_datasource(datasource):
+    def cursor(self):
+        return reversing_cursor(datasource.cursor(self))
+
+class no_returning_datasource(datasource):
+    supports_returning = False
+
+class upsert_test(unittest.TestCase):
+    datasource_class = datasource
+    
+    def setUp(self):
+        self.ds = self.datasource_class()
+        self.ds._conn.execute("CREATE TABLE item ( "
+                              "   id INTEGER PRIMARY KEY, "
+                              "   code TEXT UNIQUE, "
+                              "   name TEXT, "
+                              "   stamp TEXT DEFAULT 'default')")
+        self.ds._conn.execute("INSERT INTO item VALUES (2, 'b', 'old', "
+                              "                         'existing')")
+
+    def tearDown(self):
+        self.ds.close()
+
+    def rows(self):
+        return [ tuple(row) for row in self.ds._conn.execute(
+            "SELECT id, code, name, stamp FROM item ORDER BY id") ]
+
+    def test_upsert(self):
+        a = item(id=2, code=u"b", name=u"new")
+        self.ds.upsert(a)
+
+        self.assert_(a.__is_stored__())
+        self.assertEqual(a.stamp, u"existing")
+        self.assertEqual(self.rows(), [ ( 2, "b", "new", "existing", ), ])
+
+    def test_upsert_many(self):
+        items = [ item(id=i, code=u"code %i" % i, name=u"name %i" % i)
+                  for i in (1, 2, 3, 4,) ]
+        self.ds.upsert_many(items, update_attributes=("name",))
+
+        # Each dbobj must get the values of its own row.
+        self.assertEqual([ i.stamp for i in items ],
+                         [ u"default", u"existing", u"default", u"default", ])
+        self.assertEqual(self.rows(),
+                         [ ( 1, "code 1", "name 1", "default", ),
+                           ( 2, "b", "name 2", "existing", ),
+                           ( 3, "code 3", "name 3", "default", ),
+                           ( 4, "code 4", "name 4", "default", ), ])
+
+    def test_conflict_attributes(self):
+        b = item(id=99, code=u"b", name=u"by code")
+        c = item(id=98, code=u"c", name=u"new")
+        self.ds.upsert_many([ b, c, ], conflict_attributes=("code",),
+                            update_attributes=("name",))
+
+        # The primary key is the one of the existing row.
+        self.assertEqual(b.id, 2)
+        self.assertEqual(b.stamp, u"existing")
+        self.assertEqual(c.id, 98)
+        self.assertEqual(c.stamp, u"default")
+
+class reversed_upsert_test(upsert_test):
+    datasource_class = reversing_datasource
+
+class no_returning_upsert_test(upsert_test):
+    datasource_class = no_returning_datasource
+    
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(upsert_test))
+    suite.addTest(unittest.makeSuite(reversed_upsert_test))
+    suite.addTest(unittest.makeSuite(no_returning_upsert_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test the compiled validator chains and dbobject.__validate_batch__().
+"""
+
+import unittest
+
+from t4.orm.dbobject import dbobject
+from t4.orm.datatypes import integer, Unicode
+from t4.validators import *
+
+class counting_validator(validator):
+    cacheable = True
+
+    def __init__(self):
+        self.calls = 0
+        
+    def check(self, dbobj, dbproperty, value):
+        self.calls += 1
+
+class person(dbobject):
+    __primary_key__ = None
+    
+    name = Unicode(validators=(not_null_validator(), length_validator(10),))
+    age = integer(validators=(range_validator(0, 150),))
+
+class chain_test(unittest.TestCase):
+
+    def test_cache(self):
+        counter = counting_validator()
+        check = compile_validators([ counter, not_null_validator(), ])
+
+        for a in range(3):
+            check(None, None, 1)
+        self.assertEqual(counter.calls, 1)
+
+        # 1 == 1.0, but it is a different value to a validator.
+        check(None, None, 1.0)
+        self.assertEqual(counter.calls, 2)
+
+        self.assertRaises(NotNullError, check, None, None, None)
+        self.assertRaises(NotNullError, check, None, None, None)
+        self.assertEqual(counter.calls, 4)
+
+    def test_unhashable(self):
+        counter = counting_validator()
+        check = compile_validators([ counter, ])
+
+        for a in range(3):
+            check(None, None, [ 1, 2, ])
+            check(None, None, ( 1, [ 2, ], ))
+        self.assertEqual(counter.calls, 6)
+
+class validate_batch_test(unittest.TestCase):
+
+    def test_validate_batch(self):
+        rows = [ { "name": u"Alice", "age": 31, },
+                 { "name": None, "age": 200, },
+                 { "name": u"Bob", "age": [ 42, ], },
+                 { "name": u"Carol", "age": "xlii", },
+                 { "name": u"Alice", "age": 31, }, ]
+        dbobjs, errors = person.__validate_batch__(rows)
+
+        self.assertEqual([ p.name for p in dbobjs ], [ u"Alice", u"Alice", ])
+        self.assertEqual([ index for index, e in errors ], [ 1, 1, 2, 3, ])
+        self.assert_(isinstance(errors[2][1], TypeError))
+        self.assert_(isinstance(errors[3][1], ValueError))
+    
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(chain_test))
+    suite.addTest(unittest.makeSuite(validate_batch_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
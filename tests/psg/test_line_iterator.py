@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Unit test for the line_iterator class: its lines, tell() and
+skip_to() must agree with a plain split of the data, whether it is
+read from a StringIO, a memory mapped file or a subfile of one.
+"""
+
+import os, re, tempfile, random, unittest
+from cStringIO import StringIO
+
+from t4.psg.util.misc import line_iterator
+from t4.psg.util.subfile import filesystem_subfile
+
+def split_lines(data):
+    """
+    Return a list of ( line, end, ) pairs, end being the offset right
+    after the line.
+    """
+    ret = []
+    start = 0
+    for match in re.finditer(r"\r\n|\r|\n", data):
+        ret.append( ( data[start:match.end()], match.end(), ) )
+        start = match.end()
+    if start < len(data):
+        ret.append( ( data[start:], len(data), ) )
+    return ret
+
+def sample_data():
+    rnd = random.Random(4711)
+    lines = []
+    for i in range(2000):
+        word = rnd.choice([ "%%Page: ", "%%EndPage", "%%Trailer", "stroke",
+                            "%% comment", "", "0 0 moveto",
+                            "gsave stroke %%Page: ", ])
+        eol = rnd.choice([ "\n", "\r\n", "\r", ])
+        lines.append("%s%i%s" % ( word, i, eol, ))
+    return "".join(lines) + "%%EOF"
+
+class line_iterator_test(unittest.TestCase):
+
+    def setUp(self):
+        self.data = sample_data()
+        self.lines = split_lines(self.data)
+
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, "garbage\n" + self.data + "\ngarbage")
+        os.close(fd)
+        self.files = []
+        
+    def tearDown(self):
+        for fp in self.files: fp.close()
+        os.unlink(self.path)
+
+    def iterators(self):
+        """
+        Yield line_iterators over self.data from a StringIO, a file
+        and a subfile, with the default index block size and one
+        that splits \r\n pairs.
+        """
+        for block_size in ( line_iterator.index_block_size, 7, ):
+            fp = open(self.path, "rb")
+            self.files.append(fp)
+            fp.seek(8)
+            
+            for source in ( StringIO(self.data),
+                            filesystem_subfile(fp, 8, len(self.data)), ):
+                ret = line_iterator(source)
+                ret.index_block_size = block_size
+                yield ret
+
+    def test_lines(self):
+        for lines in self.iterators():
+            for line, end in self.lines:
+                self.assertEqual(lines.next(), line)
+                self.assertEqual(lines.tell(), end)
+            self.assertRaises(StopIteration, lines.next)
+            self.assertEqual(lines.line_number, len(self.lines))
+
+    def test_rewind(self):
+        for lines in self.iterators():
+            for a in range(10): lines.next()
+            lines.rewind()
+            lines.rewind()
+            self.assertEqual(lines.tell(), self.lines[7][1])
+            self.assertEqual(lines.next(), self.lines[8][0])
+
+    def test_skip_to(self):
+        for prefix in ( "%%Page:", "%%EndPage", "%%EOF", "stroke", ):
+            expected = [ ( line, end, )
+                         for line, end in self.lines
+                         if line.startswith(prefix) ]
+
+            for lines in self.iterators():
+                found = []
+                while True:
+                    try:
+                        line = lines.skip_to(prefix)
+                    except StopIteration:
+                        break
+                    found.append( ( line, lines.tell(), ) )
+                self.assertEqual(found, expected)
+
+    def test_skip_to_indexed(self):
+        # Skipping over lines that have been indexed already, and
+        # reading on line by line after skip_to().
+        for lines in self.iterators():
+            for a in range(500): lines.next()
+            for a in range(500): lines.rewind()
+
+            line = lines.skip_to("%%Trailer")
+            index = [ l for l, e in self.lines ].index(line)
+            self.assertEqual(lines.tell(), self.lines[index][1])
+
+            for line, end in self.lines[index+1:index+50]:
+                self.assertEqual(lines.next(), line)
+                self.assertEqual(lines.tell(), end)
+
+    def test_skip_to_missing(self):
+        for lines in self.iterators():
+            self.assertRaises(StopIteration, lines.skip_to, "%%Nothing")
+            
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(line_iterator_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
+
+
+# Local variables:
+# mode: python
+# ispell-local-dictionary: "english"
+# End:
@@ -0,0 +1,141 @@
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Unit test for text measurement in the metrics class: stringwidth()
+and stringwidths() must agree with a plain sum of glyph widths and
+kerning values, and the width array must follow glyphs added later.
+"""
+
+import os, random, unittest
+from cStringIO import StringIO
+
+import t4.psg
+from t4.psg.fonts.metrics import glyph_metric
+from t4.psg.fonts.afm_metrics import afm_metrics
+
+def vera():
+    return afm_metrics(StringIO(open(os.path.join(
+        os.path.dirname(t4.psg.__file__), "fonts", "bitstream_vera",
+        "BitstreamVeraSans-Roman.afm")).read()))
+
+def reference_width(metrics, s, font_size, kerning, char_spacing=0.0):
+    """
+    Sum up the widths of the characters in s and, if kerning is set,
+    the kerning values of all pairs one by one.
+    """
+    width = 0.0
+    for char in s:
+        width += metrics.get(ord(char), metrics[32]).width
+
+    if kerning:
+        for a, b in zip(s, s[1:]):
+            width += metrics.kerning_pairs.get( ( ord(a), ord(b), ), 0.0 )
+
+    width *= font_size
+    if len(s) > 1:
+        width += (len(s) - 1) * char_spacing * 1000.0
+        
+    return width / 1000.0
+
+class metrics_test(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = vera()
+
+        # Random words of characters from the font and some it doesn't
+        # have, below and above the highest code in the font.
+        chars = map(unichr, self.metrics.keys()) + [ u"\x01", u"\u4e00", ]
+        rnd = random.Random(4711)
+        self.words = [ u"".join([ rnd.choice(chars)
+                                  for a in range(rnd.randint(1, 12)) ])
+                       for b in range(2000) ]
+        self.words += [ u"AVAWATAY", u"To", u"x", u"", ]
+
+    def assertWidths(self, kerning, measured_kerning):
+        for word in self.words:
+            expected = reference_width(self.metrics, word, 11,
+                                       measured_kerning, 0.5)
+            self.assertAlmostEqual(
+                self.metrics.stringwidth(word, 11, kerning, 0.5), expected)
+            self.assertAlmostEqual(
+                self.metrics.stringwidth(list(word), 11, kerning, 0.5),
+                expected)
+            
+        self.assertEqual(self.metrics.stringwidths(self.words, 11, kerning,
+                                                   0.5),
+                         [ self.metrics.stringwidth(word, 11, kerning, 0.5)
+                           for word in self.words ])
+        
+    def test_kerning_is_opt_in(self):
+        self.assertEqual(self.metrics.measure_kerning, False)
+        self.assertWidths(True, False)
+        self.assertWidths(False, False)
+
+    def test_kerning(self):
+        self.assertNotEqual(reference_width(self.metrics, u"AVAWATAY",
+                                            10, True),
+                            reference_width(self.metrics, u"AVAWATAY",
+                                            10, False))
+        self.metrics.measure_kerning = True
+        self.assertWidths(True, True)
+        self.assertWidths(False, False)
+
+    def test_charwidth(self):
+        for code in ( 65, 1, 0x4e00, ):
+            self.assertEqual(self.metrics.charwidth(code, 10),
+                             reference_width(self.metrics, unichr(code),
+                                             10, False))
+            
+    def test_glyphs_added(self):
+        before = self.metrics.stringwidth(u"A\u4e00", 10)
+        
+        self.metrics[0x4e00] = glyph_metric(0, 1000.0, "uni4E00", None)
+        self.assertAlmostEqual(self.metrics.stringwidth(u"A\u4e00", 10),
+                               reference_width(self.metrics, u"A\u4e00",
+                                               10, False))
+        self.assertNotAlmostEqual(self.metrics.stringwidth(u"A\u4e00", 10),
+                                  before)
+
+        self.metrics.update({ 65: glyph_metric(0, 10.0, "A", None), })
+        self.assertAlmostEqual(self.metrics.stringwidth(u"A", 10), 0.1)
+
+        # The width of a missing character is that of the space.
+        del self.metrics[65]
+        self.assertEqual(self.metrics.stringwidth(u"A", 10),
+                         self.metrics.stringwidth(u" ", 10))
+
+        self.metrics[32] = glyph_metric(32, 100.0, "space", None)
+        self.assertAlmostEqual(self.metrics.stringwidth(u"A", 10), 1.0)
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(metrics_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
+
+
+# Local variables:
+# mode: python
+# ispell-local-dictionary: "english"
+# End:
@@ -0,0 +1,184 @@
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Unit test for the metrics_cache module: afm_metrics objects restored
+from a cache file must equal those parsed from the AFM file, and the
+cache must be ignored once the AFM file changes.
+"""
+
+import os, glob, shutil, tempfile, unittest
+from cStringIO import StringIO
+
+import t4.psg
+from t4.psg.fonts import metrics_cache
+from t4.psg.fonts.afm_metrics import afm_metrics
+
+def afm_paths():
+    psg = os.path.dirname(t4.psg.__file__)
+    return ( glob.glob(os.path.join(psg, "..", "..", "examples", "psg",
+                                    "*.afm")) +
+             glob.glob(os.path.join(psg, "fonts", "bitstream_vera",
+                                    "*.afm")) +
+             [ os.path.join(psg, "fonts", "computer_modern", "cmunrm.afm"), ] )
+
+def state(metrics):
+    """
+    Return everything an afm_metrics object knows as a comparable
+    tuple.
+    """
+    glyphs = {}
+    for code, glyph in metrics.items():
+        glyphs[code] = ( glyph.font_character_code, glyph.width,
+                         glyph.ps_name, glyph.bounding_box.as_tuple(), )
+
+    return ( glyphs, metrics.kerning_pairs,
+             metrics.ps_name, metrics.full_name, metrics.family_name,
+             metrics.weight, metrics.encoding_scheme, metrics.ascender,
+             metrics.descender, metrics.italic, metrics.fixed_width,
+             sorted(metrics.character_codes()),
+             metrics.font_bounding_box().as_tuple(), )
+
+class metrics_cache_test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old_cache_dir = metrics_cache.cache_dir
+        self.old_next_to_afm = metrics_cache.next_to_afm
+        metrics_cache.next_to_afm = False
+
+        # Work on copies, so no cache files are written next to the
+        # originals.
+        self.paths = []
+        for path in afm_paths():
+            copy = os.path.join(self.tmp, "%i-%s" % (
+                len(self.paths), os.path.basename(path), ))
+            shutil.copy(path, copy)
+            self.paths.append(copy)
+            
+    def tearDown(self):
+        metrics_cache.cache_dir = self.old_cache_dir
+        metrics_cache.next_to_afm = self.old_next_to_afm
+        shutil.rmtree(self.tmp)
+
+    def check_round_trip(self):
+        self.assertNotEqual(self.paths, [])
+        
+        for path in self.paths:
+            # afm_metrics can't cache fonts read from a StringIO.
+            parsed = afm_metrics(StringIO(open(path).read()))
+            
+            self.assertEqual(metrics_cache.load(open(path)), None)
+            stored = afm_metrics(open(path))
+            self.assert_(os.path.exists(metrics_cache.cache_file_name(
+                os.path.abspath(path))))
+            
+            self.assertNotEqual(metrics_cache.load(open(path)), None)
+            restored = afm_metrics(open(path))
+            
+            self.assertEqual(state(stored), state(parsed))
+            self.assertEqual(state(restored), state(parsed))
+
+    def test_next_to_afm(self):
+        metrics_cache.next_to_afm = True
+        self.check_round_trip()
+        for path in self.paths:
+            self.assert_(os.path.exists(path + "c"))
+            
+    def test_cache_dir(self):
+        # The cache directory is created on demand.
+        metrics_cache.cache_dir = os.path.join(self.tmp, "cache", "t4-psg")
+        self.check_round_trip()
+        self.assertEqual(len(os.listdir(metrics_cache.cache_dir)),
+                         len(self.paths))
+        for path in self.paths:
+            self.failIf(os.path.exists(path + "c"))
+
+    def test_no_cache_dir(self):
+        metrics_cache.cache_dir = None
+        path = self.paths[0]
+        parsed = afm_metrics(StringIO(open(path).read()))
+        self.assertEqual(state(afm_metrics(open(path))), state(parsed))
+        self.assertEqual(metrics_cache.load(open(path)), None)
+        self.assertEqual(len(os.listdir(self.tmp)), len(self.paths))
+        
+    def test_default_cache_dir(self):
+        environ = os.environ.copy()
+        try:
+            os.environ["T4_PSG_METRICS_CACHE"] = "/some/where"
+            self.assertEqual(metrics_cache._default_cache_dir(),
+                             "/some/where")
+            del os.environ["T4_PSG_METRICS_CACHE"]
+            
+            os.environ["XDG_CACHE_HOME"] = "/xdg"
+            self.assertEqual(metrics_cache._default_cache_dir(),
+                             "/xdg/t4-psg")
+            del os.environ["XDG_CACHE_HOME"]
+
+            os.environ["HOME"] = "/home/someone"
+            self.assertEqual(metrics_cache._default_cache_dir(),
+                             "/home/someone/.cache/t4-psg")
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def test_invalidation(self):
+        metrics_cache.next_to_afm = True
+        path = self.paths[0]
+        afm_metrics(open(path))
+        self.assertNotEqual(metrics_cache.load(open(path)), None)
+
+        # A changed modification time invalidates the cache.
+        mtime = os.stat(path).st_mtime
+        os.utime(path, ( mtime + 10, mtime + 10, ))
+        self.assertEqual(metrics_cache.load(open(path)), None)
+
+        # So does a different format version.
+        afm_metrics(open(path))
+        metrics_cache.format_version += 1
+        try:
+            self.assertEqual(metrics_cache.load(open(path)), None)
+        finally:
+            metrics_cache.format_version -= 1
+        
+    def test_corrupt(self):
+        metrics_cache.next_to_afm = True
+        path = self.paths[0]
+        parsed = afm_metrics(StringIO(open(path).read()))
+        
+        for garbage in ( "", "garbage", ):
+            open(path + "c", "wb").write(garbage)
+            self.assertEqual(metrics_cache.load(open(path)), None)
+            self.assertEqual(state(afm_metrics(open(path))), state(parsed))
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(metrics_cache_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
+
+
+# Local variables:
+# mode: python
+# ispell-local-dictionary: "english"
+# End:
@@ -0,0 +1,167 @@
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Unit test for pfb2pfa(): its output must be byte for byte the same as
+that of the original implementation, which converted the pfb file one
+byte at a time, and cached_pfa() must return it from its caches.
+"""
+
+import os, glob, random, struct, shutil, tempfile, unittest
+from cStringIO import StringIO
+
+import t4.psg
+from t4.psg.util import misc
+from t4.psg.util.misc import pfb2pfa, PFBError, cached_pfa
+
+def reference_pfb2pfa(pfb, pfa):
+    """
+    The original byte by byte implementation of pfb2pfa().
+    """
+    while True:
+        r = pfb.read(1)
+        if ord(r) != 128:
+            raise PFBError("Not a pfb file! (%s)" % repr(r + pfb.read(50)))
+
+        t = ord(pfb.read(1))
+
+        if t == 1 or t == 2:
+            l1 = ord(pfb.read(1))
+            l2 = ord(pfb.read(1))
+            l3 = ord(pfb.read(1))
+            l4 = ord(pfb.read(1))
+
+            l = l1 | l2 << 8 | l3 << 16 | l4 << 24
+            
+        if t == 1:
+            for i in range(l):
+                c = pfb.read(1)
+                if c == "\r":
+                    pfa.write("\n")
+                else:
+                    pfa.write(c)
+                    
+        elif t == 2:
+            for i in range(l):
+                c = pfb.read(1)
+                pfa.write("%02x" % ord(c))
+                if (i + 1) % 30 == 0:
+                    pfa.write("\n")
+
+            pfa.write("\n")
+        elif t == 3:
+            break
+        else:
+            raise PFBError("Error in PFB file: unknown field type %i!" % t)
+
+def segment(t, data):
+    return "\x80" + chr(t) + struct.pack("<I", len(data)) + data
+
+def convert(function, pfb):
+    pfa = StringIO()
+    function(StringIO(pfb), pfa)
+    return pfa.getvalue()
+
+def example_fonts():
+    examples = os.path.join(os.path.dirname(t4.psg.__file__),
+                            "..", "..", "examples", "psg")
+    return glob.glob(os.path.join(examples, "*.pfb"))
+
+class pfb2pfa_test(unittest.TestCase):
+
+    def assertSameAsReference(self, pfb):
+        self.assertEqual(convert(pfb2pfa, pfb),
+                         convert(reference_pfb2pfa, pfb))
+        
+    def test_example_fonts(self):
+        self.assertNotEqual(example_fonts(), [])
+        for path in example_fonts():
+            self.assertSameAsReference(open(path, "rb").read())
+
+    def test_segment_lengths(self):
+        # Binary segments that are empty, shorter than a line, exactly
+        # one or more lines long or end in a partial line.
+        rnd = random.Random(4711)
+        for length in ( 0, 1, 29, 30, 31, 59, 60, 61, 1000, ):
+            binary = "".join([ chr(rnd.randrange(256))
+                               for a in range(length) ])
+            pfb = ( segment(1, "%!PS-AdobeFont-1.0\r/FontName\r\n") +
+                    segment(2, binary) +
+                    segment(1, "\rcleartomark\r") +
+                    "\x80\x03" )
+            self.assertSameAsReference(pfb)
+
+    def test_errors(self):
+        for pfb in ( "", "%!PS-AdobeFont-1.0",
+                     "\x80\x01\x10\x00\x00\x00abc",
+                     "\x80\x02\x10",
+                     "\x80\x07", ):
+            self.assertRaises(PFBError, convert, pfb2pfa, pfb)
+
+class cached_pfa_test(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = misc.pfa_cache_dir
+        misc.pfa_cache_dir = self.cache_dir
+        misc.pfa_cache.clear()
+
+    def tearDown(self):
+        misc.pfa_cache_dir = self.old_cache_dir
+        misc.pfa_cache.clear()
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache(self):
+        for path in example_fonts():
+            expected = convert(reference_pfb2pfa, open(path, "rb").read())
+            
+            self.assertEqual(cached_pfa(open(path, "rb")), expected)
+            self.assertEqual(cached_pfa(open(path, "rb")), expected)
+
+            # A fresh process finds the result on disk.
+            misc.pfa_cache.clear()
+            self.assertEqual(cached_pfa(open(path, "rb")), expected)
+            
+        self.assertEqual(len(os.listdir(self.cache_dir)),
+                         len(example_fonts()))
+
+    def test_unnamed(self):
+        for path in example_fonts():
+            pfb = open(path, "rb").read()
+            self.assertEqual(cached_pfa(StringIO(pfb)),
+                             convert(reference_pfb2pfa, pfb))
+        self.assertEqual(misc.pfa_cache, {})
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(pfb2pfa_test))
+    suite.addTest(unittest.makeSuite(cached_pfa_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
+
+
+# Local variables:
+# mode: python
+# ispell-local-dictionary: "english"
+# End:
@@ -0,0 +1,107 @@
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Unit test for filesystem_subfile: a subfile keeps its own seek
+indicator and remains readable after the 'parent' file has been
+closed, unless it was created lazily.
+"""
+
+import os, tempfile, unittest
+from cStringIO import StringIO
+
+from t4.psg.util.subfile import subfile, filesystem_subfile
+
+class filesystem_subfile_test(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, "hello world")
+        os.close(fd)
+        self.fp = open(self.path, "rb")
+
+    def tearDown(self):
+        self.fp.close()
+        os.unlink(self.path)
+
+    def test_read(self):
+        for lazy in ( False, True, ):
+            sf = subfile(self.fp, 6, 5, lazy)
+            self.assert_(isinstance(sf, filesystem_subfile))
+            self.assertEqual(sf.read(), "world")
+            sf.seek(1)
+            self.assertEqual(sf.tell(), 1)
+            self.assertEqual(sf.read(2), "or")
+            self.assertEqual(sf.tell(), 3)
+
+    def test_own_seek_indicator(self):
+        for lazy in ( False, True, ):
+            self.fp.seek(0)
+            sf = filesystem_subfile(self.fp, 6, 5, lazy)
+            self.assertEqual(sf.read(3), "wor")
+            self.assertEqual(self.fp.tell(), 0)
+
+    def test_interleaved(self):
+        # The duplicated descriptors share their seek pointer with
+        # self.fp and with each other.
+        for lazy in ( False, True, ):
+            hello = filesystem_subfile(self.fp, 0, 5, lazy)
+            world = filesystem_subfile(self.fp, 6, 5, lazy)
+            self.assertEqual(world.read(2), "wo")
+            self.assertEqual(hello.read(2), "he")
+            self.fp.seek(0)
+            self.assertEqual(self.fp.read(), "hello world")
+            self.assertEqual(world.readline(), "rld")
+            self.assertEqual(hello.read(), "llo")
+            self.assertEqual(world.tell(), 5)
+
+    def test_read_after_close(self):
+        sf = filesystem_subfile(self.fp, 6, 5)
+        self.fp.close()
+        self.assertEqual(sf.read(), "world")
+
+    def test_nested(self):
+        for lazy in ( False, True, ):
+            outer = filesystem_subfile(self.fp, 2, 8, lazy)
+            inner = filesystem_subfile(outer, 4, 3, lazy)
+            self.assertEqual(inner.offset, 6)
+            self.assertEqual(inner.read(), "wor")
+
+    def test_write_to(self):
+        for lazy in ( False, True, ):
+            sf = filesystem_subfile(self.fp, 6, 5, lazy)
+            out = StringIO()
+            sf.write_to(out)
+            self.assertEqual(out.getvalue(), "world")
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(filesystem_subfile_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
+
+
+# Local variables:
+# mode: python
+# ispell-local-dictionary: "english"
+# End:
@@ -0,0 +1,140 @@
+##  This file is part of psg, PostScript Generator.
+##
+##  Copyright 2006 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Unit test for the type1_subset module: a subset font must split
+again, keep the CharStrings and Subrs its glyphs need byte for byte,
+including the glyphs seac composes accented characters of, and stub
+out the rest.
+"""
+
+import os, glob, unittest
+from cStringIO import StringIO
+
+import t4.psg
+from t4.psg.exceptions import Type1FontError
+from t4.psg.util.misc import cached_pfa
+from t4.psg.fonts.type1_subset import split_font_program, subset, \
+     entries, subrs_re, subr_re, charstrings_re, charstring_re, \
+     charstring_interpreter, standard_encoding, decrypt, charstring_key
+
+def vera_fonts():
+    return glob.glob(os.path.join(os.path.dirname(t4.psg.__file__),
+                                  "fonts", "bitstream_vera", "*.pfb"))
+
+def parse(fp):
+    """
+    Return the clear text, the Subrs and the CharStrings (as dicts of
+    encrypted charstrings) and the trailer of the Type1 font in fp.
+    """
+    cleartext, private, trailer = split_font_program(fp)
+    
+    subrs, end = entries(private, subr_re, subrs_re.search(private).end())
+    charstrings, end = entries(private, charstring_re,
+                               charstrings_re.search(private, end).end())
+    
+    return ( cleartext,
+             dict([ ( int(key), charstring, )
+                    for key, rd, charstring, tail in subrs ]),
+             dict([ ( key, charstring, )
+                    for key, rd, charstring, tail in charstrings ]),
+             trailer, )
+
+def used_subrs(subrs, charstrings):
+    """
+    Return the set of Subrs indices the charstrings call.
+    """
+    interpreter = charstring_interpreter(subrs, 4)
+    for charstring in charstrings:
+        interpreter.run(charstring)
+    assert not interpreter.all_subrs
+    return interpreter.subrs
+
+class type1_subset_test(unittest.TestCase):
+
+    glyphs = [ "A", "ccaron", "no_such_glyph", ]
+    
+    def test_subset(self):
+        fonts = vera_fonts()
+        self.assertNotEqual(fonts, [])
+        
+        for path in fonts:
+            cleartext, subrs, charstrings, trailer = parse(open(path, "rb"))
+            
+            # ccaron is composed of c and caron by seac.
+            interpreter = charstring_interpreter(subrs, 4)
+            interpreter.run(charstrings["ccaron"])
+            self.assertEqual(map(standard_encoding.get, interpreter.seac),
+                             [ "c", "caron", ])
+            
+            result = subset(open(path, "rb"), self.glyphs)
+            sub_cleartext, sub_subrs, sub_charstrings, sub_trailer = \
+                           parse(StringIO(result))
+
+            self.assertEqual(sub_cleartext, cleartext)
+            self.assertEqual(sub_trailer, trailer)
+            
+            expected = [ ".notdef", "A", "c", "caron", "ccaron", ]
+            self.assertEqual(sorted(sub_charstrings.keys()), expected)
+            for name in expected:
+                self.assertEqual(sub_charstrings[name], charstrings[name])
+
+            # The Subrs array keeps its indices. The Subrs the glyphs
+            # call are kept, the others just return.
+            self.assertEqual(sorted(sub_subrs.keys()), sorted(subrs.keys()))
+            
+            needed = used_subrs(subrs, [ charstrings[name]
+                                         for name in expected ])
+            self.assertEqual(used_subrs(sub_subrs, sub_charstrings.values()),
+                             needed)
+            
+            for number, charstring in sub_subrs.items():
+                if number in needed or number < 4:
+                    self.assertEqual(charstring, subrs[number])
+                else:
+                    self.assertEqual(decrypt(charstring, charstring_key)[4:],
+                                     chr(11))
+            
+            self.assert_(len(result) < len(cached_pfa(open(path, "rb"))))
+            
+    def test_pfa(self):
+        for path in vera_fonts():
+            pfa = StringIO(cached_pfa(open(path, "rb")))
+            self.assertEqual(subset(pfa, self.glyphs),
+                             subset(open(path, "rb"), self.glyphs))
+            
+    def test_not_a_font(self):
+        for data in ( "\x80\x01\x10\x00", "%!PS-AdobeFont-1.0\n", ):
+            self.assertRaises(Type1FontError, subset, StringIO(data), [ "A", ])
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(type1_subset_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)
+
+
+# Local variables:
+# mode: python
+# ispell-local-dictionary: "english"
+# End:
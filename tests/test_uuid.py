@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; mode: python; ispell-local-dictionary: "english" -*-
+
+##  This file is part of the t4 Python module collection.
+##
+##  Copyright 2002-2011 by Diedrich Vorberg <diedrich@tux4web.de>
+##
+##  All Rights Reserved
+##
+##  For more Information on orm see the README file.
+##
+##  This program is free software; you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation; either version 2 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with this program; if not, write to the Free Software
+##  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+##
+##  I have added a copy of the GPL in the file gpl.txt.
+
+"""
+Test the bulk UUID generators in t4.uuid.
+"""
+
+import os, unittest
+
+from t4 import uuid
+
+class uuid7_test(unittest.TestCase):
+
+    def test_layout(self):
+        for u in uuid.uuid7_batch(100):
+            self.assertEqual(u.version, 7)
+            self.assertEqual(u.variant, uuid.RFC_4122)
+
+    def test_monotonic_and_unique(self):
+        # Enough of them to overflow the counter within a millisecond.
+        values = uuid.uuid7_batch(10000)
+        for a in range(100):
+            values.extend(uuid.uuid7_batch(50))
+            values.append(uuid.uuid7())
+
+        for a, b in zip(values, values[1:]):
+            self.assert_(a.int < b.int, "%s >= %s" % ( a, b, ))
+        self.assertEqual(len(set(values)), len(values))
+
+    def test_fork(self):
+        if not hasattr(os, "fork"): return
+        
+        # Fill the parent's random pool.
+        parent = uuid.uuid7_batch(10)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                os.write(write_fd, "\n".join(
+                    [ str(u) for u in uuid.uuid7_batch(100) ]))
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        data = ""
+        while True:
+            chunk = os.read(read_fd, 65536)
+            if not chunk: break
+            data += chunk
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        
+        child = set([ uuid.UUID(line) for line in data.split("\n") ])
+        parent.extend(uuid.uuid7_batch(100))
+
+        self.assertEqual(len(child), 100)
+        self.assertEqual(child.intersection(parent), set())
+
+        # Random parts differ, too, not just the counter.
+        tails = set([ u.int & 0xffffffffffffffffL for u in parent ])
+        self.assertEqual(tails.intersection(
+            [ u.int & 0xffffffffffffffffL for u in child ]), set())
+
+class uuid4_batch_test(unittest.TestCase):
+
+    def test_uuid4_batch(self):
+        values = uuid.uuid4_batch(1000)
+        self.assertEqual(len(set(values)), 1000)
+        for u in values:
+            self.assertEqual(u.version, 4)
+            self.assertEqual(u.variant, uuid.RFC_4122)
+
+class node_cache_test(unittest.TestCase):
+
+    def test_opt_in(self):
+        if not os.environ.has_key("T4_UUID_NODE_CACHE"):
+            self.assertEqual(uuid.node_cache_path, None)
+    
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(uuid7_test))
+    suite.addTest(unittest.makeSuite(uuid4_batch_test))
+    suite.addTest(unittest.makeSuite(node_cache_test))
+    unittest.TextTestRunner(verbosity=1).run(suite)